@@ -1,15 +1,23 @@
-from typing import List
+import threading
+from typing import Dict, List, Tuple
 
 from langchain.agents import initialize_agent, load_tools, AgentType, AgentExecutor
 from langchain.callbacks.base import BaseCallbackHandler
 from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
+from langchain.memory.chat_memory import BaseChatMemory
 
+from chat.agents.memory import WindowedChatMemory, get_memory_settings
 from chat.messages.chat_message_repository import ChatMessageRepository
+from chat.metrics import metrics
 from chat.models import MessageSender, Message
 from project import settings
 from langchain_groq import ChatGroq
 
+# The LLM client and tools hold no per-conversation state, so every agent of the process shares them
+_shared_llm = None
+_shared_tools: Dict[Tuple[str, ...], list] = {}
+_shared_lock = threading.Lock()
 
 
 class AgentFactory:
@@ -24,36 +32,58 @@ class AgentFactory:
         streaming=False,
         callback_handlers: List[BaseCallbackHandler] = None,
     ) -> AgentExecutor:
-        # Instantiate the Groq LLM
-        llm = ChatGroq(
-            model="llama-3.3-70b-versatile",
-            temperature=0,
-            max_tokens=None,
-            timeout=None,
-            max_retries=2,
-            callbacks=callback_handlers if callback_handlers else None,
-        )
-
-        # Load the Tools that the Agent will use
-        tools = load_tools(tool_names, llm=llm)
-
         # Load the memory and populate it with any previous messages
-        memory = await self._load_agent_memory(conversation_id)
-
-        # Initialize and return the agent
-        return initialize_agent(
-            tools=tools,
-            llm=llm,
-            agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-            verbose=True,
-            memory=memory,
-            callbacks=callback_handlers if callback_handlers else None,
-        )
-
-    async def _load_agent_memory(
+        memory = await self.load_agent_memory(conversation_id)
+
+        agent = self.build_agent(tool_names)
+        agent.memory = memory
+        if callback_handlers:
+            agent.callbacks = callback_handlers
+        return agent
+
+    def build_agent(self, tool_names: List[str]) -> AgentExecutor:
+        """An executor without memory or callbacks; see AgentPool for reusing them."""
+        with metrics.timer('agents.build'):
+            llm = self._get_llm()
+            return initialize_agent(
+                tools=self._get_tools(tool_names, llm),
+                llm=llm,
+                agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
+                verbose=True,
+            )
+
+    def _get_llm(self) -> ChatGroq:
+        global _shared_llm
+        if _shared_llm is None:
+            with _shared_lock:
+                if _shared_llm is None:
+                    # Instantiate the Groq LLM
+                    _shared_llm = ChatGroq(
+                        model="llama-3.3-70b-versatile",
+                        temperature=0,
+                        max_tokens=None,
+                        timeout=None,
+                        max_retries=2,
+                    )
+        return _shared_llm
+
+    def _get_tools(self, tool_names: List[str], llm) -> list:
+        key = tuple(tool_names)
+        if key not in _shared_tools:
+            with _shared_lock:
+                if key not in _shared_tools:
+                    # Load the Tools that the Agent will use
+                    _shared_tools[key] = load_tools(tool_names, llm=llm)
+        return _shared_tools[key]
+
+    async def load_agent_memory(
         self,
         conversation_id: str = None,
-    ) -> ConversationBufferMemory:
+    ) -> BaseChatMemory:
+        options = get_memory_settings()
+        if options['MODE'] == 'window':
+            return await self._load_windowed_memory(conversation_id, options)
+
         if not conversation_id:
             return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 
@@ -62,7 +92,26 @@ class AgentFactory:
 
         # Load the messages for the conversation_id from the DB
         messages: List[Message] = await self.chat_message_repository.get_chat_messages(conversation_id)
+        self._add_messages(memory, messages)
+        return memory
+
+    async def _load_windowed_memory(self, conversation_id: str, options) -> WindowedChatMemory:
+        memory = WindowedChatMemory(max_messages=options['MAX_MESSAGES'], max_tokens=options['MAX_TOKENS'])
+        if not conversation_id:
+            return memory
 
+        # Only the window is read, so the cost does not grow with the conversation. One
+        # extra message is read to tell whether anything older than the window exists.
+        messages = await self.chat_message_repository.get_recent_messages(conversation_id, options['MAX_MESSAGES'] + 1)
+        has_older = len(messages) > options['MAX_MESSAGES']
+        self._add_messages(memory, messages[-options['MAX_MESSAGES']:])
+        if options['INCLUDE_SUMMARY'] and has_older:
+            # Prefix the summary of the messages before the window
+            memory.summary = await self.chat_message_repository.get_summary(conversation_id)
+        return memory
+
+    @staticmethod
+    def _add_messages(memory: BaseChatMemory, messages: List[Message]):
         # Add the messages to the memory
         for message in messages:
             if message.sender == MessageSender.USER.value:
@@ -71,5 +120,3 @@ class AgentFactory:
             elif message.sender == MessageSender.AI.value:
                 # Add AI message to the memory
                 memory.chat_memory.add_ai_message(message.content)
-
-        return memory
@@ -0,0 +1,93 @@
+"""
+Pool of pre-built agent executors.
+
+Assembling an agent executor is too slow to repeat for every WebSocket connection.
+The pool keeps idle executors per tool set: a connection checks one out, attaches its
+conversation's memory and returns it when it disconnects. Streaming callbacks are
+passed per run, so a pooled executor carries no state from its previous user.
+"""
+import threading
+from typing import Dict, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from langchain.agents import AgentExecutor
+
+from chat.metrics import metrics
+
+from .agent_factory import AgentFactory
+
+# Tools available to the chat agent
+CHAT_TOOL_NAMES = ["llm-math"]
+
+
+def get_pool_settings():
+    options = {
+        'MAX_IDLE': 8,
+        'WARM_UP': 0,
+    }
+    options.update(getattr(settings, 'AGENT_POOL', {}))
+    return options
+
+
+class AgentPool:
+    def __init__(self, tool_names: List[str], max_idle: int, factory: AgentFactory = None):
+        self.tool_names = list(tool_names)
+        self.max_idle = max_idle
+        self.factory = factory or AgentFactory()
+        self._lock = threading.Lock()
+        self._idle: List[AgentExecutor] = []
+
+    def _take_idle(self):
+        with self._lock:
+            agent = self._idle.pop() if self._idle else None
+            metrics.set_gauge('agents.pool_idle', len(self._idle))
+        return agent
+
+    async def acquire(self, conversation_id: str = None) -> AgentExecutor:
+        """An executor for the conversation, reused from the pool when one is idle."""
+        memory = await self.factory.load_agent_memory(conversation_id)
+
+        agent = self._take_idle()
+        if agent is None:
+            metrics.increment('agents.pool_misses')
+            agent = await sync_to_async(self.factory.build_agent, thread_sensitive=False)(self.tool_names)
+        else:
+            metrics.increment('agents.pool_hits')
+        agent.memory = memory
+        return agent
+
+    def release(self, agent: AgentExecutor):
+        """Return an executor to the pool once its connection is closed."""
+        agent.memory = None
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(agent)
+            metrics.set_gauge('agents.pool_idle', len(self._idle))
+
+    def warm_up(self, count: int):
+        """Build executors ahead of the first connections."""
+        for _ in range(count):
+            with self._lock:
+                if len(self._idle) >= min(count, self.max_idle):
+                    return
+            self.release(self.factory.build_agent(self.tool_names))
+
+
+_pools: Dict[Tuple[str, ...], AgentPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_agent_pool(tool_names: List[str]) -> AgentPool:
+    """The process-wide pool of executors using these tools."""
+    key = tuple(tool_names)
+    if key not in _pools:
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = AgentPool(tool_names, get_pool_settings()['MAX_IDLE'])
+    return _pools[key]
+
+
+def warm_up(tool_names: List[str] = CHAT_TOOL_NAMES):
+    with metrics.timer('agents.warm_up'):
+        get_agent_pool(tool_names).warm_up(get_pool_settings()['WARM_UP'])
@@ -1,16 +1,50 @@
+import asyncio
 import json
+import time
 from typing import Optional, Any, Dict, List
 from uuid import UUID
 
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.schema import LLMResult, BaseMessage
 
+from chat.metrics import metrics
+
+
+def get_streaming_settings():
+    options = {
+        'COALESCE': True,
+        'FLUSH_INTERVAL_MS': 50,
+        'MAX_FRAME_CHARS': 512,
+    }
+    options.update(getattr(settings, 'TOKEN_STREAMING', {}))
+    return options
+
 
 class AsyncStreamingCallbackHandler(AsyncCallbackHandler):
+    """
+    Streams LLM tokens to the consumer as 'debug' frames.
+
+    With COALESCE on, tokens are buffered and sent as one frame every FLUSH_INTERVAL_MS or
+    once MAX_FRAME_CHARS are waiting. Under Channels `send` returns once the frame is
+    handed to the server, so a slow client is not visible here and nothing is dropped;
+    coalescing only bounds the number of frames. The final answer is sent separately
+    by the consumer.
+    """
 
-    def __init__(self, consumer: AsyncWebsocketConsumer):
+    def __init__(self, consumer: AsyncWebsocketConsumer, **options):
         self.consumer = consumer
+        options = {**get_streaming_settings(), **options}
+        self.coalesce = options['COALESCE']
+        self.flush_interval = options['FLUSH_INTERVAL_MS'] / 1000
+        self.max_frame_chars = options['MAX_FRAME_CHARS']
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+        # Frames leave in order whether a token or the timer sends them
+        self._send_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
 
     async def on_llm_new_token(
         self,
@@ -20,8 +54,20 @@ class AsyncStreamingCallbackHandler(AsyncCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        # Send the token to any consumers (e.g. frontend client)
-        await self.consumer.send(text_data=json.dumps({'message': token, 'type': 'debug'}))
+        metrics.increment('streaming.tokens')
+        if not self.coalesce:
+            # Send the token to any consumers (e.g. frontend client)
+            await self._send(token)
+            return
+
+        self._buffer.append(token)
+        self._buffered_chars += len(token)
+        waited = time.monotonic() - self._last_flush
+        if self._buffered_chars >= self.max_frame_chars or waited >= self.flush_interval:
+            await self._flush()
+        elif self._timer is None:
+            # Flush whatever arrived by the end of the interval even if no further token comes
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval - waited, self._on_timer)
 
     async def on_llm_end(
         self,
@@ -31,8 +77,12 @@ class AsyncStreamingCallbackHandler(AsyncCallbackHandler):
         parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
+        await self.drain()
         # When the LLM ends, add a new line so that debug messages are spaced with new lines.
-        await self.consumer.send(text_data=json.dumps({'message': '\n\n', 'type': 'debug'}))
+        await self._send('\n\n')
+
+    async def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        await self.drain()
 
     async def on_chat_model_start(
         self, serialized: Dict[str, Any],
@@ -44,3 +94,39 @@ class AsyncStreamingCallbackHandler(AsyncCallbackHandler):
     ) -> Any:
         # Do nothing
         pass
+
+    async def drain(self):
+        """Send everything still buffered, after any frame the timer is sending."""
+        await self._flush()
+
+    async def _flush(self):
+        self._cancel_timer()
+        async with self._send_lock:
+            # Taken under the lock, so text buffered later goes in a later frame
+            if self._buffer:
+                await self._send(self._take_buffer())
+
+    def _on_timer(self):
+        self._timer = None
+        asyncio.ensure_future(self._flush()).add_done_callback(self._timer_flushed)
+
+    @staticmethod
+    def _timer_flushed(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Warning: Could not stream tokens: {task.exception()}")
+
+    def _take_buffer(self) -> str:
+        text = ''.join(self._buffer)
+        self._buffer.clear()
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+        return text
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _send(self, text: str):
+        metrics.increment('streaming.frames')
+        await self.consumer.send(text_data=json.dumps({'message': text, 'type': 'debug'}))
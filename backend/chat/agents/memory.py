@@ -0,0 +1,62 @@
+"""
+Bounded conversation memory for the chat agent.
+
+Only the latest messages are loaded from the database and sent with each turn,
+limited both by count and by estimated tokens, so connect time and prompt size stay
+constant as a conversation grows. Older history is represented by the stored
+conversation summary, sent ahead of the window.
+"""
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.schema import BaseMessage, SystemMessage
+
+from chat.ai.context_packer import estimate_tokens
+
+
+def get_memory_settings():
+    options = {
+        # 'window' loads and sends only the latest messages; 'full' keeps the whole history
+        'MODE': 'window',
+        'MAX_MESSAGES': 40,
+        'MAX_TOKENS': 3000,
+        'INCLUDE_SUMMARY': True,
+    }
+    options.update(getattr(settings, 'AGENT_MEMORY', {}))
+    return options
+
+
+def trim_to_tokens(messages: List[BaseMessage], max_tokens: int) -> List[BaseMessage]:
+    """The longest suffix of messages whose estimated size fits max_tokens."""
+    total = 0
+    for start in range(len(messages) - 1, -1, -1):
+        total += estimate_tokens(messages[start].content)
+        if total > max_tokens:
+            return messages[start + 1:]
+    return messages
+
+
+class WindowedChatMemory(BaseChatMemory):
+    """Chat history limited to the last max_messages messages and max_tokens estimated tokens."""
+
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    max_messages: int = 40
+    max_tokens: int = 3000
+    summary: Optional[str] = None
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
+        messages = trim_to_tokens(self.chat_memory.messages[-self.max_messages:], self.max_tokens)
+        if self.summary:
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] + messages
+        return {self.memory_key: messages}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        # Messages beyond the window are never sent again, so do not keep them either
+        del self.chat_memory.messages[:-self.max_messages]
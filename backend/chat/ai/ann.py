@@ -0,0 +1,145 @@
+"""
+Nearest-neighbour indexes over L2-normalised embedding rows.
+
+ExactIndex scores every row; IVFIndex clusters rows around k-means centroids
+(an inverted file) and only scores the rows of the `nprobe` closest clusters,
+trading a little recall for latency that grows with nprobe rather than with
+the total number of rows. A row whose vector changes is assigned again and moves
+to its new cluster.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+class ExactIndex:
+    """Brute-force cosine similarity; the reference the approximate index is measured against."""
+
+    trained = True
+
+    def add(self, vectors: np.ndarray, first_row: int):
+        pass
+
+    def assign(self, rows: np.ndarray, vectors: np.ndarray):
+        pass
+
+    def remove(self, rows: np.ndarray):
+        pass
+
+    def clear(self):
+        pass
+
+    def candidate_rows(self, query: np.ndarray, size: int) -> np.ndarray:
+        return np.arange(size, dtype=np.int64)
+
+
+class IVFIndex:
+    """Inverted-file index built on spherical k-means over the stored vectors."""
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists = []
+        # Cluster of each row, -1 for rows not in the index
+        self._assignments = np.zeros(0, dtype=np.int64)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, sample_size: int = 50000, iterations: int = 10):
+        """Learn cluster centroids from (a sample of) the vectors."""
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            counts = np.bincount(assignments, minlength=nlist)
+            # Empty clusters keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = sums[filled]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = centroids / norms
+
+        self.set_centroids(centroids.astype(np.float32))
+
+    def set_centroids(self, centroids: np.ndarray):
+        self.centroids = centroids
+        self.nlist = len(centroids)
+        self._lists = [np.zeros(0, dtype=np.int64) for _ in range(self.nlist)]
+        self._assignments = np.zeros(0, dtype=np.int64)
+
+    def add(self, vectors: np.ndarray, first_row: int):
+        """Assign rows `first_row .. first_row + len(vectors)` to their nearest cluster."""
+        self.assign(np.arange(first_row, first_row + len(vectors), dtype=np.int64), vectors)
+
+    def assign(self, rows: np.ndarray, vectors: np.ndarray):
+        """Assign distinct rows to the cluster nearest their vector, moving rows already in the index."""
+        if not self.trained or not len(rows):
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        self._grow(int(rows.max()) + 1)
+        assignments = self._assign(vectors)
+        previous = self._assignments[rows]
+        moved = previous != assignments
+        self._move(rows[moved], previous[moved], assignments[moved])
+
+    def remove(self, rows: np.ndarray):
+        """Take rows out of the index."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self._assignments)]
+        if not self.trained or not len(rows):
+            return
+        self._move(rows, self._assignments[rows], np.full(len(rows), -1, dtype=np.int64))
+
+    def clear(self):
+        """Take every row out of the index, keeping the centroids."""
+        self._lists = [np.zeros(0, dtype=np.int64) for _ in range(self.nlist)] if self.trained else []
+        self._assignments = np.zeros(0, dtype=np.int64)
+
+    def _move(self, rows: np.ndarray, previous: np.ndarray, assignments: np.ndarray):
+        # Lists hold about rows / nlist entries, so rewriting the few touched ones stays cheap
+        for list_id in np.unique(previous[previous >= 0]):
+            leaving = rows[previous == list_id]
+            self._lists[list_id] = self._lists[list_id][~np.isin(self._lists[list_id], leaving)]
+        for list_id in np.unique(assignments[assignments >= 0]):
+            self._lists[list_id] = np.concatenate([self._lists[list_id], rows[assignments == list_id]])
+        self._assignments[rows] = assignments
+
+    def _grow(self, size: int):
+        if size <= len(self._assignments):
+            return
+        assignments = np.full(max(size, 2 * len(self._assignments)), -1, dtype=np.int64)
+        assignments[:len(self._assignments)] = self._assignments
+        self._assignments = assignments
+
+    def candidate_rows(self, query: np.ndarray, size: int) -> np.ndarray:
+        """Rows of the `nprobe` clusters closest to the query."""
+        nprobe = min(self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._lists[list_id] for list_id in probed])
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[start:start + batch_size] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), batch_size)
+        ])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
@@ -0,0 +1,120 @@
+"""
+Token-budgeted prompt context for questions about past conversations.
+
+Instead of pasting the full text of every relevant conversation, the packer fits the
+most useful material into a token budget: a conversation's summary stands in for its
+raw messages when the summary is shorter, and messages are then added in order of
+BM25 relevance to the question until the budget is spent. Token counts come from
+estimate_tokens, a fast local approximation of the model's tokenizer.
+"""
+import re
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+
+from .text_index import BM25Corpus, tokenize
+
+PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def get_context_settings():
+    options = {
+        'TOKEN_BUDGET': 6000,
+    }
+    options.update(getattr(settings, 'CONVERSATION_QUERY', {}))
+    return options
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count: one per word or punctuation mark, plus one per further 6 characters of a word."""
+    return sum(1 + (len(piece) - 1) // 6 for piece in PIECE_PATTERN.findall(text or ''))
+
+
+def format_message(msg: Dict) -> str:
+    return f"[{msg.get('sender', 'UNKNOWN')} at {msg.get('timestamp', '')}]: {msg.get('content', '')}"
+
+
+class ContextPacker:
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+
+    def pack(self, query: str, conversations: List[Dict]) -> Tuple[str, Dict[str, int]]:
+        """
+        Prompt text for the conversations, in the given order, within the token budget.
+
+        Returns the text and usage stats: tokens used and dropped, messages included and
+        dropped, and the number of summaries used in place of raw messages.
+        """
+        used = 0
+        sections = []
+        corpus = BM25Corpus()
+        documents = []  # (section, message position) per corpus document
+
+        for conv in conversations:
+            header = (
+                f"---\nConversation ID: {conv.get('id', 'N/A')}\n"
+                f"Title: {conv.get('title', 'Untitled')}\n"
+                f"Date: {conv.get('start_timestamp', 'N/A')}\n"
+            )
+            # Allow for the "Messages (k of n):" line added when rendering
+            header_tokens = estimate_tokens(header) + 8
+            if used + header_tokens > self.token_budget:
+                break
+            used += header_tokens
+
+            messages = conv.get('messages', [])
+            lines = [format_message(msg) for msg in messages]
+            section = {
+                'header': header,
+                'summary': None,
+                'lines': lines,
+                'line_tokens': [estimate_tokens(line) for line in lines],
+                'included': set(),
+            }
+            if conv.get('summary'):
+                summary = f"Summary: {conv['summary']}"
+                summary_tokens = estimate_tokens(summary)
+                if summary_tokens < sum(section['line_tokens']) and used + summary_tokens <= self.token_budget:
+                    section['summary'] = summary
+                    used += summary_tokens
+
+            for position, msg in enumerate(messages):
+                corpus.add(len(documents), len(sections), msg.get('content', ''))
+                documents.append((len(sections), position))
+            sections.append(section)
+
+        scores = corpus.score(tokenize(query))
+        # Most relevant first; among equally relevant messages, higher-ranked conversations and later messages
+        ranked = sorted(range(len(documents)), key=lambda doc: (-scores.get(doc, 0.0), documents[doc][0], -documents[doc][1]))
+        for doc in ranked:
+            section_index, position = documents[doc]
+            section = sections[section_index]
+            if section['summary'] is not None and not scores.get(doc):
+                continue  # the summary already covers this conversation's unrelated messages
+            tokens = section['line_tokens'][position]
+            if used + tokens <= self.token_budget:
+                section['included'].add(position)
+                used += tokens
+
+        parts = []
+        for section in sections:
+            parts.append(section['header'])
+            if section['summary'] is not None:
+                parts.append(section['summary'] + "\n")
+            if section['included']:
+                parts.append(f"Messages ({len(section['included'])} of {len(section['lines'])}):\n")
+                parts.append("\n".join(section['lines'][position] for position in sorted(section['included'])) + "\n")
+
+        total_messages = sum(len(conv.get('messages', [])) for conv in conversations)
+        total_tokens = sum(estimate_tokens(format_message(msg)) for conv in conversations for msg in conv.get('messages', []))
+        included_tokens = sum(section['line_tokens'][position] for section in sections for position in section['included'])
+        included_messages = sum(len(section['included']) for section in sections)
+        text = "\n".join(parts)
+        return text, {
+            'token_budget': self.token_budget,
+            'tokens_used': estimate_tokens(text),
+            'tokens_dropped': total_tokens - included_tokens,
+            'messages_included': included_messages,
+            'messages_dropped': total_messages - included_messages,
+            'summaries_used': sum(1 for section in sections if section['summary'] is not None),
+        }
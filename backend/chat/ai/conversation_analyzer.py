@@ -2,43 +2,49 @@
 AI-powered conversation analysis module.
 Provides summarization, semantic search, sentiment analysis, and topic extraction.
 """
+import json
 import os
-from typing import List, Dict, Optional, Tuple
+import re
+import threading
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
 
 from django.conf import settings
 from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, AIMessage
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
 
-# Try to import sentence transformers for embeddings, fallback if not available
-EMBEDDINGS_AVAILABLE = False
-try:
-    from sentence_transformers import SentenceTransformer
-    EMBEDDINGS_AVAILABLE = True
-except (ImportError, ValueError, Exception) as e:
-    EMBEDDINGS_AVAILABLE = False
-    print(f"Warning: sentence-transformers not available ({str(e)}). Semantic search will use keyword matching.")
+from chat.metrics import metrics
 
+from .context_packer import ContextPacker, format_message, get_context_settings
+from .embeddings import EMBEDDINGS_AVAILABLE, embedding_store, get_embedding_model
+from .excerpts import ExcerptExtractor
+from .llm_cache import LLMResponseCache, get_llm_cache
+from .text_index import get_text_index
 
-class ConversationAnalyzer:
-    """Handles AI-powered conversation analysis and intelligence."""
-
-    def __init__(self):
-        self.llm = ChatGroq(
-            model="llama-3.3-70b-versatile",
-            temperature=0.3,
-            max_tokens=2000,
-        )
-        self.embeddings_model = None
-        if EMBEDDINGS_AVAILABLE:
-            try:
-                self.embeddings_model = SentenceTransformer('all-MiniLM-L6-v2')
-            except Exception as e:
-                print(f"Warning: Could not load embeddings model: {e}")
-                self.embeddings_model = None
 
-    def generate_summary(self, messages: List[Dict]) -> str:
+class ConversationAnalyzer:
+    """
+    Handles AI-powered conversation analysis and intelligence.
+
+    Instances keep no per-call state, so one is shared by all threads of a worker
+    process; use get_conversation_analyzer() rather than constructing it per request.
+    """
+
+    def __init__(self, llm=None, cache: Optional[LLMResponseCache] = None):
+        self.cache = cache if cache is not None else get_llm_cache()
+        with metrics.timer('analyzer.llm_client_init'):
+            self.llm = llm or ChatGroq(
+                model="llama-3.3-70b-versatile",
+                temperature=0.3,
+                max_tokens=2000,
+            )
+
+    @property
+    def embeddings_model(self):
+        """The process-wide embedding model, loaded on first use."""
+        return get_embedding_model()
+
+    def generate_summary(self, messages: List[Dict], conversation_id: Optional[int] = None) -> str:
         """Generate a summary of a conversation."""
         if not messages:
             return "Empty conversation."
@@ -46,92 +52,193 @@ class ConversationAnalyzer:
         # Format messages for the prompt
         conversation_text = self._format_messages_for_analysis(messages)
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert at analyzing conversations and creating concise summaries.
+        response = self._invoke(
+            """You are an expert at analyzing conversations and creating concise summaries.
             Create a clear, informative summary that captures:
             1. The main topics discussed
             2. Key decisions or conclusions
             3. Important action items or next steps
             4. Overall context and purpose of the conversation
             
-            Keep the summary concise but comprehensive (2-4 sentences)."""),
-            ("human", f"Please summarize the following conversation:\n\n{conversation_text}")
-        ])
+            Keep the summary concise but comprehensive (2-4 sentences).""",
+            f"Please summarize the following conversation:\n\n{conversation_text}",
+            conversation_ids=(conversation_id,)
+        )
+        return response.content.strip()
 
-        response = self.llm.invoke(prompt.format_messages())
+    def summarize_chunk(self, messages: List[Dict], previous_summary: Optional[str] = None) -> str:
+        """Summarize one window of a long conversation, continuing from the previous window."""
+        context = f"Summary of the conversation so far:\n{previous_summary}\n\n" if previous_summary else ""
+
+        # Windows never change once stored, so the reply is not tagged with the conversation
+        response = self._invoke(
+            """You are an expert at summarizing long conversations one part at a time.
+            Summarize this part of the conversation in 2-4 sentences, keeping topics, decisions,
+            action items and any names or figures that later parts may refer to.
+            Use the summary of the earlier parts only as context; do not repeat it.""",
+            f"{context}Summarize this part of the conversation:\n\n{self._format_messages_for_analysis(messages)}"
+        )
         return response.content.strip()
 
-    def analyze_sentiment(self, messages: List[Dict]) -> Dict[str, any]:
+    def analyze_sentiment(self, messages: List[Dict], conversation_id: Optional[int] = None) -> Dict[str, any]:
         """Analyze the sentiment and tone of a conversation."""
         if not messages:
             return {"sentiment": "neutral", "tone": "neutral", "confidence": 0.0}
 
         conversation_text = self._format_messages_for_analysis(messages)
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert at analyzing conversation sentiment and tone.
+        response = self._invoke(
+            """You are an expert at analyzing conversation sentiment and tone.
             Analyze the conversation and provide:
             1. Overall sentiment (positive, negative, neutral)
             2. Tone (professional, casual, friendly, formal, etc.)
             3. Confidence level (0.0 to 1.0)
             
-            Respond in JSON format: {"sentiment": "...", "tone": "...", "confidence": 0.0}"""),
-            ("human", f"Analyze the sentiment and tone of this conversation:\n\n{conversation_text}")
-        ])
-
-        response = self.llm.invoke(prompt.format_messages())
-        try:
-            import json
-            result = json.loads(response.content.strip())
-            return result
-        except:
+            Respond in JSON format: {"sentiment": "...", "tone": "...", "confidence": 0.0}""",
+            f"Analyze the sentiment and tone of this conversation:\n\n{conversation_text}",
+            conversation_ids=(conversation_id,)
+        )
+        result = self._parse_json_object(response.content)
+        if result is None:
             return {"sentiment": "neutral", "tone": "neutral", "confidence": 0.5}
+        return result
 
-    def extract_topics(self, messages: List[Dict]) -> List[str]:
+    def extract_topics(self, messages: List[Dict], conversation_id: Optional[int] = None) -> List[str]:
         """Extract key topics from a conversation."""
         if not messages:
             return []
 
         conversation_text = self._format_messages_for_analysis(messages)
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert at extracting key topics from conversations.
+        response = self._invoke(
+            """You are an expert at extracting key topics from conversations.
             Identify the main topics discussed. Return them as a comma-separated list.
-            Focus on the most important and recurring themes."""),
-            ("human", f"Extract the key topics from this conversation:\n\n{conversation_text}")
-        ])
-
-        response = self.llm.invoke(prompt.format_messages())
+            Focus on the most important and recurring themes.""",
+            f"Extract the key topics from this conversation:\n\n{conversation_text}",
+            conversation_ids=(conversation_id,)
+        )
         topics = [topic.strip() for topic in response.content.strip().split(',')]
         return topics[:10]  # Limit to top 10 topics
 
-    def extract_action_items(self, messages: List[Dict]) -> List[str]:
+    def extract_action_items(self, messages: List[Dict], conversation_id: Optional[int] = None) -> List[str]:
         """Extract action items and decisions from a conversation."""
         if not messages:
             return []
 
         conversation_text = self._format_messages_for_analysis(messages)
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert at identifying action items and decisions in conversations.
+        response = self._invoke(
+            """You are an expert at identifying action items and decisions in conversations.
             Extract any:
             1. Action items (tasks to be done)
             2. Decisions made
             3. Next steps mentioned
             
-            Return them as a bulleted list, one per line."""),
-            ("human", f"Extract action items and decisions from this conversation:\n\n{conversation_text}")
-        ])
-
-        response = self.llm.invoke(prompt.format_messages())
+            Return them as a bulleted list, one per line.""",
+            f"Extract action items and decisions from this conversation:\n\n{conversation_text}",
+            conversation_ids=(conversation_id,)
+        )
         items = [item.strip('- ').strip() for item in response.content.strip().split('\n') if item.strip()]
         return items[:10]  # Limit to top 10 items
 
+    def analyze_all(self, messages: List[Dict], conversation_id: Optional[int] = None) -> Dict[str, any]:
+        """
+        Summary, sentiment, topics and action items from a single LLM call.
+
+        Falls back to the individual calls if the response is not valid JSON.
+        """
+        if not messages:
+            return {
+                "summary": "Empty conversation.",
+                "sentiment": {"sentiment": "neutral", "tone": "neutral", "confidence": 0.0},
+                "topics": [],
+                "action_items": []
+            }
+
+        conversation_text = self._format_messages_for_analysis(messages)
+
+        response = self._invoke(
+            """You are an expert at analyzing conversations.
+            A long conversation starts with summaries of its earlier parts, followed by its latest messages;
+            analyze it as a whole.
+            Analyze the conversation and respond with a single JSON object, and nothing else, with these keys:
+            "summary": a concise but comprehensive summary (2-4 sentences) covering the main topics,
+                key decisions, action items and the overall purpose of the conversation,
+            "sentiment": overall sentiment, one of "positive", "negative" or "neutral",
+            "tone": the tone (professional, casual, friendly, formal, etc.),
+            "confidence": your confidence in the sentiment, from 0.0 to 1.0,
+            "topics": up to 10 key topics, as a list of short strings,
+            "action_items": up to 10 action items, decisions or next steps, as a list of strings.""",
+            f"Analyze this conversation:\n\n{conversation_text}",
+            conversation_ids=(conversation_id,)
+        )
+        result = self._parse_analysis(response.content)
+        if result is not None:
+            metrics.increment('analyzer.analyze_all.single_call')
+            return result
+
+        metrics.increment('analyzer.analyze_all.fallback')
+        print("Warning: Could not parse combined analysis, falling back to individual calls")
+        return {
+            "summary": self.generate_summary(messages, conversation_id),
+            "sentiment": self.analyze_sentiment(messages, conversation_id),
+            "topics": self.extract_topics(messages, conversation_id),
+            "action_items": self.extract_action_items(messages, conversation_id)
+        }
+
+    @staticmethod
+    def _parse_json_object(content: str) -> Optional[Dict]:
+        """Parse a JSON object from an LLM reply, tolerating code fences or surrounding prose."""
+        content = content.strip()
+        fenced = re.search(r"```(?:json)?\s*(.*?)```", content, re.DOTALL)
+        if fenced:
+            content = fenced.group(1).strip()
+        start, end = content.find('{'), content.rfind('}')
+        if start == -1 or end <= start:
+            return None
+        try:
+            parsed = json.loads(content[start:end + 1])
+        except ValueError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+    def _parse_analysis(self, content: str) -> Optional[Dict]:
+        parsed = self._parse_json_object(content)
+        if parsed is None or not isinstance(parsed.get('summary'), str) or not parsed['summary'].strip():
+            return None
+        return {"summary": parsed['summary'].strip(), **self._analytics_from(parsed)}
+
+    @staticmethod
+    def _analytics_from(parsed: Dict) -> Dict[str, any]:
+        """Sentiment, topics and action items of a parsed analysis, with defaults and bounds applied."""
+        def as_list(value) -> List[str]:
+            if isinstance(value, str):
+                value = value.split(',')
+            if not isinstance(value, list):
+                return []
+            return [str(item).strip('- ').strip() for item in value if str(item).strip()][:10]
+
+        try:
+            confidence = float(parsed.get('confidence', 0.5))
+        except (TypeError, ValueError):
+            confidence = 0.5
+
+        return {
+            "sentiment": {
+                "sentiment": str(parsed.get('sentiment') or 'neutral').lower(),
+                "tone": str(parsed.get('tone') or 'neutral'),
+                "confidence": min(max(confidence, 0.0), 1.0)
+            },
+            "topics": as_list(parsed.get('topics')),
+            "action_items": as_list(parsed.get('action_items'))
+        }
+
     def query_past_conversations(
         self,
         query: str,
         conversations: List[Dict],
-        max_results: int = 5
+        max_results: int = 5,
+        token_budget: Optional[int] = None
     ) -> Dict[str, any]:
         """
         Answer questions about past conversations using AI.
@@ -140,9 +247,12 @@ class ConversationAnalyzer:
             query: User's question about past conversations
             conversations: List of conversation dicts with messages
             max_results: Maximum number of relevant conversations to include
+            token_budget: Estimated tokens of conversation context to send; defaults to
+                CONVERSATION_QUERY['TOKEN_BUDGET']
             
         Returns:
-            Dict with answer, relevant_excerpts, and related_conversations
+            Dict with answer, relevant_excerpts, related_conversations and context
+            (tokens used and dropped by the context packer)
         """
         if not conversations:
             print("WARNING: No conversations provided to query_past_conversations")
@@ -152,58 +262,100 @@ class ConversationAnalyzer:
                 "related_conversations": []
             }
 
+        prepared = self._prepare_query(query, conversations, max_results, token_budget)
+        response = self._invoke(*prepared['prompt'], conversation_ids=prepared['conversation_ids'])
+        return {"answer": response.content.strip(), **prepared['result']}
+
+    def stream_query_past_conversations(
+        self,
+        query: str,
+        conversations: List[Dict],
+        max_results: int = 5,
+        token_budget: Optional[int] = None
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        Streaming variant of query_past_conversations, as (event, data) pairs.
+
+        Yields "context" with relevant_excerpts, related_conversations and context as soon
+        as retrieval is done, then "token" for each piece of the answer as the LLM produces
+        it, and finally "done" with the complete answer.
+        """
+        if not conversations:
+            yield "context", {"relevant_excerpts": [], "related_conversations": []}
+            yield "done", {"answer": "No past conversations found to query."}
+            return
+
+        prepared = self._prepare_query(query, conversations, max_results, token_budget)
+        yield "context", prepared['result']
+
+        pieces = []
+        for piece in self._stream(*prepared['prompt'], conversation_ids=prepared['conversation_ids']):
+            if piece:
+                pieces.append(piece)
+                yield "token", {"text": piece}
+        yield "done", {"answer": "".join(pieces).strip()}
+
+    def _prepare_query(
+        self,
+        query: str,
+        conversations: List[Dict],
+        max_results: int,
+        token_budget: Optional[int]
+    ) -> Dict[str, any]:
+        """Retrieval and prompt for a question: everything but the answer itself."""
         print(f"Querying {len(conversations)} conversations with query: {query}")
         # Find most relevant conversations using semantic search or keyword matching
         relevant_convs = self._find_relevant_conversations(query, conversations, max_results)
         print(f"Found {len(relevant_convs)} relevant conversations")
 
-        # Format conversations for the prompt
-        formatted_convs = []
-        for conv in relevant_convs:
-            conv_text = f"Conversation ID: {conv.get('id', 'N/A')}\n"
-            conv_text += f"Title: {conv.get('title', 'Untitled')}\n"
-            conv_text += f"Date: {conv.get('start_timestamp', 'N/A')}\n"
-            conv_text += f"Messages:\n{self._format_messages_for_analysis(conv.get('messages', []))}\n"
-            formatted_convs.append(conv_text)
+        # Fit the most relevant messages and summaries into the token budget
+        packer = ContextPacker(token_budget or get_context_settings()['TOKEN_BUDGET'])
+        conversations_text, context_usage = packer.pack(query, relevant_convs)
 
-        conversations_text = "\n\n---\n\n".join(formatted_convs)
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an intelligent assistant that helps users understand their past conversations.
+        return {
+            "prompt": (
+                """You are an intelligent assistant that helps users understand their past conversations.
             Based on the provided conversation histories, answer the user's question accurately and helpfully.
             Include specific details and excerpts when relevant.
-            If the information is not available in the provided conversations, say so clearly."""),
-            ("human", f"User Question: {query}\n\nPast Conversations:\n\n{conversations_text}\n\nPlease answer the user's question based on these conversations.")
-        ])
-
-        response = self.llm.invoke(prompt.format_messages())
-        answer = response.content.strip()
+            If the information is not available in the provided conversations, say so clearly.""",
+                f"User Question: {query}\n\nPast Conversations:\n\n{conversations_text}\n\nPlease answer the user's question based on these conversations."
+            ),
+            "conversation_ids": [conv.get('id') for conv in relevant_convs],
+            "result": {
+                "relevant_excerpts": self._extract_relevant_excerpts(query, relevant_convs),
+                "related_conversations": [
+                    {
+                        "id": conv.get('id'),
+                        "title": conv.get('title', 'Untitled'),
+                        "start_timestamp": conv.get('start_timestamp')
+                    }
+                    for conv in relevant_convs
+                ],
+                "context": context_usage
+            }
+        }
 
-        # Extract relevant excerpts
-        relevant_excerpts = self._extract_relevant_excerpts(query, relevant_convs)
+    def _invoke(self, system_prompt: str, human_prompt: str, conversation_ids: Iterable[int] = ()):
+        """
+        Send a system and a human message to the LLM and return its reply.
 
-        return {
-            "answer": answer,
-            "relevant_excerpts": relevant_excerpts,
-            "related_conversations": [
-                {
-                    "id": conv.get('id'),
-                    "title": conv.get('title', 'Untitled'),
-                    "start_timestamp": conv.get('start_timestamp')
-                }
-                for conv in relevant_convs
-            ]
-        }
+        conversation_ids tag the cached reply so it is dropped when those conversations change.
+        """
+        messages = [SystemMessage(content=system_prompt), HumanMessage(content=human_prompt)]
+        if self.cache is None:
+            return self.llm.invoke(messages)
+        return self.cache.invoke(self.llm, messages, conversation_ids)
+
+    def _stream(self, system_prompt: str, human_prompt: str, conversation_ids: Iterable[int] = ()) -> Iterator[str]:
+        """Like _invoke, but yields the reply text piece by piece as the LLM generates it."""
+        messages = [SystemMessage(content=system_prompt), HumanMessage(content=human_prompt)]
+        if self.cache is None:
+            return (chunk.content for chunk in self.llm.stream(messages))
+        return self.cache.stream(self.llm, messages, conversation_ids)
 
     def _format_messages_for_analysis(self, messages: List[Dict]) -> str:
         """Format messages for AI analysis."""
-        formatted = []
-        for msg in messages:
-            sender = msg.get('sender', 'UNKNOWN')
-            content = msg.get('content', '')
-            timestamp = msg.get('timestamp', '')
-            formatted.append(f"[{sender} at {timestamp}]: {content}")
-        return "\n".join(formatted)
+        return "\n".join(format_message(msg) for msg in messages)
 
     def _find_relevant_conversations(
         self,
@@ -215,85 +367,50 @@ class ConversationAnalyzer:
         if not conversations:
             return []
 
-        # If embeddings are available, use semantic search
+        # If embeddings are available, rank by the stored message vectors
         if self.embeddings_model and EMBEDDINGS_AVAILABLE:
             try:
-                query_embedding = self.embeddings_model.encode(query)
-                scored_convs = []
-
-                for conv in conversations:
-                    # Create a text representation of the conversation
-                    conv_text = f"{conv.get('title', '')} "
-                    conv_text += " ".join([msg.get('content', '') for msg in conv.get('messages', [])])
-                    
-                    conv_embedding = self.embeddings_model.encode(conv_text)
-                    
-                    # Calculate cosine similarity (simplified)
-                    try:
-                        import numpy as np
-                        similarity = np.dot(query_embedding, conv_embedding) / (
-                            np.linalg.norm(query_embedding) * np.linalg.norm(conv_embedding)
-                        )
-                        scored_convs.append((similarity, conv))
-                    except Exception as e:
-                        print(f"Error calculating similarity: {e}")
-                        # Fall through to keyword search
-
-                # Sort by similarity and return top results
-                if scored_convs:
-                    scored_convs.sort(key=lambda x: x[0], reverse=True)
-                    return [conv for _, conv in scored_convs[:max_results]]
+                conversations_by_id = {conv.get('id'): conv for conv in conversations}
+                ranked = embedding_store.search_conversations(
+                    query, list(conversations_by_id), max_results
+                )
+                if ranked:
+                    return [conversations_by_id[conv_id] for conv_id, _ in ranked]
             except Exception as e:
                 print(f"Error in semantic search: {e}")
                 # Fall through to keyword search
 
-        # Fallback to keyword-based search
-        query_lower = query.lower()
-        scored_convs = []
-
-        for conv in conversations:
-            score = 0
-            # Check title
-            title = conv.get('title', '').lower()
-            if query_lower in title:
-                score += 10
-            
-            # Check messages
-            for msg in conv.get('messages', []):
-                content = msg.get('content', '').lower()
-                if query_lower in content:
-                    score += 1
-                # Also check if any query words appear in the message
-                query_words = query_lower.split()
-                for word in query_words:
-                    if word in content:
-                        score += 0.5
-            
-            # Always include conversations, even with score 0, so AI can analyze all history
-            scored_convs.append((score, conv))
+        # Fallback to keyword-based search, scored by the full-text index
+        conversation_ids = [conv.get('id') for conv in conversations]
+        keyword_scores = get_text_index().score_conversations(query, conversation_ids)
+        # Always include conversations, even with score 0, so AI can analyze all history
+        scored_convs = [(keyword_scores.get(conv.get('id'), 0), conv) for conv in conversations]
 
         scored_convs.sort(key=lambda x: x[0], reverse=True)
         # Return top results - if no matches found, still return conversations so AI can analyze all history
         return [conv for _, conv in scored_convs[:max_results]]
 
     def _extract_relevant_excerpts(self, query: str, conversations: List[Dict]) -> List[Dict]:
-        """Extract relevant message excerpts from conversations."""
-        excerpts = []
-        query_lower = query.lower()
-
-        for conv in conversations:
-            for msg in conv.get('messages', []):
-                content = msg.get('content', '').lower()
-                if any(word in content for word in query_lower.split()):
-                    excerpts.append({
-                        "conversation_id": conv.get('id'),
-                        "conversation_title": conv.get('title', 'Untitled'),
-                        "content": msg.get('content', '')[:200],  # Truncate long messages
-                        "sender": msg.get('sender'),
-                        "timestamp": msg.get('timestamp')
-                    })
-                    if len(excerpts) >= 10:  # Limit excerpts
-                        break
-
-        return excerpts[:10]
+        """Extract the best matching message excerpts from conversations, with match offsets."""
+        return ExcerptExtractor(query).extract(conversations, limit=10)
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_conversation_analyzer() -> ConversationAnalyzer:
+    """Return the shared ConversationAnalyzer of this process, creating it on first use."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = ConversationAnalyzer()
+                metrics.increment('analyzer.instances_created')
+    return _analyzer
+
 
+def warm_up():
+    """Build the shared analyzer and load the embedding model ahead of the first request."""
+    with metrics.timer('analyzer.warm_up'):
+        get_conversation_analyzer().embeddings_model
@@ -0,0 +1,404 @@
+"""
+Persistent embedding index for semantic search over past conversations.
+Each message is encoded once when it is saved; the vectors are stored as float32
+bytes in the database and mirrored into an in-memory matrix that is refreshed
+incrementally, so a query only has to encode the query string itself. Large
+matrices are searched through an approximate IVF index (see ann.py).
+
+Conversations are ranked by sliding windows of consecutive messages rather than by
+single messages: a window's vector is the normalised sum of its message vectors, so
+short replies are scored together with the messages around them at no extra encoding
+cost. Windows are built incrementally as vectors are loaded, and they are what the
+matrix and the IVF index hold, so a query is one probe and one matrix product over
+the probed windows. Window scores are aggregated per conversation by max or by the
+mean of the best few windows. A conversation that loses messages has its windows
+rebuilt from the vectors left (see chat.tasks).
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from chat.metrics import metrics, resident_memory_bytes
+
+from .ann import ExactIndex, IVFIndex
+
+# Try to import sentence transformers for embeddings, fallback if not available
+EMBEDDINGS_AVAILABLE = False
+try:
+    from sentence_transformers import SentenceTransformer
+    EMBEDDINGS_AVAILABLE = True
+except (ImportError, ValueError, Exception) as e:
+    EMBEDDINGS_AVAILABLE = False
+    print(f"Warning: sentence-transformers not available ({str(e)}). Semantic search will use keyword matching.")
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSIONS = 384
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """Return the process-wide SentenceTransformer, loading it on first use."""
+    global _model
+    if not EMBEDDINGS_AVAILABLE:
+        return None
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                rss_before = resident_memory_bytes()
+                started = time.perf_counter()
+                try:
+                    _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                except Exception as e:
+                    metrics.increment('embeddings.model_load_failures')
+                    print(f"Warning: Could not load embeddings model: {e}")
+                    return None
+                metrics.observe('embeddings.model_load', time.perf_counter() - started)
+                _record_model_footprint(_model, rss_before)
+    return _model
+
+
+def _record_model_footprint(model, rss_before):
+    parameters = getattr(model, 'parameters', None)
+    if parameters is not None:
+        metrics.set_gauge(
+            'embeddings.model_parameter_bytes',
+            sum(param.numel() * param.element_size() for param in parameters()),
+        )
+    rss_after = resident_memory_bytes()
+    if rss_before is not None and rss_after is not None:
+        metrics.set_gauge('embeddings.model_rss_delta_bytes', rss_after - rss_before)
+
+
+def encode_texts(texts: List[str], batch_size: int = 32) -> Optional[np.ndarray]:
+    """Encode texts into an (n, dim) matrix of L2-normalised float32 vectors."""
+    model = get_embedding_model()
+    if model is None:
+        return None
+    vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+    return normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+
+
+def init_encoder_process(threads: int):
+    """Process pool initializer: pin the worker's torch threads and load the model once."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    get_embedding_model()
+
+
+def get_search_settings() -> Dict:
+    """CONVERSATION_SEARCH settings merged over the defaults."""
+    options = {
+        'INDEX': 'ivf',
+        'IVF_NLIST': 0,
+        'IVF_NPROBE': 8,
+        'EXACT_SEARCH_THRESHOLD': 20000,
+        'INDEX_PATH': None,
+        'CHUNK_MESSAGES': 4,
+        'CHUNK_STRIDE': 2,
+        'CHUNK_AGGREGATE': 'top_k_mean',
+        'CHUNK_TOP_K': 3,
+    }
+    options.update(getattr(settings, 'CONVERSATION_SEARCH', {}))
+    return options
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise the rows of a matrix so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class _WindowState:
+    """The windows being built for one conversation."""
+
+    __slots__ = ('recent', 'count', 'tail_row')
+
+    def __init__(self, size: int):
+        self.recent = deque(maxlen=size)
+        self.count = 0
+        # Row of the window ending at the latest message, while it still moves with new ones
+        self.tail_row: Optional[int] = None
+
+
+class EmbeddingStore:
+    """In-memory float32 matrix of message window embeddings backed by MessageEmbedding rows."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self._window_owners = np.zeros(0, dtype=np.int64)
+        self._window_count = 0
+        self._states: Dict[int, _WindowState] = {}
+        # Rows of conversations reloaded or deleted since the last full load
+        self._dead_windows = 0
+        self._message_count = 0
+        self._last_embedding_id = 0
+        self._index = ExactIndex()
+        self._index_mtime = None
+        self._index_loaded = False
+
+    @property
+    def available(self) -> bool:
+        return EMBEDDINGS_AVAILABLE
+
+    def __len__(self):
+        return self._message_count
+
+    def add_messages(self, messages: Iterable) -> int:
+        """Encode and persist embeddings for the given Message instances."""
+        from chat.models import MessageEmbedding
+
+        messages = [msg for msg in messages if msg.content]
+        if not messages or not self.available:
+            return 0
+
+        vectors = encode_texts([msg.content for msg in messages])
+        if vectors is None:
+            return 0
+
+        MessageEmbedding.objects.bulk_create(
+            [
+                MessageEmbedding(
+                    message_id=msg.id,
+                    conversation_id=msg.conversation_id,
+                    vector=vector.tobytes(),
+                )
+                for msg, vector in zip(messages, vectors)
+            ],
+            ignore_conflicts=True,
+        )
+        return len(messages)
+
+    def ensure_indexed(self, conversation_ids: List[int]) -> int:
+        """Embed any messages of these conversations that have no stored vector yet."""
+        from chat.models import Message
+
+        if not conversation_ids or not self.available:
+            return 0
+        missing = list(
+            Message.objects.filter(conversation_id__in=conversation_ids, embedding__isnull=True)
+            # Empty messages never get a vector, so they would be read again on every query
+            .exclude(content='')
+            .only('id', 'conversation_id', 'content')
+        )
+        return self.add_messages(missing)
+
+    def refresh(self):
+        """Fold embeddings persisted since the last refresh into the conversations' windows."""
+        from chat.models import MessageEmbedding
+
+        with self._lock:
+            if self._index_file_changed():
+                # A rebuild wrote new centroids: reload everything, which also compacts
+                # away rows whose messages have been deleted since they were loaded.
+                self._reset()
+                self._index = self._load_index()
+            elif self._dead_windows * 2 > self._window_count:
+                # Most rows belong to reloaded or deleted conversations: load again to reclaim them
+                self._reset()
+                self._index.clear()
+
+            rows = list(
+                MessageEmbedding.objects.filter(id__gt=self._last_embedding_id)
+                .order_by('id')
+                .values_list('id', 'message_id', 'conversation_id', 'vector')
+            )
+            if rows:
+                options = get_search_settings()
+                # Each conversation's new messages in message order
+                rows.sort(key=lambda row: (row[2], row[1]))
+                changed = [
+                    self._add_to_windows(
+                        conversation_id, np.frombuffer(bytes(vector), dtype=np.float32),
+                        options['CHUNK_MESSAGES'], options['CHUNK_STRIDE'],
+                    )
+                    for _, _, conversation_id, vector in rows
+                ]
+                self._last_embedding_id = max(row[0] for row in rows)
+                changed = np.unique(changed)
+                self._index.assign(changed, self._windows[changed])
+
+            self._train_index_if_needed()
+
+    def reload_conversations(self, conversation_ids: Iterable[int]):
+        """
+        Rebuild the windows of conversations that lost messages from their remaining
+        vectors; a deleted conversation has none left, so its windows just go.
+        """
+        from chat.models import MessageEmbedding
+
+        conversation_ids = set(conversation_ids)
+        with self._lock:
+            rows = list(
+                MessageEmbedding.objects.filter(conversation_id__in=conversation_ids, id__lte=self._last_embedding_id)
+                .order_by('conversation_id', 'message_id')
+                .values_list('conversation_id', 'vector')
+            )
+            owners = self._window_owners[:self._window_count]
+            dropped = np.flatnonzero(np.isin(owners, list(conversation_ids)))
+            # Left in place with no owner; refresh reclaims them once they are the majority
+            owners[dropped] = -1
+            self._index.remove(dropped)
+            self._dead_windows += len(dropped)
+            for conversation_id in conversation_ids:
+                state = self._states.pop(conversation_id, None)
+                if state is not None:
+                    self._message_count -= state.count
+
+            if rows:
+                options = get_search_settings()
+                changed = np.unique([
+                    self._add_to_windows(
+                        conversation_id, np.frombuffer(bytes(vector), dtype=np.float32),
+                        options['CHUNK_MESSAGES'], options['CHUNK_STRIDE'],
+                    )
+                    for conversation_id, vector in rows
+                ])
+                self._index.assign(changed, self._windows[changed])
+
+    def search_conversations(
+        self,
+        query: str,
+        conversation_ids: List[int],
+        max_results: int
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank conversations by their best matching windows of messages.
+
+        Returns (conversation_id, similarity) pairs, most similar first. Conversations
+        without any stored vectors are omitted, and so are conversations none of whose
+        windows fall in the clusters the approximate index probes.
+        """
+        query_vectors = encode_texts([query])
+        if query_vectors is None:
+            return []
+
+        self.ensure_indexed(conversation_ids)
+        self.refresh()
+
+        options = get_search_settings()
+        query_vector = query_vectors[0]
+        with self._lock:
+            owners = self._window_owners[:self._window_count]
+            candidates = np.isin(owners, conversation_ids)
+            if self._index.trained and candidates.sum() > options['EXACT_SEARCH_THRESHOLD']:
+                rows = self._index.candidate_rows(query_vector, self._window_count)
+                rows = rows[candidates[rows]]
+            else:
+                rows = np.flatnonzero(candidates)
+            scores = self._windows[rows] @ query_vector
+            window_owners = owners[rows]
+
+        if not len(window_owners):
+            return []
+
+        metrics.observe('embeddings.search_chunks', len(window_owners))
+        conversation_scores = self.aggregate_scores(
+            window_owners, scores, options['CHUNK_AGGREGATE'], options['CHUNK_TOP_K']
+        )
+        ranked = sorted(conversation_scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:max_results]
+
+    @staticmethod
+    def aggregate_scores(owners: np.ndarray, scores: np.ndarray, method: str, top_k: int) -> Dict[int, float]:
+        """Score each conversation by its best window ('max') or the mean of its top_k windows."""
+        unique_ids, inverse = np.unique(owners, return_inverse=True)
+        if method == 'max':
+            best = np.full(len(unique_ids), -np.inf, dtype=np.float32)
+            np.maximum.at(best, inverse, scores)
+            return {int(conv_id): float(score) for conv_id, score in zip(unique_ids, best)}
+
+        # Highest scores first within each conversation, then average the first top_k
+        order = np.lexsort((-scores, inverse))
+        inverse, scores = inverse[order], scores[order]
+        group_starts = np.flatnonzero(np.r_[True, inverse[1:] != inverse[:-1]])
+        rank = np.arange(len(inverse)) - np.repeat(group_starts, np.diff(np.r_[group_starts, len(inverse)]))
+        keep = rank < top_k
+        totals = np.bincount(inverse[keep], weights=scores[keep], minlength=len(unique_ids))
+        counts = np.bincount(inverse[keep], minlength=len(unique_ids))
+        return {int(conv_id): float(total / count) for conv_id, total, count in zip(unique_ids, totals, counts)}
+
+    def _add_to_windows(self, conversation_id: int, vector: np.ndarray, size: int, stride: int) -> int:
+        """
+        Extend the conversation's windows with its next message; returns the window row
+        written. Windows of `size` consecutive messages start every `stride` messages, and
+        the last window always ends at the latest message, moving along as messages arrive
+        until it reaches the next window start.
+        """
+        state = self._states.get(conversation_id)
+        if state is None:
+            state = self._states[conversation_id] = _WindowState(size)
+        state.recent.append(vector)
+        state.count += 1
+        self._message_count += 1
+        if state.tail_row is None:
+            state.tail_row = self._new_window_row(conversation_id)
+        row = state.tail_row
+        # Summed in float64, then normalised
+        self._windows[row] = normalize(np.sum(state.recent, axis=0, dtype=np.float64)[None, :])[0]
+        if state.count >= size and (state.count - size) % stride == 0:
+            state.tail_row = None
+        return row
+
+    def _new_window_row(self, conversation_id: int) -> int:
+        # Grow geometrically so incremental refreshes stay amortised O(new rows)
+        row = self._window_count
+        if row == len(self._window_owners):
+            capacity = max(2 * row, 1024)
+            windows = np.zeros((capacity, EMBEDDING_DIMENSIONS), dtype=np.float32)
+            owners = np.zeros(capacity, dtype=np.int64)
+            windows[:row] = self._windows[:row]
+            owners[:row] = self._window_owners[:row]
+            self._windows, self._window_owners = windows, owners
+        self._window_owners[row] = conversation_id
+        self._window_count += 1
+        return row
+
+    def _reset(self):
+        self._window_count = 0
+        self._states = {}
+        self._dead_windows = 0
+        self._message_count = 0
+        self._last_embedding_id = 0
+
+    def _load_index(self):
+        options = get_search_settings()
+        if options['INDEX'] != 'ivf':
+            return ExactIndex()
+        index = IVFIndex(nlist=options['IVF_NLIST'], nprobe=options['IVF_NPROBE'])
+        path = options['INDEX_PATH']
+        if path and os.path.exists(path):
+            with np.load(path) as data:
+                index.set_centroids(data['centroids'])
+        return index
+
+    def _index_file_changed(self) -> bool:
+        path = get_search_settings()['INDEX_PATH']
+        mtime = os.path.getmtime(path) if path and os.path.exists(path) else None
+        if self._index_loaded and mtime == self._index_mtime:
+            return False
+        self._index_mtime = mtime
+        self._index_loaded = True
+        return True
+
+    def _train_index_if_needed(self):
+        # Without a persisted index, train in-process once there are many windows
+        options = get_search_settings()
+        if isinstance(self._index, IVFIndex) and not self._index.trained \
+                and self._window_count > options['EXACT_SEARCH_THRESHOLD']:
+            self._index.train(self._windows[:self._window_count])
+            self._index.add(self._windows[:self._window_count], 0)
+
+
+embedding_store = EmbeddingStore()
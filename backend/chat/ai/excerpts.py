@@ -0,0 +1,167 @@
+"""
+Excerpts of past messages that match a query.
+
+The query terms are compiled once into a single regex, so a message is scanned in
+one pass whatever the number of terms, and every match comes with its offsets. Most
+messages contain no term: each conversation's text is lowercased once and the terms
+are located in it with substring searches, so the regex only runs over the messages
+that contain one. An excerpt is the window of the message around the densest cluster
+of distinct terms rather than its first characters, and the best excerpts across all
+candidate conversations are kept, stopping as soon as no later message can enter.
+"""
+import heapq
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple
+
+from .text_index import STOP_WORDS, TOKEN_PATTERN
+
+# Joins a conversation's messages for the term search; never part of a query term
+SEPARATOR = '\x00'
+
+
+def query_terms(query: str) -> List[str]:
+    """Lowercase query words without stop words, unless the query has nothing else."""
+    words = TOKEN_PATTERN.findall(query.lower())
+    terms = {word for word in words if word not in STOP_WORDS} or set(words)
+    # Longest first, so in an alternation a term that prefixes another does not shadow it
+    return sorted(terms, key=len, reverse=True)
+
+
+def compile_terms(query: str, flags: int = re.IGNORECASE) -> Optional[Pattern]:
+    """A regex matching any query word at the start of a word; None if the query has no words."""
+    terms = query_terms(query)
+    if not terms:
+        return None
+    return re.compile(rf"\b(?:{'|'.join(re.escape(term) for term in terms)})", flags)
+
+
+def best_window(matches: List[Tuple[int, int, str]], length: int, width: int) -> Tuple[int, int, int]:
+    """
+    (start, end, distinct terms) of the window of at most `width` characters holding the
+    most distinct terms, centred on them. `matches` are (start, end, term) in text order.
+    """
+    best_left, best_right, best_distinct = 0, 0, 0
+    counts: Dict[str, int] = {}
+    left = 0
+    for right, (_, end, term) in enumerate(matches):
+        counts[term] = counts.get(term, 0) + 1
+        while left < right and end - matches[left][0] > width:
+            left_term = matches[left][2]
+            counts[left_term] -= 1
+            if not counts[left_term]:
+                del counts[left_term]
+            left += 1
+        if len(counts) > best_distinct:
+            best_left, best_right, best_distinct = left, right, len(counts)
+
+    span_start, span_end = matches[best_left][0], matches[best_right][1]
+    start = max(0, min(span_start - (width - (span_end - span_start)) // 2, length - width))
+    return start, min(length, start + width), best_distinct
+
+
+class ExcerptExtractor:
+    def __init__(self, query: str, width: int = 200):
+        self.terms = query_terms(query)
+        # Matched against lowercased text: much faster than IGNORECASE in Python's regex engine
+        self.pattern = compile_terms(query, flags=0)
+        self.ignorecase_pattern = compile_terms(query)
+        self.width = width
+
+    def matches(self, content: str) -> List[Tuple[int, int, str]]:
+        """(start, end, term) of every query term in content, in text order."""
+        if self.pattern is None or not content:
+            return []
+        lowered = content.lower()
+        if len(lowered) == len(content):
+            found = self.pattern.finditer(lowered)
+        else:
+            # Lowercasing changed some character's length, so offsets would not line up
+            found = self.ignorecase_pattern.finditer(content)
+        return [(match.start(), match.end(), match.group().lower()) for match in found]
+
+    def excerpt(self, content: str, matches: Optional[List[Tuple[int, int, str]]] = None) -> Optional[Dict]:
+        """The best window of `content` with match offsets relative to it, or None without a match."""
+        if matches is None:
+            matches = self.matches(content)
+        if not matches:
+            return None
+        start, end, _ = best_window(matches, len(content), self.width)
+        return {
+            "content": content[start:end],
+            "matches": [
+                [match_start - start, match_end - start]
+                for match_start, match_end, _ in matches
+                if match_start >= start and match_end <= end
+            ],
+        }
+
+    def matching_messages(self, messages: List[Dict]) -> Iterator[Tuple[Dict, List[Tuple[int, int, str]]]]:
+        """(message, matches) of the messages that contain a query term, in order."""
+        contents = [msg.get('content') or '' for msg in messages]
+        if self.pattern is None or not contents:
+            return
+        lowered = SEPARATOR.join(contents).lower()
+        if len(lowered) != sum(map(len, contents)) + len(contents) - 1 \
+                or lowered.count(SEPARATOR) != len(contents) - 1:
+            # Lowercasing changed some character's length, or a message holds the separator
+            candidates = range(len(messages))
+        else:
+            # Offset of each message in the joined text
+            starts = list(accumulate((len(content) + 1 for content in contents[:-1]), initial=0))
+            matched = set()
+            for term in self.terms:
+                position = lowered.find(term)
+                while position != -1:
+                    index = bisect_right(starts, position) - 1
+                    matched.add(index)
+                    # One hit is enough; carry on from the next message
+                    position = lowered.find(term, starts[index + 1]) if index + 1 < len(starts) else -1
+            candidates = sorted(matched)
+
+        for index in candidates:
+            # A substring hit may sit inside a longer word, which the pattern does not match
+            matches = self.matches(contents[index])
+            if matches:
+                yield messages[index], matches
+
+    def extract(self, conversations: List[Dict], limit: int = 10) -> List[Dict]:
+        """
+        The `limit` best excerpts over all messages of the conversations: messages with
+        the most distinct terms first, then the more relevant conversation, then the
+        earlier message. Windows are only cut for messages that make the selection.
+        """
+        if self.pattern is None:
+            return []
+        hits = (
+            (rank, conv, msg, matches)
+            for rank, conv in enumerate(conversations)
+            for msg, matches in self.matching_messages(conv.get('messages', []))
+        )
+        best = []
+        for order, (rank, conv, msg, matches) in enumerate(hits):
+            key = (len({term for _, _, term in matches}), -rank, -order)
+            if len(best) == limit and key <= best[0][0]:
+                continue
+            entry = (key, conv, msg, self.excerpt(msg.get('content') or '', matches))
+            if len(best) < limit:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heapreplace(best, entry)
+            # Later messages rank lower at an equal number of distinct terms, so once every
+            # kept excerpt has all of them none can enter
+            if len(best) == limit and best[0][0][0] == len(self.terms):
+                break
+
+        return [
+            {
+                "conversation_id": conv.get('id'),
+                "conversation_title": conv.get('title', 'Untitled'),
+                "content": excerpt["content"],
+                "matches": excerpt["matches"],
+                "sender": msg.get('sender'),
+                "timestamp": msg.get('timestamp')
+            }
+            for _, conv, msg, excerpt in sorted(best, key=lambda entry: entry[0], reverse=True)
+        ]
@@ -0,0 +1,197 @@
+"""
+Response cache in front of the analyzer's LLM calls.
+
+Entries are content-addressed: the key is a hash of the model, its temperature and
+the prompt messages, so an identical prompt over unchanged history is answered
+without a round-trip. An entry can be tagged with the conversations it was built
+from. Each conversation has a generation number that is part of the key and is
+bumped whenever one of its messages changes (see chat.signals), so stale entries are
+never read again and age out through TTL and LRU eviction.
+
+The local tier is per process; the Redis tier is shared by all workers.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from langchain.schema import AIMessage
+
+from chat.metrics import metrics
+
+
+def get_cache_settings():
+    options = {
+        'ENABLED': True,
+        'BACKEND': 'local',
+        'REDIS_URL': 'redis://127.0.0.1:6379/1',
+        'KEY_PREFIX': 'llm-cache',
+        'TTL_SECONDS': 24 * 3600,
+        'MAX_ENTRIES': 1000,
+    }
+    options.update(getattr(settings, 'LLM_CACHE', {}))
+    return options
+
+
+class LocalLRUCache:
+    """In-process tier: least recently used entries are evicted beyond max_entries."""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._generations: Dict[int, int] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment('llm_cache.evictions')
+
+    def generations(self, conversation_ids: List[int]) -> List[int]:
+        with self._lock:
+            return [self._generations.get(conv_id, 0) for conv_id in conversation_ids]
+
+    def bump_generations(self, conversation_ids: Iterable[int]):
+        with self._lock:
+            for conv_id in conversation_ids:
+                self._generations[conv_id] = self._generations.get(conv_id, 0) + 1
+
+
+class RedisCache:
+    """Shared tier: Redis expires entries after the TTL; size is bounded by its maxmemory policy."""
+
+    def __init__(self, url: str, prefix: str, ttl: float):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = int(ttl)
+
+    def _generation_key(self, conversation_id: int) -> str:
+        return f"{self.prefix}:generation:{conversation_id}"
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(f"{self.prefix}:{key}")
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str):
+        self.client.set(f"{self.prefix}:{key}", value, ex=self.ttl)
+
+    def generations(self, conversation_ids: List[int]) -> List[int]:
+        if not conversation_ids:
+            return []
+        values = self.client.mget([self._generation_key(conv_id) for conv_id in conversation_ids])
+        return [int(value or 0) for value in values]
+
+    def bump_generations(self, conversation_ids: Iterable[int]):
+        pipeline = self.client.pipeline(transaction=False)
+        for conv_id in conversation_ids:
+            pipeline.incr(self._generation_key(conv_id))
+        pipeline.execute()
+
+
+class LLMResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def key(self, llm, messages, conversation_ids: List[int]) -> str:
+        payload = {
+            'model': getattr(llm, 'model_name', None) or type(llm).__name__,
+            'temperature': getattr(llm, 'temperature', None),
+            'messages': [(message.type, message.content) for message in messages],
+            'generations': list(zip(conversation_ids, self.backend.generations(conversation_ids))),
+        }
+        return hashlib.sha256(json.dumps(payload, default=str).encode()).hexdigest()
+
+    def invoke(self, llm, messages, conversation_ids: Iterable[int] = ()):
+        """llm.invoke(messages), answered from the cache when the same prompt was seen before."""
+        key, cached = self._lookup(llm, messages, conversation_ids)
+        if cached is not None:
+            return AIMessage(content=cached)
+
+        response = llm.invoke(messages)
+        self._store(key, response.content)
+        return response
+
+    def stream(self, llm, messages, conversation_ids: Iterable[int] = ()) -> Iterator[str]:
+        """Text pieces of llm.stream(messages); a cached reply is yielded as a single piece."""
+        key, cached = self._lookup(llm, messages, conversation_ids)
+        if cached is not None:
+            yield cached
+            return
+
+        pieces = []
+        for chunk in llm.stream(messages):
+            pieces.append(chunk.content)
+            yield chunk.content
+        self._store(key, "".join(pieces))
+
+    def _lookup(self, llm, messages, conversation_ids: Iterable[int]) -> Tuple[Optional[str], Optional[str]]:
+        """(key, cached reply); the key is None when the backend cannot be reached."""
+        conversation_ids = sorted({conv_id for conv_id in conversation_ids if conv_id is not None})
+        try:
+            key = self.key(llm, messages, conversation_ids)
+            cached = self.backend.get(key)
+        except Exception as e:
+            metrics.increment('llm_cache.errors')
+            print(f"Warning: LLM cache unavailable: {e}")
+            return None, None
+        metrics.increment('llm_cache.hits' if cached is not None else 'llm_cache.misses')
+        return key, cached
+
+    def _store(self, key: Optional[str], value: str):
+        if key is None:
+            return
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            metrics.increment('llm_cache.errors')
+            print(f"Warning: Could not store LLM response: {e}")
+
+    def invalidate_conversations(self, conversation_ids: Iterable[int]):
+        """Make every entry built from these conversations unreachable."""
+        try:
+            self.backend.bump_generations(set(conversation_ids))
+        except Exception as e:
+            metrics.increment('llm_cache.errors')
+            print(f"Warning: Could not invalidate LLM cache: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """The configured process-wide response cache, or None when caching is disabled."""
+    global _cache
+    options = get_cache_settings()
+    if not options['ENABLED']:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if options['BACKEND'] == 'redis':
+                    backend = RedisCache(options['REDIS_URL'], options['KEY_PREFIX'], options['TTL_SECONDS'])
+                else:
+                    backend = LocalLRUCache(options['MAX_ENTRIES'], options['TTL_SECONDS'])
+                _cache = LLMResponseCache(backend)
+    return _cache
@@ -0,0 +1,276 @@
+"""
+Keyword search over messages and conversations.
+
+On PostgreSQL the `search_vector` columns (kept current by triggers, see migration
+0013) are queried through GIN indexes. Other databases, such as SQLite in tests and
+local development, use an in-process BM25 inverted index that is built from the
+database on first use and updated incrementally from chat.signals as changes commit.
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, List, Optional
+
+from django.db import connection
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+STOP_WORDS = frozenset("""
+a about an and are as at be but by did do does for from had has have how i in is it
+its me my of on or our so that the their them then there these they this to was we
+were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stop words removed."""
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+class BM25Corpus:
+    """Inverted index with Okapi BM25 scoring over documents that belong to a conversation."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_terms: Dict[int, Counter] = {}
+        self.doc_length: Dict[int, int] = {}
+        self.doc_conversation: Dict[int, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: int, conversation_id: int, text: str):
+        self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.postings[term][doc_id] = frequency
+        self.doc_terms[doc_id] = terms
+        self.doc_length[doc_id] = sum(terms.values())
+        self.doc_conversation[doc_id] = conversation_id
+        self.total_length += self.doc_length[doc_id]
+
+    def remove(self, doc_id: int):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+        del self.doc_conversation[doc_id]
+        self.total_length -= self.doc_length.pop(doc_id)
+
+    def expand(self, terms: List[str], prefix: bool) -> List[List[str]]:
+        """Each query term with the vocabulary terms it matches."""
+        if not prefix:
+            return [[term] for term in terms]
+        return [[word for word in self.postings if word.startswith(term)] for term in terms]
+
+    def score(self, terms: List[str], prefix: bool = False) -> Dict[int, float]:
+        """BM25 score per document for documents matching any of the terms."""
+        doc_count = len(self.doc_terms)
+        if not doc_count:
+            return {}
+        average_length = self.total_length / doc_count or 1.0
+
+        scores: Dict[int, float] = defaultdict(float)
+        for alternatives in self.expand(terms, prefix):
+            for term in alternatives:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self.doc_length[doc_id]
+                    norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / norm
+        return scores
+
+    def matching_all(self, terms: List[str], prefix: bool = False) -> set:
+        """Documents that contain every term (or a word starting with it, when prefix is set)."""
+        matches = None
+        for alternatives in self.expand(terms, prefix):
+            docs = set()
+            for term in alternatives:
+                docs.update(self.postings.get(term, ()))
+            matches = docs if matches is None else matches & docs
+        return matches or set()
+
+    def conversations_with(self, term: str) -> set:
+        """Conversations with a document containing the term."""
+        return {self.doc_conversation[doc_id] for doc_id in self.postings.get(term, ())}
+
+
+class InProcessTextIndex:
+    """BM25 over message contents and conversation titles/summaries, held in memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.messages = BM25Corpus()
+        self.conversations = BM25Corpus()
+
+    def _ensure_loaded(self):
+        from chat.models import Conversation, Message
+
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for conv_id, title, summary in Conversation.objects.values_list('id', 'title', 'summary').iterator():
+                self.conversations.add(conv_id, conv_id, f"{title or ''} {summary or ''}")
+            for msg_id, conv_id, content in Message.objects.values_list('id', 'conversation_id', 'content').iterator():
+                self.messages.add(msg_id, conv_id, content)
+            self._loaded = True
+
+    def add_messages(self, messages: Iterable):
+        if not self._loaded:
+            return
+        with self._lock:
+            for message in messages:
+                self.messages.add(message.id, message.conversation_id, message.content)
+
+    def remove_message(self, message_id: int):
+        if self._loaded:
+            with self._lock:
+                self.messages.remove(message_id)
+
+    def update_conversation(self, conversation):
+        if self._loaded:
+            with self._lock:
+                self.conversations.add(
+                    conversation.id, conversation.id, f"{conversation.title or ''} {conversation.summary or ''}"
+                )
+
+    def remove_conversation(self, conversation_id: int):
+        if self._loaded:
+            with self._lock:
+                self.conversations.remove(conversation_id)
+
+    def score_conversations(self, query: str, conversation_ids: Optional[List[int]] = None) -> Dict[int, float]:
+        """Relevance per conversation: BM25 of its title/summary plus that of its messages."""
+        self._ensure_loaded()
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        allowed = set(conversation_ids) if conversation_ids is not None else None
+
+        totals: Dict[int, float] = defaultdict(float)
+        with self._lock:
+            for corpus in (self.conversations, self.messages):
+                for doc_id, score in corpus.score(terms).items():
+                    conv_id = corpus.doc_conversation[doc_id]
+                    if allowed is None or conv_id in allowed:
+                        totals[conv_id] += score
+        return dict(totals)
+
+    def search_conversations(self, queryset, query: str):
+        """Restrict a Conversation queryset to titles/summaries matching every query word (prefix match)."""
+        self._ensure_loaded()
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+        with self._lock:
+            ids = self.conversations.matching_all(terms, prefix=True)
+        return queryset.filter(id__in=ids)
+
+    def filter_by_keywords(self, queryset, keywords: List[str]):
+        """Restrict a Conversation queryset to conversations whose title, summary or messages contain every keyword."""
+        self._ensure_loaded()
+        terms = tokenize(' '.join(keywords))
+        if not terms:
+            return queryset
+        ids = None
+        with self._lock:
+            for term in terms:
+                matching = self.conversations.conversations_with(term) | self.messages.conversations_with(term)
+                ids = matching if ids is None else ids & matching
+        return queryset.filter(id__in=ids)
+
+
+class PostgresTextIndex:
+    """Full-text search through the tsvector columns and their GIN indexes."""
+
+    def add_messages(self, messages: Iterable):
+        pass  # maintained by database triggers
+
+    def remove_message(self, message_id: int):
+        pass
+
+    def update_conversation(self, conversation):
+        pass
+
+    def remove_conversation(self, conversation_id: int):
+        pass
+
+    @staticmethod
+    def _any_term_query(terms: List[str]):
+        from django.contrib.postgres.search import SearchQuery
+
+        return reduce(or_, [SearchQuery(term, config='english') for term in terms])
+
+    def score_conversations(self, query: str, conversation_ids: Optional[List[int]] = None) -> Dict[int, float]:
+        from django.contrib.postgres.search import SearchRank
+        from django.db.models import F, Sum
+
+        from chat.models import Conversation, Message
+
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        search_query = self._any_term_query(terms)
+
+        totals: Dict[int, float] = defaultdict(float)
+        for model, conversation_field in ((Conversation, 'id'), (Message, 'conversation_id')):
+            queryset = model.objects.filter(search_vector=search_query)
+            if conversation_ids is not None:
+                queryset = queryset.filter(**{f'{conversation_field}__in': conversation_ids})
+            rows = (
+                queryset.order_by()
+                .values(conversation_field)
+                .annotate(score=Sum(SearchRank(F('search_vector'), search_query)))
+                .values_list(conversation_field, 'score')
+            )
+            for conv_id, score in rows:
+                totals[conv_id] += score
+        return dict(totals)
+
+    def search_conversations(self, queryset, query: str):
+        from django.contrib.postgres.search import SearchQuery
+
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+        # Prefix match every word so partially typed searches still find titles
+        raw_query = ' & '.join(f"{term}:*" for term in terms)
+        return queryset.filter(search_vector=SearchQuery(raw_query, search_type='raw', config='english'))
+
+    def filter_by_keywords(self, queryset, keywords: List[str]):
+        from django.contrib.postgres.search import SearchQuery
+        from django.db.models import Exists, OuterRef, Q
+
+        from chat.models import Message
+
+        for term in tokenize(' '.join(keywords)):
+            search_query = SearchQuery(term, config='english')
+            queryset = queryset.filter(
+                Q(search_vector=search_query)
+                | Exists(Message.objects.filter(conversation=OuterRef('pk'), search_vector=search_query))
+            )
+        return queryset
+
+
+_in_process_index = InProcessTextIndex()
+_postgres_index = PostgresTextIndex()
+
+
+def get_text_index():
+    """The text index implementation for the configured database."""
+    if connection.vendor == 'postgresql':
+        return _postgres_index
+    return _in_process_index
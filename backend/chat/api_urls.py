@@ -1,6 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import ChatViewSet, AgentViewSet, ConversationViewSet, ConversationQueryView
+from .views import (
+    ChatViewSet, AgentViewSet, ConversationViewSet, ConversationQueryView, ConversationQueryStreamView,
+    AnalyticsOverviewView, MetricsView
+)
 
 router = DefaultRouter()
 router.register(r'chats', ChatViewSet)
@@ -10,5 +13,8 @@ router.register(r'conversations', ConversationViewSet, basename='conversation')
 urlpatterns = [
     # Put explicit paths before router to avoid conflicts
     path('conversations/query/', ConversationQueryView.as_view(), name='conversation-query'),
+    path('conversations/query/stream/', ConversationQueryStreamView.as_view(), name='conversation-query-stream'),
+    path('analytics/', AnalyticsOverviewView.as_view(), name='analytics-overview'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
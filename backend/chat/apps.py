@@ -1,6 +1,28 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if getattr(settings, 'CONVERSATION_ANALYZER_WARMUP', False):
+            from .ai.conversation_analyzer import warm_up
+
+            # Load in the background so process start-up is not delayed
+            threading.Thread(target=warm_up, name='analyzer-warm-up', daemon=True).start()
+
+        if getattr(settings, 'AGENT_POOL', {}).get('WARM_UP'):
+            threading.Thread(target=_warm_up_agent_pool, name='agent-pool-warm-up', daemon=True).start()
+
+
+def _warm_up_agent_pool():
+    # Imported here: the agent modules call django.setup(), which has to wait for ready() to finish
+    from .agents.agent_pool import warm_up
+
+    warm_up()
@@ -3,7 +3,7 @@ import os
 
 import django
 
-from chat.agents.agent_factory import AgentFactory
+from chat.agents.agent_pool import CHAT_TOOL_NAMES, get_agent_pool
 from chat.agents.callbacks import AsyncStreamingCallbackHandler
 from chat.messages.chat_message_repository import ChatMessageRepository
 
@@ -13,7 +13,9 @@ django.setup()
 from channels.generic.websocket import AsyncWebsocketConsumer
 from langchain.agents import AgentExecutor
 
+from chat.metrics import metrics
 from chat.models import MessageSender
+from chat.tasks import conversation_group_name
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -22,25 +24,45 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.agent_factory = AgentFactory()
+        self.agent_pool = get_agent_pool(CHAT_TOOL_NAMES)
+        self.agent = None
         self.chat_message_repository = ChatMessageRepository()
+        self.conversation_group = None
 
     async def connect(self):
+        with metrics.timer('consumer.connect'):
+            await self._connect()
+
+    async def _connect(self):
         # Get the conversation_id from the client (URL parameter is chat_id for backward compatibility)
         conversation_id = self.scope['url_route']['kwargs'].get('chat_id')
 
-        # Create the agent when the websocket connection with the client is established
-        self.agent = await self.agent_factory.create_agent(
-            tool_names=["llm-math"],
-            conversation_id=conversation_id,
-            streaming=True,
-            callback_handlers=[AsyncStreamingCallbackHandler(self)],
-        )
+        # Subscribe to conversation events such as a finished background summary
+        if conversation_id and self.channel_layer is not None:
+            self.conversation_group = conversation_group_name(conversation_id)
+            await self.channel_layer.group_add(self.conversation_group, self.channel_name)
+
+        # Check out an agent when the websocket connection with the client is established;
+        # streaming callbacks are passed per run in message_agent
+        self.agent = await self.agent_pool.acquire(conversation_id)
 
         await self.accept()
 
     async def disconnect(self, close_code):
-        pass
+        if self.agent is not None:
+            self.agent_pool.release(self.agent)
+            self.agent = None
+        if self.conversation_group:
+            await self.channel_layer.group_discard(self.conversation_group, self.channel_name)
+
+    async def summary_ready(self, event):
+        # Sent by chat.tasks when the background summary job finishes
+        await self.send(text_data=json.dumps({
+            'type': 'summary',
+            'conversation_id': event['conversation_id'],
+            'message': event['summary'],
+            'summary_status': event['summary_status'],
+        }))
 
     async def receive(self, text_data):
         try:
@@ -65,8 +87,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def message_agent(self, message: str, conversation_id: str):
         try:
-            # Save the user message to the database
-            await self.chat_message_repository.save_message(message=message, sender=MessageSender.USER.value, conversation_id=conversation_id)
+            # Queue the user message for the database; the turn does not wait for the insert
+            await self.chat_message_repository.queue_message(message=message, sender=MessageSender.USER.value, conversation_id=conversation_id)
 
             # Call the agent with callbacks
             print(f"Calling agent with message: {message}")
@@ -74,9 +96,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             response = await self.agent.arun(message, callbacks=[callback_handler])
             print(f"Agent response: {response}")
 
-            # Save the AI message to the database
+            # Queue the AI message for the database
             if response:
-                await self.chat_message_repository.save_message(message=response, sender=MessageSender.AI.value, conversation_id=conversation_id)
+                await self.chat_message_repository.queue_message(message=response, sender=MessageSender.AI.value, conversation_id=conversation_id)
 
             return response
         except Exception as e:
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.metrics import metrics
+from chat.models import Conversation, ConversationStatus
+from chat.summaries import analyze_conversation, pending_chunk_count, store_conversation_analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract and store sentiment, topic tags and action items for ended conversations that have "
+        "a summary but were never analysed, e.g. conversations ended before migration 0017, when the "
+        "summary job started storing analytics. Each conversation costs one LLM call for the analysis, "
+        "plus one per CHUNK_MESSAGES messages not yet covered by a window summary (all of them for "
+        "conversations ended before migration 0015), plus four more if the analysis reply cannot be "
+        "parsed; the calls made are reported. Summaries are kept; a failure is reported and skipped, so "
+        "running the command again retries only what is still missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Analyse conversations that already have analytics too.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many conversations.")
+        parser.add_argument(
+            '--max-chunks', type=int, default=None,
+            help="Skip conversations that need more than this many window summaries first.",
+        )
+
+    def handle(self, *args, **options):
+        conversations = (
+            Conversation.objects.filter(status=ConversationStatus.ENDED.value)
+            .exclude(summary__isnull=True).exclude(summary='')
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        if not options['all']:
+            conversations = conversations.filter(analyzed_at__isnull=True)
+        if options['limit'] is not None:
+            conversations = conversations[:options['limit']]
+
+        started = time.perf_counter()
+        analysed = failed = skipped = windows = fallbacks = 0
+        # Ids only, read up front: no cursor stays open across the LLM calls
+        for conversation_id in list(conversations):
+            pending = pending_chunk_count(conversation_id)
+            if options['max_chunks'] is not None and pending > options['max_chunks']:
+                skipped += 1
+                self.stdout.write(f"Skipped conversation {conversation_id}: {pending} windows to summarise first")
+                continue
+            fallbacks_before = self._fallbacks()
+            try:
+                store_conversation_analytics(conversation_id, analyze_conversation(conversation_id))
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Could not analyse conversation {conversation_id}: {e}")
+                continue
+            finally:
+                windows += pending
+                fallbacks += self._fallbacks() - fallbacks_before
+            analysed += 1
+
+        elapsed = time.perf_counter() - started
+        # A fallback makes four calls after the failed combined one
+        calls = windows + analysed + failed + 4 * fallbacks
+        self.stdout.write(self.style.SUCCESS(
+            f"Analysed {analysed} conversations in {elapsed:.1f}s ({failed} failed, {skipped} skipped) "
+            f"with about {calls} LLM calls: {windows} window summaries, {fallbacks} fallbacks to separate calls"
+        ))
+
+    @staticmethod
+    def _fallbacks() -> int:
+        return metrics.snapshot()['counters'].get('analyzer.analyze_all.fallback', 0)
@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.ai import embeddings
+from chat.ai.embeddings import encode_texts, init_encoder_process
+from chat.models import Message, MessageEmbedding
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed every message that has no stored vector. Messages are streamed in id order, "
+        "encoded in large batches across a pool of processes and written in bulk; progress is "
+        "checkpointed after each written batch, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Encoder processes; 0 encodes in this process.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1024, help="Messages per encoding task and bulk insert.")
+        parser.add_argument('--encode-batch-size', type=int, default=64, help="Batch size passed to the model.")
+        parser.add_argument('--fetch-size', type=int, default=5000, help="Rows fetched per database round trip.")
+        parser.add_argument(
+            '--checkpoint', default=os.path.join(settings.BASE_DIR, 'var', 'embedding_backfill.json'),
+            help="File recording the last message id written.",
+        )
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start from the first message.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many messages.")
+
+    def handle(self, *args, **options):
+        if not embeddings.EMBEDDINGS_AVAILABLE:
+            raise CommandError("sentence-transformers is not installed; nothing can be encoded.")
+
+        checkpoint_path = options['checkpoint']
+        start_after = 0 if options['restart'] else self._read_checkpoint(checkpoint_path)
+        if start_after:
+            self.stdout.write(f"Resuming after message {start_after}")
+
+        rows = (
+            Message.objects.filter(id__gt=start_after, embedding__isnull=True)
+            .order_by('id')
+            .values_list('id', 'conversation_id', 'content')
+        )
+        if options['limit'] is not None:
+            rows = rows[:options['limit']]
+        # A server-side cursor on PostgreSQL, so memory stays flat however many rows there are
+        batches = self._batches(rows.iterator(chunk_size=options['fetch_size']), options['batch_size'])
+
+        workers = options['workers']
+        pool = None
+        if workers > 0:
+            # Spawned workers never inherit this process's database connection; each pins its
+            # torch threads so the workers do not oversubscribe the CPUs between them
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_encoder_process,
+                initargs=(threads,),
+            )
+
+        def submit(texts) -> Future:
+            if pool is not None:
+                return pool.submit(encode_texts, texts, options['encode_batch_size'])
+            future = Future()
+            future.set_result(encode_texts(texts, options['encode_batch_size']))
+            return future
+
+        started = last_report = time.perf_counter()
+        written = 0
+        # Results are written in submission order, so the checkpoint only ever moves forward
+        in_flight = deque()
+        try:
+            for batch, last_id in batches:
+                in_flight.append((batch, last_id, submit([content for _, _, content in batch])))
+                if len(in_flight) > 2 * max(workers, 1):
+                    written += self._write(*in_flight.popleft(), checkpoint_path)
+                if time.perf_counter() - last_report >= 10:
+                    last_report = time.perf_counter()
+                    self._report(written, last_report - started)
+            while in_flight:
+                written += self._write(*in_flight.popleft(), checkpoint_path)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedded {written} messages in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} messages/s)"
+        ))
+
+    @staticmethod
+    def _batches(rows, batch_size):
+        """(rows with content, last message id) pairs; empty messages only move the checkpoint."""
+        batch, last_id = [], None
+        for message_id, conversation_id, content in rows:
+            last_id = message_id
+            if content:
+                batch.append((message_id, conversation_id, content))
+            if len(batch) == batch_size:
+                yield batch, last_id
+                batch = []
+        if last_id is not None:
+            yield batch, last_id
+
+    def _write(self, batch, last_id, future, checkpoint_path) -> int:
+        if batch:
+            vectors = future.result()
+            if vectors is None:
+                raise CommandError("Could not load the embedding model.")
+            MessageEmbedding.objects.bulk_create(
+                [
+                    MessageEmbedding(message_id=message_id, conversation_id=conversation_id, vector=vector.tobytes())
+                    for (message_id, conversation_id, _), vector in zip(batch, vectors)
+                ],
+                batch_size=1000,
+                # Messages saved meanwhile are embedded by chat.signals too
+                ignore_conflicts=True,
+            )
+        self._write_checkpoint(checkpoint_path, last_id)
+        return len(batch)
+
+    def _report(self, written, elapsed):
+        self.stdout.write(f"{written} messages embedded, {written / elapsed:.0f} messages/s")
+
+    @staticmethod
+    def _read_checkpoint(path) -> int:
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return int(json.load(f)['last_message_id'])
+
+    @staticmethod
+    def _write_checkpoint(path, last_id):
+        # Written atomically so an interrupted run never leaves a truncated file
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_message_id': last_id}, f)
+        os.replace(tmp_path, path)
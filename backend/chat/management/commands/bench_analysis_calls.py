@@ -0,0 +1,97 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from langchain.schema import AIMessage
+
+from chat.ai.conversation_analyzer import ConversationAnalyzer
+
+
+class FakeLLM:
+    """
+    Stand-in for the chat model: sleeps like a remote call whose cost grows with the
+    prompt, and records how many calls and prompt tokens it was sent.
+    """
+
+    def __init__(self, base_latency: float, seconds_per_token: float):
+        self.base_latency = base_latency
+        self.seconds_per_token = seconds_per_token
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def invoke(self, messages):
+        # Roughly four characters per token for English text
+        tokens = sum(len(message.content) for message in messages) // 4
+        self.calls += 1
+        self.prompt_tokens += tokens
+        time.sleep(self.base_latency + tokens * self.seconds_per_token)
+
+        if '"action_items"' in messages[0].content:
+            return AIMessage(content=json.dumps({
+                "summary": "The user and the assistant planned the release.",
+                "sentiment": "positive",
+                "tone": "professional",
+                "confidence": 0.8,
+                "topics": ["release", "testing"],
+                "action_items": ["Tag the release"],
+            }))
+        return AIMessage(content='{"sentiment": "positive", "tone": "professional", "confidence": 0.8}')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the four individual analysis calls with the combined analyze_all call "
+        "against a fake LLM, reporting latency, LLM calls and prompt tokens."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=40, help="Messages per conversation.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--base-latency-ms', type=float, default=150.0, help="Fixed cost of one LLM call.")
+        parser.add_argument('--ms-per-1k-tokens', type=float, default=20.0, help="Prompt processing cost.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = "release test deploy budget schedule review design customer bug feature meeting".split()
+        messages = [
+            {
+                'sender': 'USER' if i % 2 == 0 else 'AI',
+                'content': ' '.join(rng.choice(words) for _ in range(rng.randint(10, 40))),
+                'timestamp': f"2024-01-01T10:{i % 60:02d}:00",
+            }
+            for i in range(options['messages'])
+        ]
+
+        def separate(analyzer):
+            analyzer.generate_summary(messages)
+            analyzer.analyze_sentiment(messages)
+            analyzer.extract_topics(messages)
+            analyzer.extract_action_items(messages)
+
+        def combined(analyzer):
+            analyzer.analyze_all(messages)
+
+        results = {}
+        for name, run in (('individual calls', separate), ('analyze_all', combined)):
+            llm = FakeLLM(options['base_latency_ms'] / 1000, options['ms_per_1k_tokens'] / 1000 / 1000)
+            analyzer = ConversationAnalyzer(llm=llm)
+            analyzer.cache = None  # measure uncached calls
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                run(analyzer)
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), llm.calls / options['repeat'], llm.prompt_tokens / options['repeat'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Full analysis of a {options['messages']}-message conversation (per analysis)"
+        ))
+        for name, (latency, calls, tokens) in results.items():
+            self.stdout.write(f"{name:<18} median={latency:8.1f}ms  llm_calls={calls:4.1f}  prompt_tokens={tokens:8.0f}")
+        before, after = results['individual calls'], results['analyze_all']
+        self.stdout.write(
+            f"latency x{before[0] / after[0]:.2f} faster, prompt tokens x{before[2] / after[2]:.2f} fewer"
+        )
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from chat.ai.ann import IVFIndex, top_k
+from chat.ai.embeddings import EMBEDDING_DIMENSIONS, normalize
+
+
+class Command(BaseCommand):
+    help = "Benchmark recall and latency of the IVF index against exact search on synthetic embeddings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--nlist', type=int, default=0)
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+        parser.add_argument('--noise', type=float, default=0.05, help="Spread of vectors around their topic.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+
+        # Clustered data is closer to real sentence embeddings than uniform noise
+        topics = normalize(rng.standard_normal((512, EMBEDDING_DIMENSIONS)).astype(np.float32))
+        owners = rng.integers(0, len(topics), options['vectors'])
+        noise = rng.standard_normal((options['vectors'], EMBEDDING_DIMENSIONS)).astype(np.float32)
+        vectors = normalize(topics[owners] + options['noise'] * noise)
+        # Queries sit between two topics, the hard case for cluster-based pruning
+        mixed = topics[rng.integers(0, len(topics), options['queries'])] \
+            + 0.7 * topics[rng.integers(0, len(topics), options['queries'])]
+        queries = normalize(
+            mixed + options['noise'] * rng.standard_normal((options['queries'], EMBEDDING_DIMENSIONS)).astype(np.float32)
+        )
+
+        exact_results, exact_latencies = [], []
+        for query in queries:
+            started = time.perf_counter()
+            exact_results.append(set(top_k(vectors @ query, k).tolist()))
+            exact_latencies.append(time.perf_counter() - started)
+        self._report('exact', 1.0, exact_latencies)
+
+        index = IVFIndex(nlist=options['nlist'])
+        started = time.perf_counter()
+        index.train(vectors)
+        index.add(vectors, 0)
+        self.stdout.write(f"IVF build: {index.nlist} clusters in {time.perf_counter() - started:.2f}s")
+
+        for nprobe in options['nprobe']:
+            index.nprobe = nprobe
+            hits, latencies = 0, []
+            for query, expected in zip(queries, exact_results):
+                started = time.perf_counter()
+                rows = index.candidate_rows(query, len(vectors))
+                found = rows[top_k(vectors[rows] @ query, k)]
+                latencies.append(time.perf_counter() - started)
+                hits += len(expected.intersection(found.tolist()))
+            self._report(f"ivf nprobe={nprobe}", hits / (k * len(queries)), latencies)
+
+    def _report(self, label, recall, latencies):
+        latencies_ms = np.array(latencies) * 1000
+        self.stdout.write(
+            f"{label:<16} recall@k={recall:.3f}  "
+            f"mean={latencies_ms.mean():.2f}ms  p95={np.percentile(latencies_ms, 95):.2f}ms"
+        )
@@ -0,0 +1,113 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chat.models import Conversation, ConversationStatus, Message, MessageSender
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed conversations/messages inside a transaction and compare query plans and latency "
+        "with and without the conversation/message indexes. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=2000)
+        parser.add_argument('--messages-per-conversation', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            target = self._seed(rng, options['conversations'], options['messages_per_conversation'])
+            self._analyze()
+            queries = self._queries(target)
+
+            self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+            after = self._run(queries, options['repeat'])
+
+            self._drop_indexes()
+            self._analyze()
+            self.stdout.write(self.style.MIGRATE_HEADING("Without indexes (FK index only)"))
+            before = self._run(queries, options['repeat'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Summary (median ms)"))
+            for name in queries:
+                self.stdout.write(f"{name:<34} before={before[name]:8.2f}  after={after[name]:8.2f}")
+
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, conversation_count, messages_per_conversation):
+        started = time.perf_counter()
+        statuses = [ConversationStatus.ACTIVE.value, ConversationStatus.ENDED.value]
+        conversations = Conversation.objects.bulk_create(
+            [
+                Conversation(title=f"Benchmark conversation {i}", status=rng.choice(statuses))
+                for i in range(conversation_count)
+            ],
+            batch_size=1000,
+        )
+        senders = [MessageSender.USER.value, MessageSender.AI.value]
+        batch = []
+        for conversation in conversations:
+            for i in range(messages_per_conversation):
+                batch.append(Message(conversation=conversation, content=f"message {i}", sender=senders[i % 2]))
+            if len(batch) >= 5000:
+                Message.objects.bulk_create(batch, batch_size=5000)
+                batch = []
+        Message.objects.bulk_create(batch, batch_size=5000)
+
+        self.stdout.write(
+            f"Seeded {conversation_count} conversations / {conversation_count * messages_per_conversation} "
+            f"messages in {time.perf_counter() - started:.1f}s"
+        )
+        return conversations[len(conversations) // 2]
+
+    def _queries(self, target):
+        since = target.start_timestamp - timedelta(seconds=1)
+        return {
+            'conversation history': lambda: Message.objects.filter(conversation_id=target.id).order_by('timestamp', 'id'),
+            'latest message page': lambda: Message.objects.filter(conversation_id=target.id).order_by('-timestamp', '-id')[:50],
+            'conversations by status and date': lambda: Conversation.objects.filter(
+                status=ConversationStatus.ENDED.value, start_timestamp__gte=since, start_timestamp__lte=timezone.now()
+            ),
+            'conversation list page': lambda: Conversation.objects.order_by('-created_at', '-id')[:50],
+        }
+
+    def _run(self, queries, repeat):
+        medians = {}
+        explain_options = {'analyze': True} if connection.vendor == 'postgresql' else {}
+        for name, build in queries.items():
+            self.stdout.write(self.style.SUCCESS(name))
+            self.stdout.write(build().explain(**explain_options))
+            list(build())  # warm the cache so both phases are measured hot
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(build())
+                timings.append((time.perf_counter() - started) * 1000)
+            medians[name] = statistics.median(timings)
+            self.stdout.write(f"median {medians[name]:.2f}ms over {repeat} runs\n")
+        return medians
+
+    def _drop_indexes(self):
+        with connection.cursor() as cursor:
+            for model in (Conversation, Message):
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+            # Restore the single-column FK index the composite index replaced
+            cursor.execute(
+                f"CREATE INDEX bench_message_conversation_id ON {connection.ops.quote_name(Message._meta.db_table)} "
+                f"(conversation_id)"
+            )
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from django.core.management.base import BaseCommand
+
+from chat.ai.excerpts import ExcerptExtractor, query_terms
+
+WORDS = (
+    "the release is scheduled after review of design and budget we discussed customer feedback "
+    "on the new dashboard while the team planned hiring interviews for next quarter"
+).split()
+RARE_WORDS = "audit pentest vulnerability compliance".split()
+
+
+def substring_excerpts(query: str, conversations: List[Dict]) -> List[Dict]:
+    """The previous implementation: substring test per query word, first 200 characters."""
+    excerpts = []
+    query_lower = query.lower()
+
+    for conv in conversations:
+        for msg in conv.get('messages', []):
+            content = msg.get('content', '').lower()
+            if any(word in content for word in query_lower.split()):
+                excerpts.append({
+                    "conversation_id": conv.get('id'),
+                    "conversation_title": conv.get('title', 'Untitled'),
+                    "content": msg.get('content', '')[:200],
+                    "sender": msg.get('sender'),
+                    "timestamp": msg.get('timestamp')
+                })
+                if len(excerpts) >= 10:
+                    break
+
+    return excerpts[:10]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the excerpt engine with the previous substring-based extraction over generated "
+        "conversations, reporting latency and how many excerpts actually show a query term."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=500)
+        parser.add_argument('--messages-per-conversation', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        conversations = []
+        for conv_id in range(options['conversations']):
+            messages = []
+            for i in range(options['messages_per_conversation']):
+                words = [rng.choice(WORDS) for _ in range(rng.randint(20, 120))]
+                if rng.random() < 0.05:
+                    # Query terms late in long messages, past a 200 character prefix
+                    words.insert(rng.randint(len(words) // 2, len(words)), rng.choice(RARE_WORDS))
+                messages.append({'content': ' '.join(words), 'sender': 'USER', 'timestamp': f"2024-01-01T10:{i % 60:02d}:00"})
+            conversations.append({'id': conv_id, 'title': f"Conversation {conv_id}", 'messages': messages})
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Excerpts over {options['conversations'] * options['messages_per_conversation']} messages"
+        ))
+        # The previous implementation stops after 10 matching messages, which a question
+        # full of common words reaches at once; a query of rare terms makes it scan everything.
+        # The engine stops early once ten messages hold every term of the query.
+        for query in ("what came out of the security audit and the pentest", "audit pentest", "budget review"):
+            terms = query_terms(query)
+            self.stdout.write(self.style.SUCCESS(f"query: {query!r}"))
+            engines = {
+                'substring': lambda: substring_excerpts(query, conversations),
+                'excerpt engine': lambda: ExcerptExtractor(query).extract(conversations),
+            }
+            for name, run in engines.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    excerpts = run()
+                    timings.append((time.perf_counter() - started) * 1000)
+                showing_term = sum(
+                    1 for excerpt in excerpts if any(term in excerpt['content'].lower() for term in terms)
+                )
+                self.stdout.write(
+                    f"{name:<15} median={statistics.median(timings):8.1f}ms  excerpts={len(excerpts):3d}  "
+                    f"showing a query term={showing_term:3d}"
+                )
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from chat.messages import known_conversations
+from chat.messages.chat_message_repository import ChatMessageRepository
+from chat.models import Conversation, Message, MessageSender
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure messages/second and queries per message for saving chat messages, reading "
+        "the conversation first versus inserting by id. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--conversations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repository = ChatMessageRepository()
+        count = options['messages']
+
+        def lookup_then_insert(conversation_id, content):
+            conversation = Conversation.objects.get(pk=conversation_id)
+            Message.objects.create(sender=MessageSender.USER.value, content=content, conversation=conversation)
+
+        def insert_by_id(conversation_id, content):
+            repository.insert_message(content, MessageSender.USER.value, conversation_id)
+
+        results = {}
+        with transaction.atomic():
+            conversations = Conversation.objects.bulk_create(
+                [Conversation(title=f"Benchmark conversation {i}") for i in range(options['conversations'])]
+            )
+            # As after the conversations were created through the API and committed
+            known_conversations.remember(conversation.id for conversation in conversations)
+
+            for name, save in (('lookup + insert', lookup_then_insert), ('insert by id', insert_by_id)):
+                queries = []
+
+                def count_query(execute, sql, params, many, context):
+                    queries.append(sql)
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(count_query):
+                    started = time.perf_counter()
+                    for i in range(count):
+                        save(conversations[i % len(conversations)].id, f"message {i}")
+                    elapsed = time.perf_counter() - started
+                results[name] = (count / elapsed, len(queries) / count)
+
+            transaction.set_rollback(True)
+        known_conversations.forget(conversation.id for conversation in conversations)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{count} messages over {options['conversations']} conversations ({connection.vendor})"
+        ))
+        for name, (rate, queries) in results.items():
+            self.stdout.write(f"{name:<16} {rate:10.0f} messages/s  {queries:4.1f} queries/message")
+        before, after = results['lookup + insert'], results['insert by id']
+        self.stdout.write(f"x{after[0] / before[0]:.2f} messages/s, {before[1] - after[1]:.1f} fewer queries per message")
@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from chat.ai.conversation_analyzer import ConversationAnalyzer
+from chat.models import Conversation, ConversationTopic, Message, MessageSender
+from chat.views import ConversationQueryView, load_conversations_data
+
+TOPICS = ["release planning", "budget", "hiring", "customer support", "security", "roadmap", "infrastructure", "design"]
+WORDS = (
+    "release deploy budget forecast hiring interview customer ticket security roadmap "
+    "server database design mockup meeting schedule review feedback launch"
+).split()
+# Each appears in a small share of messages, so keyword filters are selective
+RARE_WORDS = "audit pentest vulnerability compliance quarterly migration outage".split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed conversations inside a transaction and compare the retrieval latency of a conversation "
+        "query (everything before the LLM call) with and without topic and keyword filters. "
+        "Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=2000)
+        parser.add_argument('--messages-per-conversation', type=int, default=30)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Retrieval and context packing only; the LLM is never called
+        analyzer = ConversationAnalyzer(llm=object())
+        analyzer.cache = None
+        view = ConversationQueryView()
+        query = "what did we decide about the security audit"
+        cases = {
+            'unfiltered': {},
+            'topic filter': {'topics': ["security"]},
+            'keyword filter': {'keywords': ["audit"]},
+            'topic + keyword': {'topics': ["security"], 'keywords': ["audit"]},
+        }
+
+        with transaction.atomic():
+            self._seed(rng, options['conversations'], options['messages_per_conversation'])
+
+            results = {}
+            for name, filters in cases.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    conversations = load_conversations_data(view.get_conversations_queryset(SimpleNamespace(data=filters)))
+                    analyzer._prepare_query(query, conversations, 5, None)
+                    timings.append((time.perf_counter() - started) * 1000)
+                results[name] = (statistics.median(timings), len(conversations))
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Conversation query retrieval over {options['conversations']} conversations (median of {options['repeat']})"
+        ))
+        baseline = results['unfiltered'][0]
+        for name, (latency, candidates) in results.items():
+            self.stdout.write(
+                f"{name:<16} {latency:9.1f}ms  candidates={candidates:6d}  x{baseline / latency:.1f} faster"
+            )
+
+    def _seed(self, rng, conversation_count, messages_per_conversation):
+        started = time.perf_counter()
+        # Tagged as if analysed, so the topic filter excludes conversations without a matching topic
+        analyzed_at = timezone.now()
+        conversations = Conversation.objects.bulk_create(
+            [
+                Conversation(title=f"Benchmark conversation {i}", analyzed_at=analyzed_at)
+                for i in range(conversation_count)
+            ],
+            batch_size=1000,
+        )
+        ConversationTopic.objects.bulk_create(
+            [
+                ConversationTopic(conversation=conversation, name=name)
+                for conversation in conversations
+                for name in rng.sample(TOPICS, 2)
+            ],
+            batch_size=5000,
+        )
+        senders = [MessageSender.USER.value, MessageSender.AI.value]
+        batch = []
+        for conversation in conversations:
+            for i in range(messages_per_conversation):
+                content = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 25)))
+                if rng.random() < 0.02:
+                    content += ' ' + rng.choice(RARE_WORDS)
+                batch.append(Message(conversation=conversation, content=content, sender=senders[i % 2]))
+            if len(batch) >= 5000:
+                Message.objects.bulk_create(batch, batch_size=5000)
+                batch = []
+        Message.objects.bulk_create(batch, batch_size=5000)
+        self.stdout.write(
+            f"Seeded {conversation_count} conversations / {conversation_count * messages_per_conversation} "
+            f"messages in {time.perf_counter() - started:.1f}s"
+        )
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import random
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+
+from chat.agents.callbacks import AsyncStreamingCallbackHandler
+
+
+class FakeConsumer:
+    """
+    Stand-in for a WebSocket consumer: each send costs a little CPU, like framing and
+    writing to the socket, and waits as long as it takes the client to receive the frame.
+    """
+
+    def __init__(self, seconds_per_frame: float):
+        self.seconds_per_frame = seconds_per_frame
+        self.frames = 0
+        self.chars = 0
+
+    async def send(self, text_data):
+        self.frames += 1
+        self.chars += len(json.loads(text_data)['message'])
+        text_data.encode('utf-8')
+        await asyncio.sleep(self.seconds_per_frame)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream tokens to simulated concurrent WebSocket clients with one frame per token "
+        "and with coalescing, reporting frames sent, characters delivered, wall time and CPU time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumers', type=int, default=200)
+        parser.add_argument('--tokens', type=int, default=400, help="Tokens streamed to each consumer.")
+        parser.add_argument('--tokens-per-second', type=float, default=200.0, help="LLM generation rate.")
+        parser.add_argument('--client-ms', type=float, default=1.0, help="Time a client takes to receive a frame.")
+        parser.add_argument('--slow-fraction', type=float, default=0.1, help="Share of clients 50x slower.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = "the release is scheduled after review of the design and budget".split()
+        tokens = [rng.choice(words) + ' ' for _ in range(options['tokens'])]
+        gap = 1 / options['tokens_per_second']
+
+        async def stream(consumer, coalesce):
+            handler = AsyncStreamingCallbackHandler(consumer, COALESCE=coalesce)
+            run_id = uuid4()
+            for token in tokens:
+                await handler.on_llm_new_token(token, run_id=run_id)
+                await asyncio.sleep(gap)
+            await handler.on_llm_end(None, run_id=run_id)
+
+        async def run(coalesce):
+            consumers = []
+            for _ in range(options['consumers']):
+                slow = rng.random() < options['slow_fraction']
+                consumers.append(FakeConsumer(options['client_ms'] / 1000 * (50 if slow else 1)))
+            await asyncio.gather(*(stream(consumer, coalesce) for consumer in consumers))
+            return consumers
+
+        expected = sum(len(token) for token in tokens) + 2
+        results = {}
+        for name, coalesce in (('per token', False), ('coalesced', True)):
+            started, cpu_started = time.perf_counter(), time.process_time()
+            consumers = asyncio.run(run(coalesce))
+            wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+            frames = sum(consumer.frames for consumer in consumers)
+            delivered = sum(consumer.chars for consumer in consumers) / (expected * len(consumers))
+            results[name] = (frames, delivered, wall, cpu)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{options['consumers']} concurrent consumers, {options['tokens']} tokens each"
+        ))
+        for name, (frames, delivered, wall, cpu) in results.items():
+            self.stdout.write(
+                f"{name:<10} frames={frames:8d}  delivered={delivered:6.1%}  wall={wall:6.2f}s  cpu={cpu:6.2f}s"
+            )
+        before, after = results['per token'], results['coalesced']
+        self.stdout.write(f"frames x{before[0] / after[0]:.1f} fewer, cpu x{before[3] / after[3]:.1f} less")
@@ -0,0 +1,80 @@
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.ai.ann import IVFIndex
+from chat.ai.embeddings import EMBEDDING_DIMENSIONS, embedding_store, get_search_settings
+from chat.models import Message, MessageEmbedding
+
+
+class Command(BaseCommand):
+    help = "Train the IVF centroids for conversation search and write them to CONVERSATION_SEARCH['INDEX_PATH']."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type=int, default=None, help="Number of clusters (default: IVF_NLIST setting).")
+        parser.add_argument('--sample-size', type=int, default=50000, help="Vectors sampled for k-means training.")
+        parser.add_argument('--iterations', type=int, default=10, help="k-means iterations.")
+        parser.add_argument(
+            '--embed-missing', action='store_true',
+            help="Embed messages that have no stored vector before training.",
+        )
+
+    def handle(self, *args, **options):
+        search_settings = get_search_settings()
+        path = search_settings['INDEX_PATH']
+        if not path:
+            raise CommandError("CONVERSATION_SEARCH['INDEX_PATH'] is not configured.")
+
+        if options['embed_missing']:
+            embedded = 0
+            missing = Message.objects.filter(embedding__isnull=True).only('id', 'conversation_id', 'content')
+            batch = []
+            for message in missing.iterator(chunk_size=1000):
+                batch.append(message)
+                if len(batch) == 1000:
+                    embedded += embedding_store.add_messages(batch)
+                    batch = []
+            embedded += embedding_store.add_messages(batch)
+            self.stdout.write(f"Embedded {embedded} messages without vectors.")
+
+        started = time.perf_counter()
+        vectors, total = self._sample_vectors(options['sample_size'])
+        if not len(vectors):
+            raise CommandError("No message embeddings stored; nothing to index.")
+
+        nlist = options['nlist'] if options['nlist'] is not None else search_settings['IVF_NLIST']
+        index = IVFIndex(nlist=nlist)
+        index.train(vectors, sample_size=options['sample_size'], iterations=options['iterations'])
+
+        # Write atomically so running workers never load a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=index.centroids)
+        os.replace(tmp_path, path)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained {index.nlist} clusters on {len(vectors)} of {total} vectors in {elapsed:.1f}s -> {path}"
+        ))
+
+    @staticmethod
+    def _sample_vectors(sample_size: int, seed: int = 0):
+        """
+        (sample, total): a uniform sample of the stored vectors, streamed into a
+        preallocated array so memory is bounded by the sample rather than the table.
+        """
+        rows = MessageEmbedding.objects.order_by('id').values_list('vector', flat=True)
+        total = rows.count()
+        positions = np.sort(np.random.default_rng(seed).choice(total, min(sample_size, total), replace=False))
+        vectors = np.empty((len(positions), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        filled = 0
+        for position, vector in enumerate(rows.iterator(chunk_size=5000)):
+            if filled == len(positions):
+                break
+            if position == positions[filled]:
+                vectors[filled] = np.frombuffer(bytes(vector), dtype=np.float32)
+                filled += 1
+        # Rows deleted since the count leave the tail unfilled
+        return vectors[:filled], total
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.models import Conversation, SummaryStatus
+from chat.tasks import requeue_stale_jobs, run_summary_job
+
+
+class Command(BaseCommand):
+    help = "Drain the queue of conversations waiting for a summary (PENDING summary_status)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--batch-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(f"Re-queued {requeued} stale summary jobs")
+
+            pending = list(
+                Conversation.objects.filter(summary_status=SummaryStatus.PENDING.value)
+                .order_by('updated_at')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            for conversation_id in pending:
+                run_summary_job(conversation_id)
+                self.stdout.write(f"Processed summary for conversation {conversation_id}")
+
+            if not pending:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
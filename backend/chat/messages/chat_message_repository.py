@@ -1,13 +1,17 @@
 import os
-from typing import List
+from typing import List, Optional
 
 import django
 from channels.db import database_sync_to_async
+from django.db import IntegrityError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 django.setup()
 
-from chat.models import Conversation, Message
+from chat.messages import known_conversations
+from chat.messages.history_cache import get_history_cache, message_record
+from chat.messages.message_writer import flush_pending, get_message_writer
+from chat.models import Conversation, ConversationSummaryChunk, Message
 
 
 class ChatMessageRepository:
@@ -18,25 +22,114 @@ class ChatMessageRepository:
         # Convert conversation_id to int and use conversation__id for filtering
         try:
             conversation_id_int = int(conversation_id)
+        except (ValueError, TypeError):
+            return []
+
+        # Messages still queued for write-behind would be missing from the history
+        flush_pending(conversation_id_int)
+        cache = get_history_cache() if order_by == 'timestamp' else None
+        if cache is None:
             return list(Message.objects.filter(conversation__id=conversation_id_int).order_by(order_by))
+        cached = cache.recent(conversation_id_int)
+        if cached is not None:
+            return self._as_messages(conversation_id_int, cached)
+
+        version = cache.version(conversation_id_int)
+        messages = list(Message.objects.filter(conversation__id=conversation_id_int).order_by(order_by))
+        cache.fill(
+            conversation_id_int, [message_record(message) for message in messages],
+            complete=len(messages) <= cache.per_conversation, version=version,
+        )
+        return messages
+
+    @database_sync_to_async
+    def get_recent_messages(self, conversation_id: str, limit: int) -> List[Message]:
+        # The latest `limit` messages, oldest first, read backwards through message_conversation_ts_idx
+        try:
+            conversation_id_int = int(conversation_id)
         except (ValueError, TypeError):
             return []
 
+        # Messages still queued for write-behind would be missing from the history
+        flush_pending(conversation_id_int)
+        cache = get_history_cache()
+        if cache is None:
+            return self._latest(conversation_id_int, limit)
+        cached = cache.recent(conversation_id_int, limit)
+        if cached is not None:
+            return self._as_messages(conversation_id_int, cached)
+
+        # Read a full cache entry's worth so later, larger windows are served from memory too
+        version = cache.version(conversation_id_int)
+        fetch = max(limit, cache.per_conversation)
+        messages = self._latest(conversation_id_int, fetch)
+        cache.fill(
+            conversation_id_int, [message_record(message) for message in messages],
+            complete=len(messages) < fetch, version=version,
+        )
+        return messages[-limit:]
+
+    @staticmethod
+    def _latest(conversation_id: int, limit: int) -> List[Message]:
+        latest = Message.objects.filter(conversation_id=conversation_id).order_by('-timestamp', '-id')[:limit]
+        return list(reversed(latest))
+
+    @staticmethod
+    def _as_messages(conversation_id: int, records) -> List[Message]:
+        return [
+            Message(id=message_id, conversation_id=conversation_id, sender=sender, content=content, timestamp=timestamp)
+            for message_id, sender, content, timestamp in records
+        ]
+
     @database_sync_to_async
-    def save_message(self, message: str, sender: str, conversation_id: str):
+    def get_summary(self, conversation_id: str) -> Optional[str]:
+        # The final summary once the conversation has ended, otherwise the latest rolling window summary
+        try:
+            conversation_id_int = int(conversation_id)
+        except (ValueError, TypeError):
+            return None
+        summary = Conversation.objects.filter(pk=conversation_id_int).values_list('summary', flat=True).first()
+        if summary:
+            return summary
+        return (
+            ConversationSummaryChunk.objects.filter(conversation_id=conversation_id_int)
+            .order_by('-index').values_list('summary', flat=True).first()
+        )
+
+    @database_sync_to_async
+    def save_message(self, message: str, sender: str, conversation_id: str) -> Optional[Message]:
         # Save the message to the database
         # The conversation should already exist (created by frontend via API)
         try:
             conversation_id_int = int(conversation_id)
-            # Get the Conversation object - it should exist
-            try:
-                conversation = Conversation.objects.get(pk=conversation_id_int)
-            except Conversation.DoesNotExist:
-                # If conversation doesn't exist, log error and don't save message
-                # This shouldn't happen if frontend creates conversation first
-                print(f"Warning: Conversation {conversation_id_int} does not exist. Message not saved.")
-                return
-            # Create the message with the Conversation object
-            Message.objects.create(sender=sender, content=message, conversation=conversation)
         except (ValueError, TypeError) as e:
             raise ValueError(f"Invalid conversation_id: {conversation_id}") from e
+        return self.insert_message(message, sender, conversation_id_int)
+
+    def insert_message(self, message: str, sender: str, conversation_id: int) -> Optional[Message]:
+        # Conversations seen before are not read again: the insert goes straight in by id and
+        # the FK constraint rejects a conversation deleted since (checked when the insert commits)
+        if not known_conversations.existing([conversation_id]):
+            # This shouldn't happen if frontend creates conversation first
+            print(f"Warning: Conversation {conversation_id} does not exist. Message not saved.")
+            return None
+        try:
+            # chat.signals writes it through to the history cache once committed
+            return Message.objects.create(sender=sender, content=message, conversation_id=conversation_id)
+        except IntegrityError:
+            known_conversations.forget([conversation_id])
+            print(f"Warning: Conversation {conversation_id} does not exist. Message not saved.")
+            return None
+
+    async def queue_message(self, message: str, sender: str, conversation_id: str):
+        # Hand the message to the write-behind queue without waiting for the insert;
+        # saved directly when write-behind is disabled
+        writer = get_message_writer()
+        if writer is None:
+            await self.save_message(message=message, sender=sender, conversation_id=conversation_id)
+            return
+        try:
+            conversation_id_int = int(conversation_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid conversation_id: {conversation_id}") from e
+        writer.submit(conversation_id_int, sender, message)
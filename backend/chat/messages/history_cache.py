@@ -0,0 +1,325 @@
+"""
+Cache of the latest messages of recently used conversations.
+
+Reconnecting to a conversation or building its agent memory reads its recent
+history; this cache answers those reads from memory. Entries hold up to
+MAX_MESSAGES_PER_CONVERSATION of the newest messages, oldest first, plus whether that
+is the whole conversation. New messages are appended once committed and deletions
+drop the entry (see chat.signals), so entries stay current without re-reading.
+
+Every append and invalidation bumps a per-conversation version kept next to the
+entries. A reader takes the version before reading the database and its fill is only
+written if the version is unchanged, so a fill computed before another process's
+append cannot overwrite it. Versions expire after IDLE_SECONDS like the entries.
+
+The local tier is per process, bounded by total cached messages, number of
+conversations and idle time. It only sees messages saved by its own process, so with
+several worker processes it would serve stale history; it is only used when chosen
+explicitly. The default, 'auto', uses the Redis tier when the channel layer runs on
+Redis and no cache otherwise. Redis entries expire after IDLE_SECONDS and the server's
+maxmemory policy bounds the total size.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from chat.metrics import metrics
+
+# (id, sender, content, timestamp) of one message
+Record = Tuple[int, str, str, datetime]
+
+
+def get_history_cache_settings():
+    options = {
+        'ENABLED': True,
+        'BACKEND': 'auto',
+        'REDIS_URL': 'redis://127.0.0.1:6379/1',
+        'KEY_PREFIX': 'history',
+        'MAX_MESSAGES_PER_CONVERSATION': 100,
+        'MAX_CONVERSATIONS': 1000,
+        'MAX_MESSAGES': 50000,
+        'IDLE_SECONDS': 1800,
+    }
+    options.update(getattr(settings, 'HISTORY_CACHE', {}))
+    return options
+
+
+def message_record(message) -> Record:
+    return (message.id, message.sender, message.content, message.timestamp)
+
+
+class LocalHistoryCache:
+    def __init__(self, per_conversation: int, max_conversations: int, max_messages: int, idle_seconds: float):
+        self.per_conversation = per_conversation
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # conversation id -> [records, complete, last access]
+        self._entries: OrderedDict = OrderedDict()
+        self._message_total = 0
+        # conversation id -> [version, last write], oldest write first
+        self._versions: OrderedDict = OrderedDict()
+
+    def version(self, conversation_id: int) -> int:
+        with self._lock:
+            entry = self._versions.get(conversation_id)
+            return entry[0] if entry is not None else 0
+
+    def get(self, conversation_id: int) -> Optional[Tuple[List[Record], bool]]:
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.idle_seconds:
+                self._drop(conversation_id)
+                return None
+            entry[2] = time.monotonic()
+            self._entries.move_to_end(conversation_id)
+            return list(entry[0]), entry[1]
+
+    def set(self, conversation_id: int, records: List[Record], complete: bool, version: int):
+        with self._lock:
+            entry = self._versions.get(conversation_id)
+            if (entry[0] if entry is not None else 0) != version:
+                return
+            self._drop(conversation_id)
+            records = list(records[-self.per_conversation:])
+            self._entries[conversation_id] = [records, complete, time.monotonic()]
+            self._message_total += len(records)
+            self._evict()
+
+    def append(self, conversation_id: int, records: List[Record]):
+        with self._lock:
+            self._bump(conversation_id)
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            entry[0].extend(records)
+            self._message_total += len(records)
+            overflow = len(entry[0]) - self.per_conversation
+            if overflow > 0:
+                del entry[0][:overflow]
+                self._message_total -= overflow
+                entry[1] = False
+            self._evict()
+
+    def invalidate(self, conversation_id: int):
+        with self._lock:
+            self._bump(conversation_id)
+            self._drop(conversation_id)
+
+    def _bump(self, conversation_id: int):
+        entry = self._versions.pop(conversation_id, None)
+        self._versions[conversation_id] = [(entry[0] if entry is not None else 0) + 1, time.monotonic()]
+
+    def _drop(self, conversation_id: int):
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._message_total -= len(entry[0])
+
+    def _evict(self):
+        now = time.monotonic()
+        # Least recently used first; also sweep idle entries from the cold end
+        while self._entries:
+            conversation_id, entry = next(iter(self._entries.items()))
+            over_size = len(self._entries) > self.max_conversations or self._message_total > self.max_messages
+            if not over_size and now - entry[2] <= self.idle_seconds:
+                break
+            self._drop(conversation_id)
+            metrics.increment('history_cache.evictions')
+        while self._versions and now - next(iter(self._versions.values()))[1] > self.idle_seconds:
+            self._versions.popitem(last=False)
+        metrics.set_gauge('history_cache.messages', self._message_total)
+
+
+# Replaces the entry only if the version key still holds ARGV[1]
+# KEYS: messages, complete, version; ARGV: version, complete flag, ttl, records...
+SET_IF_VERSION = """
+if tonumber(redis.call('GET', KEYS[3]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 3 then
+    redis.call('RPUSH', KEYS[1], unpack(ARGV, 4))
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class RedisHistoryCache:
+    def __init__(self, url: str, prefix: str, per_conversation: int, idle_seconds: float):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.per_conversation = per_conversation
+        self.idle_seconds = int(idle_seconds)
+        self._set_if_version = self.client.register_script(SET_IF_VERSION)
+
+    def _keys(self, conversation_id: int) -> Tuple[str, str]:
+        return f"{self.prefix}:{conversation_id}", f"{self.prefix}:{conversation_id}:complete"
+
+    def _version_key(self, conversation_id: int) -> str:
+        return f"{self.prefix}:{conversation_id}:version"
+
+    def _bump(self, pipeline, conversation_id: int):
+        pipeline.incr(self._version_key(conversation_id))
+        pipeline.expire(self._version_key(conversation_id), self.idle_seconds)
+
+    def version(self, conversation_id: int) -> int:
+        return int(self.client.get(self._version_key(conversation_id)) or 0)
+
+    @staticmethod
+    def _dump(record: Record) -> str:
+        message_id, sender, content, timestamp = record
+        return json.dumps([message_id, sender, content, timestamp.isoformat()])
+
+    @staticmethod
+    def _load(raw: bytes) -> Record:
+        message_id, sender, content, timestamp = json.loads(raw)
+        return message_id, sender, content, datetime.fromisoformat(timestamp)
+
+    def get(self, conversation_id: int) -> Optional[Tuple[List[Record], bool]]:
+        messages_key, complete_key = self._keys(conversation_id)
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.lrange(messages_key, 0, -1)
+        pipeline.get(complete_key)
+        pipeline.expire(messages_key, self.idle_seconds)
+        pipeline.expire(complete_key, self.idle_seconds)
+        raw_records, complete, _, _ = pipeline.execute()
+        if complete is None:
+            return None
+        return [self._load(raw) for raw in raw_records], complete == b'1'
+
+    def set(self, conversation_id: int, records: List[Record], complete: bool, version: int):
+        records = records[-self.per_conversation:]
+        self._set_if_version(
+            keys=[*self._keys(conversation_id), self._version_key(conversation_id)],
+            args=[version, '1' if complete else '0', self.idle_seconds, *[self._dump(record) for record in records]],
+        )
+
+    def append(self, conversation_id: int, records: List[Record]):
+        messages_key, complete_key = self._keys(conversation_id)
+        pipeline = self.client.pipeline()
+        self._bump(pipeline, conversation_id)
+        pipeline.rpushx(messages_key, *[self._dump(record) for record in records])
+        length = pipeline.execute()[-1]
+        if not length:
+            # Nothing cached, or a cached empty conversation that the list cannot represent
+            self.client.delete(complete_key)
+            return
+        if length > self.per_conversation:
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.ltrim(messages_key, -self.per_conversation, -1)
+            pipeline.set(complete_key, '0', ex=self.idle_seconds, xx=True)
+            pipeline.execute()
+
+    def invalidate(self, conversation_id: int):
+        pipeline = self.client.pipeline()
+        pipeline.delete(*self._keys(conversation_id))
+        self._bump(pipeline, conversation_id)
+        pipeline.execute()
+
+
+class HistoryCache:
+    """Recent-history reads and writes with hit/miss accounting; backend errors act as misses."""
+
+    def __init__(self, backend, per_conversation: int):
+        self.backend = backend
+        self.per_conversation = per_conversation
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    def version(self, conversation_id: int) -> Optional[int]:
+        """The conversation's version to pass to fill, or None if the cache is unavailable."""
+        try:
+            return self.backend.version(conversation_id)
+        except Exception as e:
+            print(f"Warning: History cache unavailable: {e}")
+            return None
+
+    def _record_lookup(self, hit: bool):
+        with self._lock:
+            self._lookups += 1
+            self._hits += hit
+            hit_rate = self._hits / self._lookups
+        metrics.increment('history_cache.hits' if hit else 'history_cache.misses')
+        metrics.set_gauge('history_cache.hit_rate', round(hit_rate, 4))
+
+    def recent(self, conversation_id: int, limit: Optional[int] = None) -> Optional[List[Record]]:
+        """The last `limit` messages (all when None), or None if the cache cannot answer."""
+        try:
+            entry = self.backend.get(conversation_id)
+        except Exception as e:
+            print(f"Warning: History cache unavailable: {e}")
+            entry = None
+        if entry is not None:
+            records, complete = entry
+            if complete or (limit is not None and len(records) >= limit):
+                self._record_lookup(True)
+                return records[-limit:] if limit else records
+        self._record_lookup(False)
+        return None
+
+    def fill(self, conversation_id: int, records: List[Record], complete: bool, version: Optional[int]):
+        """Cache records read from the database, unless any process wrote to the conversation since `version`."""
+        if version is not None:
+            self._safely(self.backend.set, conversation_id, records, complete, version)
+
+    def append(self, conversation_id: int, records: List[Record]):
+        self._safely(self.backend.append, conversation_id, records)
+
+    def invalidate(self, conversation_ids: Iterable[int]):
+        for conversation_id in set(conversation_ids):
+            self._safely(self.backend.invalidate, conversation_id)
+
+    @staticmethod
+    def _safely(operation, *args):
+        try:
+            operation(*args)
+        except Exception as e:
+            print(f"Warning: Could not update history cache: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _backend_name(options) -> Optional[str]:
+    if options['BACKEND'] != 'auto':
+        return options['BACKEND']
+    # Several processes share a Redis channel layer; a per-process cache would go stale
+    layer = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {})
+    return 'redis' if 'redis' in layer.get('BACKEND', '').lower() else None
+
+
+def get_history_cache() -> Optional[HistoryCache]:
+    """The configured process-wide history cache, or None when it is disabled."""
+    global _cache
+    options = get_history_cache_settings()
+    backend_name = _backend_name(options)
+    if not options['ENABLED'] or backend_name is None:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                per_conversation = options['MAX_MESSAGES_PER_CONVERSATION']
+                if backend_name == 'redis':
+                    backend = RedisHistoryCache(
+                        options['REDIS_URL'], options['KEY_PREFIX'], per_conversation, options['IDLE_SECONDS']
+                    )
+                else:
+                    backend = LocalHistoryCache(
+                        per_conversation, options['MAX_CONVERSATIONS'], options['MAX_MESSAGES'], options['IDLE_SECONDS']
+                    )
+                _cache = HistoryCache(backend, per_conversation)
+    return _cache
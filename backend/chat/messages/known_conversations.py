@@ -0,0 +1,56 @@
+"""
+Ids of conversations known to exist.
+
+Saving a message only needs its conversation to exist, which the FK constraint already
+enforces; remembering the ids seen recently lets the message paths insert straight away
+instead of reading the Conversation row first. Deletions in this process forget the id
+(see chat.signals). A deletion in another process is caught by the FK constraint, after
+which the caller forgets the id too.
+"""
+import threading
+from collections import OrderedDict
+from typing import Iterable, Set
+
+from django.db import transaction
+
+from chat.models import Conversation
+
+MAX_KNOWN = 10000
+
+_known: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+
+def is_known(conversation_id: int) -> bool:
+    with _lock:
+        if conversation_id not in _known:
+            return False
+        _known.move_to_end(conversation_id)
+        return True
+
+
+def remember(conversation_ids: Iterable[int]):
+    with _lock:
+        for conversation_id in conversation_ids:
+            _known[conversation_id] = None
+            _known.move_to_end(conversation_id)
+        while len(_known) > MAX_KNOWN:
+            _known.popitem(last=False)
+
+
+def forget(conversation_ids: Iterable[int]):
+    with _lock:
+        for conversation_id in conversation_ids:
+            _known.pop(conversation_id, None)
+
+
+def existing(conversation_ids: Iterable[int]) -> Set[int]:
+    """The ids whose conversation exists, querying only for the ones not known yet."""
+    conversation_ids = set(conversation_ids)
+    unknown = {conversation_id for conversation_id in conversation_ids if not is_known(conversation_id)}
+    if not unknown:
+        return conversation_ids
+    found = set(Conversation.objects.filter(pk__in=unknown).values_list('pk', flat=True))
+    # Not before commit: a rolled back transaction may have been the one that created them
+    transaction.on_commit(lambda: remember(found))
+    return (conversation_ids - unknown) | found
@@ -0,0 +1,226 @@
+"""
+Write-behind persistence for chat messages.
+
+The WebSocket consumer queues messages here instead of inserting them itself, so a
+turn never waits on the database. A background thread writes everything queued every
+FLUSH_INTERVAL_MS, or as soon as MAX_BATCH messages are waiting, as one bulk insert
+across conversations. Batches are written one at a time in the order messages were
+queued, so each conversation's messages keep their order. bulk_create sends no
+post_save signals, so the post-insert hooks of chat.signals are run for the batch.
+
+Reads of a conversation with queued messages flush first (see flush_pending), as do
+ending a conversation and summarising it, and the queue is flushed when the process
+exits. Messages queued after their conversation ended are dropped with a warning. A failed batch is retried at the next flush; beyond MAX_PENDING
+queued messages the oldest are dropped with a warning.
+
+A batch that keeps failing for anything but a lost connection is retried in halves,
+so the messages around a bad one are still written; a message that fails on its own
+a second time is dropped with a warning.
+"""
+import atexit
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+from chat.metrics import metrics
+from chat.messages import known_conversations
+from chat.models import Conversation, Message
+from chat.signals import handle_messages_created
+
+
+def get_write_behind_settings():
+    options = {
+        'ENABLED': True,
+        'FLUSH_INTERVAL_MS': 100,
+        'MAX_BATCH': 200,
+        'MAX_PENDING': 10000,
+    }
+    options.update(getattr(settings, 'MESSAGE_WRITE_BEHIND', {}))
+    return options
+
+
+class PendingMessage(NamedTuple):
+    conversation_id: int
+    sender: str
+    content: str
+    queued_at: datetime
+    # Writes of this message that failed, not counting lost connections
+    failures: int = 0
+
+
+class MessageWriter:
+    def __init__(self, flush_interval: float, max_batch: int, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Held while a batch is written, so batches reach the database in queue order
+        self._flush_lock = threading.Lock()
+        self._pending = deque()
+        self._pending_by_conversation = Counter()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, conversation_id: int, sender: str, content: str):
+        """Queue a message for the next batch; returns without touching the database."""
+        with self._lock:
+            self._pending.append(PendingMessage(conversation_id, sender, content, timezone.now()))
+            self._pending_by_conversation[conversation_id] += 1
+            self._drop_overflow()
+            pending = len(self._pending)
+        metrics.set_gauge('message_writer.pending', pending)
+        if pending >= self.max_batch:
+            self._wakeup.set()
+
+    def has_pending(self, conversation_id: int) -> bool:
+        with self._lock:
+            return self._pending_by_conversation[conversation_id] > 0
+
+    def flush(self):
+        """Write everything queued so far. Safe to call from any thread."""
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    metrics.increment('message_writer.errors')
+                    if isinstance(e, (OperationalError, InterfaceError)):
+                        # The database is unreachable; retry the batch as it is
+                        print(f"Warning: Could not save {len(batch)} messages, retrying later: {e}")
+                        self._requeue(batch)
+                        return
+                    if len(batch) == 1 and batch[0].failures:
+                        print(f"Warning: Could not save message for conversation {batch[0].conversation_id}, dropped: {e}")
+                        metrics.increment('message_writer.dropped')
+                        with self._lock:
+                            self._done(batch)
+                        continue
+                    print(f"Warning: Could not save {len(batch)} messages, retrying later: {e}")
+                    if isinstance(e, IntegrityError):
+                        # A conversation was deleted by another process; check them all again
+                        known_conversations.forget(pending.conversation_id for pending in batch)
+                    self._requeue([pending._replace(failures=pending.failures + 1) for pending in batch])
+                    return
+
+    def close(self):
+        """Stop the background thread and write what is left."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _take_batch(self) -> List[PendingMessage]:
+        with self._lock:
+            size = min(self.max_batch, len(self._pending))
+            if size and self._pending[0].failures:
+                # Halve a failing batch on each retry until the bad messages are on their own
+                size = max(1, min(size, self.max_batch >> self._pending[0].failures))
+            batch = [self._pending.popleft() for _ in range(size)]
+            metrics.set_gauge('message_writer.pending', len(self._pending))
+        return batch
+
+    def _requeue(self, batch: List[PendingMessage]):
+        with self._lock:
+            self._pending.extendleft(reversed(batch))
+            self._drop_overflow()
+
+    def _drop_overflow(self):
+        while len(self._pending) > self.max_pending:
+            dropped = self._pending.popleft()
+            self._done([dropped])
+            print(f"Warning: Message queue full, message for conversation {dropped.conversation_id} not saved.")
+            metrics.increment('message_writer.dropped')
+
+    def _done(self, batch: List[PendingMessage]):
+        self._pending_by_conversation.subtract(pending.conversation_id for pending in batch)
+        self._pending_by_conversation += Counter()  # drop zero counts
+
+    def _write(self, batch: List[PendingMessage]):
+        conversation_ids = {pending.conversation_id for pending in batch}
+        existing = known_conversations.existing(conversation_ids)
+        for conversation_id in conversation_ids - existing:
+            # The conversation is created by the frontend via the API before chatting
+            print(f"Warning: Conversation {conversation_id} does not exist. Message not saved.")
+        # Messages queued before the end are still written, in time for the summary job
+        ended_at = dict(
+            Conversation.objects.filter(pk__in=existing, end_timestamp__isnull=False)
+            .values_list('pk', 'end_timestamp')
+        )
+        kept = []
+        for pending in batch:
+            if pending.conversation_id not in existing:
+                continue
+            if pending.conversation_id in ended_at and pending.queued_at > ended_at[pending.conversation_id]:
+                print(f"Warning: Conversation {pending.conversation_id} has ended. Message not saved.")
+                metrics.increment('message_writer.dropped')
+                continue
+            kept.append(pending)
+
+        messages = [
+            Message(conversation_id=pending.conversation_id, sender=pending.sender, content=pending.content)
+            for pending in kept
+        ]
+        with metrics.timer('message_writer.flush'), transaction.atomic():
+            created = Message.objects.bulk_create(messages)
+            if created:
+                handle_messages_created(created)
+        metrics.observe('message_writer.batch_size', len(created))
+        with self._lock:
+            self._done(batch)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer() -> Optional[MessageWriter]:
+    """The process-wide message writer, or None when messages are saved synchronously."""
+    global _writer
+    options = get_write_behind_settings()
+    if not options['ENABLED']:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = MessageWriter(
+                    options['FLUSH_INTERVAL_MS'] / 1000, options['MAX_BATCH'], options['MAX_PENDING']
+                )
+                writer.start()
+                atexit.register(writer.close)
+                _writer = writer
+    return _writer
+
+
+def flush_pending(conversation_id: int) -> bool:
+    """
+    Write everything queued if the conversation has queued messages, so a read or summary
+    sees them. Returns whether it flushed. Only this process's queue is checked.
+    """
+    writer = _writer
+    if writer is None or not writer.has_pending(conversation_id):
+        return False
+    writer.flush()
+    return True
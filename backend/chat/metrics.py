@@ -0,0 +1,91 @@
+"""
+In-process metrics: counters, timings and gauges kept per worker process and
+exposed at GET /api/metrics/.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class TimingStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean_ms': round(1000 * self.total / self.count, 3) if self.count else 0.0,
+            'max_ms': round(1000 * self.max, 3),
+            'last_ms': round(1000 * self.last, 3),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timings: Dict[str, TimingStats] = {}
+        self._gauges: Dict[str, float] = {}
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self._timings.setdefault(name, TimingStats()).observe(seconds)
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    @contextmanager
+    def timer(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'timings': {name: stats.as_dict() for name, stats in self._timings.items()},
+                'gauges': dict(self._gauges),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._gauges.clear()
+
+
+def resident_memory_bytes():
+    """Current resident set size of this process, or None if it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS, in KiB on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-16 20:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0011_conversation_message_count"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="message",
+            options={"ordering": ["timestamp", "id"]},
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="conversation_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                fields=["status", "start_timestamp"],
+                name="conversation_status_start_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "timestamp", "id"],
+                name="message_conversation_ts_idx",
+            ),
+        ),
+        # The composite index above starts with conversation_id, so the
+        # single-column FK index is redundant once it exists.
+        migrations.AlterField(
+            model_name="message",
+            name="conversation",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="messages",
+                to="chat.conversation",
+            ),
+        ),
+    ]
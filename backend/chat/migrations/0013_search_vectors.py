@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-16 22:10
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# (table, trigger source columns) kept in sync by tsvector_update_trigger
+SEARCH_TABLES = [
+    ("chat_message", "content"),
+    ("chat_conversation", "title, summary"),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # GIN indexes and triggers are PostgreSQL-only; other databases fall back to
+    # the in-process BM25 index in chat.ai.text_index.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, columns in SEARCH_TABLES:
+        schema_editor.execute(
+            f"CREATE INDEX {table}_search_vector_gin ON {table} USING gin (search_vector)"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_search_vector_update "
+            f"BEFORE INSERT OR UPDATE ON {table} FOR EACH ROW "
+            f"EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.english', {columns})"
+        )
+        # Touching each row fires the trigger and backfills existing data
+        schema_editor.execute(f"UPDATE {table} SET search_vector = NULL")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, _ in SEARCH_TABLES:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table}")
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0012_conversation_message_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+
+def mark_existing_summaries(apps, schema_editor):
+    Conversation = apps.get_model("chat", "Conversation")
+    Conversation.objects.exclude(summary__isnull=True).exclude(summary="").update(
+        summary_status="COMPLETED"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0013_search_vectors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="summary_status",
+            field=models.CharField(
+                choices=[
+                    ("NOT_REQUESTED", "NOT_REQUESTED"),
+                    ("PENDING", "PENDING"),
+                    ("RUNNING", "RUNNING"),
+                    ("COMPLETED", "COMPLETED"),
+                    ("FAILED", "FAILED"),
+                ],
+                default="NOT_REQUESTED",
+                max_length=20,
+            ),
+        ),
+        migrations.RunPython(mark_existing_summaries, migrations.RunPython.noop),
+    ]
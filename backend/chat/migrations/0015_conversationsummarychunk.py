@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0014_conversation_summary_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationSummaryChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("index", models.PositiveIntegerField()),
+                ("end_timestamp", models.DateTimeField()),
+                ("end_message_id", models.BigIntegerField()),
+                ("message_count", models.PositiveIntegerField()),
+                ("summary", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="summary_chunks",
+                        to="chat.conversation",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["conversation", "index"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="conversationsummarychunk",
+            constraint=models.UniqueConstraint(
+                fields=("conversation", "index"),
+                name="summary_chunk_conversation_index",
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2 on 2026-10-16 23:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0015_conversationsummarychunk"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationTopic",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="topics",
+                        to="chat.conversation",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["conversation", "name"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="conversationtopic",
+            index=models.Index(
+                fields=["name", "conversation"], name="conversation_topic_name_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="conversationtopic",
+            constraint=models.UniqueConstraint(
+                fields=("conversation", "name"), name="conversation_topic_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-17 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0016_conversationtopic"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="action_items",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="analyzed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="sentiment",
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="sentiment_confidence",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="tone",
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
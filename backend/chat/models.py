@@ -2,6 +2,7 @@
 from enum import Enum
 import uuid
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 
@@ -16,6 +17,14 @@ class ConversationStatus(Enum):
     ENDED = 'ENDED'
 
 
+class SummaryStatus(Enum):
+    NOT_REQUESTED = 'NOT_REQUESTED'
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    COMPLETED = 'COMPLETED'
+    FAILED = 'FAILED'
+
+
 class Conversation(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True)
     status = models.CharField(
@@ -26,19 +35,43 @@ class Conversation(models.Model):
     start_timestamp = models.DateTimeField(auto_now_add=True)
     end_timestamp = models.DateTimeField(null=True, blank=True)
     summary = models.TextField(blank=True, null=True)
+    # Progress of the background summary job (see chat.tasks)
+    summary_status = models.CharField(
+        max_length=20,
+        choices=[(tag.value, tag.name) for tag in SummaryStatus],
+        default=SummaryStatus.NOT_REQUESTED.value
+    )
+    # Denormalised count of related messages, maintained by chat.signals
+    message_count = models.PositiveIntegerField(default=0)
+    # Analytics stored by the summary job when the conversation ends (see chat.summaries);
+    # topics are ConversationTopic rows. analyzed_at stays null until then.
+    sentiment = models.CharField(max_length=20, blank=True, null=True)
+    tone = models.CharField(max_length=50, blank=True, null=True)
+    sentiment_confidence = models.FloatField(blank=True, null=True)
+    action_items = models.JSONField(default=list, blank=True)
+    analyzed_at = models.DateTimeField(blank=True, null=True)
+    # title + summary; filled by a database trigger on PostgreSQL (see migration 0013)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listing (newest first, keyset paginated)
+            models.Index(fields=['-created_at', '-id'], name='conversation_created_idx'),
+            # Status / date range filters of the conversation query endpoint
+            models.Index(fields=['status', 'start_timestamp'], name='conversation_status_start_idx'),
+        ]
 
     def __str__(self):
         return self.title or f"Conversation {self.id}"
 
     def end_conversation(self):
-        """Mark conversation as ended and set end timestamp"""
+        """Mark conversation as ended, set end timestamp and queue its summary"""
         self.status = ConversationStatus.ENDED.value
         self.end_timestamp = timezone.now()
+        self.summary_status = SummaryStatus.PENDING.value
         self.save()
 
     @property
@@ -49,14 +82,31 @@ class Conversation(models.Model):
         return (timezone.now() - self.start_timestamp).total_seconds()
 
 
+class MessageManager(models.Manager):
+    def get_queryset(self):
+        # search_vector is only used inside full-text queries; never fetch it into Python
+        return super().get_queryset().defer('search_vector')
+
+
 class Message(models.Model):
     content = models.TextField()
-    conversation = models.ForeignKey(Conversation, related_name="messages", on_delete=models.CASCADE)
+    # Indexed through message_conversation_ts_idx, whose leading column is the FK
+    conversation = models.ForeignKey(
+        Conversation, related_name="messages", on_delete=models.CASCADE, db_index=False
+    )
     sender = models.CharField(max_length=10, choices=[(tag.value, tag.name) for tag in MessageSender])
     timestamp = models.DateTimeField(auto_now_add=True)
+    # content; filled by a database trigger on PostgreSQL (see migration 0013)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MessageManager()
 
     class Meta:
-        ordering = ['timestamp']
+        ordering = ['timestamp', 'id']
+        indexes = [
+            # History of one conversation in order, and keyset pages over (timestamp, id)
+            models.Index(fields=['conversation', 'timestamp', 'id'], name='message_conversation_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender}: {self.content[:50]}"
@@ -86,3 +136,55 @@ class Agent(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class MessageEmbedding(models.Model):
+    """Sentence embedding of a single message, stored as raw float32 bytes."""
+    message = models.OneToOneField(Message, related_name="embedding", on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, related_name="message_embeddings", on_delete=models.CASCADE)
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Embedding for message {self.message_id}"
+
+
+class ConversationSummaryChunk(models.Model):
+    """Summary of one window of consecutive messages; the conversation summary is built from these."""
+    conversation = models.ForeignKey(Conversation, related_name="summary_chunks", on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    # Last message of the window in (timestamp, id) order; the next window starts after it
+    end_timestamp = models.DateTimeField()
+    end_message_id = models.BigIntegerField()
+    message_count = models.PositiveIntegerField()
+    summary = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['conversation', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'index'], name='summary_chunk_conversation_index'),
+        ]
+
+    def __str__(self):
+        return f"Summary chunk {self.index} of conversation {self.conversation_id}"
+
+
+class ConversationTopic(models.Model):
+    """Topic tag of a conversation, stored when it is summarised; filters conversation queries."""
+    conversation = models.ForeignKey(Conversation, related_name="topics", on_delete=models.CASCADE)
+    # Lowercased, whitespace-collapsed topic name
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['conversation', 'name']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'name'], name='conversation_topic_unique'),
+        ]
+        indexes = [
+            # Conversations tagged with a topic
+            models.Index(fields=['name', 'conversation'], name='conversation_topic_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} (conversation {self.conversation_id})"
@@ -22,36 +22,36 @@ class MessageSerializer(serializers.ModelSerializer):
 
 
 class ConversationSerializer(serializers.ModelSerializer):
-    message_count = serializers.SerializerMethodField()
+    message_count = serializers.IntegerField(read_only=True)
     duration = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
         fields = [
             'id', 'title', 'status', 'start_timestamp', 'end_timestamp',
-            'summary', 'created_at', 'updated_at', 'message_count', 'duration'
+            'summary', 'summary_status', 'created_at', 'updated_at', 'message_count', 'duration'
         ]
 
-    def get_message_count(self, obj):
-        return obj.messages.count()
-
     def get_duration(self, obj):
         return obj.duration
 
 
-class ConversationDetailSerializer(serializers.ModelSerializer):
-    messages = MessageSerializer(many=True, read_only=True)
-    duration = serializers.SerializerMethodField()
+class ConversationAnalyticsSerializer(serializers.ModelSerializer):
+    # Stored by the summary job when the conversation ends; null until then
+    sentiment = serializers.SerializerMethodField()
+    topics = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
-        fields = [
-            'id', 'title', 'status', 'start_timestamp', 'end_timestamp',
-            'summary', 'created_at', 'updated_at', 'messages', 'duration'
-        ]
+        fields = ['id', 'sentiment', 'topics', 'action_items', 'analyzed_at']
 
-    def get_duration(self, obj):
-        return obj.duration
+    def get_sentiment(self, obj):
+        if obj.analyzed_at is None:
+            return None
+        return {"sentiment": obj.sentiment, "tone": obj.tone, "confidence": obj.sentiment_confidence}
+
+    def get_topics(self, obj):
+        return sorted(topic.name for topic in obj.topics.all())
 
 
 class AgentSerializer(serializers.ModelSerializer):
@@ -0,0 +1,126 @@
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .ai.llm_cache import get_llm_cache
+from .ai.text_index import get_text_index
+from .messages import known_conversations
+from .messages.history_cache import get_history_cache, message_record
+from .models import Conversation, Message
+from .summaries import get_summary_settings
+from .tasks import enqueue_chunk_summaries, enqueue_embedding_reload, enqueue_embeddings
+
+
+def handle_messages_created(messages):
+    """Post-insert hooks for new messages, shared by single saves and bulk inserts."""
+    deltas = Counter(msg.conversation_id for msg in messages)
+    counts = update_message_counts(deltas)
+    invalidate_llm_cache(deltas)
+    # The in-process text index, embeddings and history cache only ever see committed rows
+    transaction.on_commit(lambda: get_text_index().add_messages(messages))
+    transaction.on_commit(lambda: enqueue_embeddings(messages))
+    transaction.on_commit(lambda: append_to_history_cache(messages))
+    completed = completed_windows(counts, deltas)
+    if completed:
+        transaction.on_commit(lambda: enqueue_chunk_summaries(completed))
+
+
+def update_message_counts(deltas) -> Dict[int, int]:
+    """
+    Apply {conversation_id: delta} to the denormalised Conversation.message_count and
+    return the new counts, read back by the same UPDATE.
+    """
+    table = connection.ops.quote_name(Conversation._meta.db_table)
+    counts = {}
+    with connection.cursor() as cursor:
+        for conversation_id, delta in deltas.items():
+            cursor.execute(
+                f"UPDATE {table} SET message_count = message_count + %s WHERE id = %s RETURNING message_count",
+                [delta, conversation_id],
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                counts[conversation_id] = row[0]
+    return counts
+
+
+def completed_windows(counts, deltas) -> List[int]:
+    """
+    Conversations whose count crossed a multiple of CHUNK_MESSAGES, i.e. that may have a
+    new window to summarise. Windows missed after deletions or a failed job are picked up
+    by the next crossing, or by the final summary.
+    """
+    size = get_summary_settings()['CHUNK_MESSAGES']
+    return [
+        conversation_id for conversation_id, count in counts.items()
+        if count // size > (count - deltas[conversation_id]) // size
+    ]
+
+
+def invalidate_llm_cache(conversation_ids):
+    """Drop cached LLM responses built from these conversations' previous history."""
+    cache = get_llm_cache()
+    if cache is not None:
+        cache.invalidate_conversations(conversation_ids)
+
+
+def append_to_history_cache(messages):
+    cache = get_history_cache()
+    if cache is None:
+        return
+    by_conversation = defaultdict(list)
+    for message in messages:
+        by_conversation[message.conversation_id].append(message_record(message))
+    for conversation_id, records in by_conversation.items():
+        cache.append(conversation_id, records)
+
+
+def invalidate_history_cache(conversation_ids):
+    cache = get_history_cache()
+    if cache is not None:
+        cache.invalidate(conversation_ids)
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    if created:
+        handle_messages_created([instance])
+
+
+def deleting_conversation(origin) -> bool:
+    """Whether a delete started from Conversations (an instance or a queryset) and cascaded from there."""
+    return isinstance(origin, Conversation) or getattr(origin, 'model', None) is Conversation
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    # The instance's id is cleared once the delete completes, before the commit hooks run
+    message_id, conversation_id = instance.id, instance.conversation_id
+    transaction.on_commit(lambda: get_text_index().remove_message(message_id))
+    if deleting_conversation(origin):
+        # The conversation row goes too; conversation_deleted drops its caches once
+        return
+    update_message_counts({conversation_id: -1})
+    invalidate_llm_cache([conversation_id])
+    transaction.on_commit(lambda: invalidate_history_cache([conversation_id]))
+    transaction.on_commit(lambda: enqueue_embedding_reload([conversation_id]))
+
+
+@receiver(post_save, sender=Conversation)
+def conversation_saved(sender, instance, created, **kwargs):
+    transaction.on_commit(lambda: get_text_index().update_conversation(instance))
+    if created:
+        transaction.on_commit(lambda: known_conversations.remember([instance.id]))
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted(sender, instance, **kwargs):
+    conversation_id = instance.id
+    transaction.on_commit(lambda: get_text_index().remove_conversation(conversation_id))
+    known_conversations.forget([conversation_id])
+    invalidate_llm_cache([conversation_id])
+    transaction.on_commit(lambda: invalidate_history_cache([conversation_id]))
+    transaction.on_commit(lambda: enqueue_embedding_reload([conversation_id]))
@@ -0,0 +1,145 @@
+"""
+Rolling conversation summaries.
+
+Messages are summarised in windows of CHUNK_MESSAGES consecutive messages as the
+conversation grows (see chat.tasks.enqueue_chunk_summaries). When the conversation
+ends it is analysed from the stored window summaries plus the messages after the last
+full window, in one analyze_all call that returns the summary together with the
+sentiment, tone, topics and action items. Ending a conversation therefore costs one
+call over at most CHUNK_MESSAGES messages and the window summaries, however long the
+history is.
+
+Windows are not revisited when one of their messages is deleted or edited.
+
+The analytics are stored on the conversation, topics as ConversationTopic tags, which
+the conversation query endpoint filters on. The analytics endpoints only ever read
+these. Conversations that ended before analytics were stored (migration 0017), or
+whose analysis failed, are analysed by the backfill_conversation_analytics command.
+"""
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import metrics
+from .models import Conversation, ConversationSummaryChunk, ConversationTopic, Message
+
+
+def get_summary_settings():
+    options = {
+        'CHUNK_MESSAGES': 50,
+    }
+    options.update(getattr(settings, 'CONVERSATION_SUMMARY', {}))
+    return options
+
+
+def _last_chunk(conversation_id: int) -> Optional[ConversationSummaryChunk]:
+    return ConversationSummaryChunk.objects.filter(conversation_id=conversation_id).order_by('-index').first()
+
+
+def _messages_after(conversation_id: int, chunk: Optional[ConversationSummaryChunk]):
+    """Messages of the conversation that follow the window of `chunk`, oldest first."""
+    queryset = Message.objects.filter(conversation_id=conversation_id)
+    if chunk is not None:
+        queryset = queryset.filter(
+            Q(timestamp__gt=chunk.end_timestamp) | Q(timestamp=chunk.end_timestamp, id__gt=chunk.end_message_id)
+        )
+    return queryset.order_by('timestamp', 'id').values_list('id', 'content', 'sender', 'timestamp')
+
+
+def _as_analysis_input(rows) -> List[Dict]:
+    return [
+        {'content': content, 'sender': sender, 'timestamp': timestamp.isoformat()}
+        for _, content, sender, timestamp in rows
+    ]
+
+
+def pending_chunk_count(conversation_id: int) -> int:
+    """Number of windows update_chunk_summaries would summarise, one LLM call each."""
+    size = get_summary_settings()['CHUNK_MESSAGES']
+    return _messages_after(conversation_id, _last_chunk(conversation_id)).count() // size
+
+
+def update_chunk_summaries(conversation_id: int) -> int:
+    """Summarise every complete window not summarised yet; returns the number of new windows."""
+    from .ai.conversation_analyzer import get_conversation_analyzer
+
+    size = get_summary_settings()['CHUNK_MESSAGES']
+    last = _last_chunk(conversation_id)
+    created = 0
+    while True:
+        rows = list(_messages_after(conversation_id, last)[:size])
+        if len(rows) < size:
+            return created
+
+        with metrics.timer('summaries.chunk'):
+            summary = get_conversation_analyzer().summarize_chunk(
+                _as_analysis_input(rows), last.summary if last else None
+            )
+        end_id, _, _, end_timestamp = rows[-1]
+        try:
+            with transaction.atomic():
+                last = ConversationSummaryChunk.objects.create(
+                    conversation_id=conversation_id,
+                    index=last.index + 1 if last else 0,
+                    end_timestamp=end_timestamp,
+                    end_message_id=end_id,
+                    message_count=len(rows),
+                    summary=summary,
+                )
+        except IntegrityError:
+            # Another worker stored this window first; continue after its copy
+            last = _last_chunk(conversation_id)
+            continue
+        created += 1
+        metrics.increment('summaries.chunks_created')
+
+
+def analyze_conversation(conversation_id: int) -> Dict:
+    """
+    Summary, sentiment, topics and action items of the whole conversation (see
+    ConversationAnalyzer.analyze_all), from its window summaries and latest messages.
+    """
+    from .ai.conversation_analyzer import get_conversation_analyzer
+
+    update_chunk_summaries(conversation_id)
+    chunks = list(ConversationSummaryChunk.objects.filter(conversation_id=conversation_id).order_by('index'))
+    recent = _as_analysis_input(_messages_after(conversation_id, chunks[-1] if chunks else None))
+    parts = [
+        {'content': chunk.summary, 'sender': f'SUMMARY OF PART {chunk.index + 1}',
+         'timestamp': chunk.end_timestamp.isoformat()}
+        for chunk in chunks
+    ]
+    with metrics.timer('summaries.analysis'):
+        return get_conversation_analyzer().analyze_all(parts + recent, conversation_id)
+
+
+def normalize_topic(topic: str) -> str:
+    """Topic name as stored and matched: lowercase with single spaces."""
+    return ' '.join(str(topic).lower().split())[:100]
+
+
+def store_topics(conversation_id: int, topics: List[str]):
+    """Replace the topic tags of a conversation."""
+    names = {normalize_topic(topic) for topic in topics} - {''}
+    with transaction.atomic():
+        ConversationTopic.objects.filter(conversation_id=conversation_id).delete()
+        ConversationTopic.objects.bulk_create(
+            [ConversationTopic(conversation_id=conversation_id, name=name) for name in sorted(names)]
+        )
+
+
+def store_conversation_analytics(conversation_id: int, analysis: Dict):
+    """Store the sentiment, topics and action items of an analysis on the conversation."""
+    sentiment = analysis['sentiment']
+    with transaction.atomic():
+        store_topics(conversation_id, analysis['topics'])
+        Conversation.objects.filter(pk=conversation_id).update(
+            sentiment=str(sentiment.get('sentiment') or 'neutral')[:20],
+            tone=str(sentiment.get('tone') or 'neutral')[:50],
+            sentiment_confidence=sentiment.get('confidence'),
+            action_items=analysis['action_items'],
+            analyzed_at=timezone.now(),
+        )
@@ -0,0 +1,244 @@
+"""
+Background summary jobs.
+
+Ending a conversation only marks it PENDING; the summary is generated off the request
+path, either by a thread pool in the web process or by `manage.py run_summary_worker`.
+The Conversation rows themselves are the queue: a job is claimed by atomically moving
+it from PENDING to RUNNING, so several workers can drain the queue safely. Clients
+connected to the conversation's WebSocket are notified through the channel layer.
+With IN_PROCESS, a starting server process resumes the jobs its predecessor left
+PENDING or RUNNING.
+
+While a conversation is active, the same pool summarises each completed window of
+messages (see chat.summaries), so the final job only covers the latest messages. The
+final job also stores the conversation's analytics, from the same LLM call.
+
+New messages are embedded for semantic search by a separate single worker, so neither
+a request nor a summary waits on the encoder. It also rebuilds the search windows of
+conversations that lost messages; running one job at a time keeps both in order.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .ai.embeddings import embedding_store
+from .models import Conversation, SummaryStatus
+from .summaries import analyze_conversation, store_conversation_analytics, update_chunk_summaries
+
+_executor = None
+_executor_lock = threading.Lock()
+_chunk_jobs = set()
+_chunk_jobs_lock = threading.Lock()
+_embedding_executor = None
+_embedding_reloads = set()
+_embedding_lock = threading.Lock()
+
+
+def get_queue_settings():
+    options = {
+        'IN_PROCESS': True,
+        'WORKERS': 2,
+        'STALE_AFTER_SECONDS': 600,
+    }
+    options.update(getattr(settings, 'SUMMARY_QUEUE', {}))
+    return options
+
+
+def conversation_group_name(conversation_id) -> str:
+    """Channel layer group joined by every consumer attached to the conversation."""
+    return f"conversation_{conversation_id}"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_queue_settings()['WORKERS'],
+                    thread_name_prefix='summary-worker',
+                )
+    return _executor
+
+
+def _get_embedding_executor() -> ThreadPoolExecutor:
+    global _embedding_executor
+    if _embedding_executor is None:
+        with _embedding_lock:
+            if _embedding_executor is None:
+                _embedding_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding-worker')
+    return _embedding_executor
+
+
+def enqueue_summary(conversation_id: int):
+    """Schedule the summary job once the PENDING status is committed."""
+    if get_queue_settings()['IN_PROCESS']:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, run_summary_job, conversation_id))
+
+
+def enqueue_chunk_summaries(conversation_ids):
+    """Summarise newly completed message windows of these conversations in the background."""
+    if not get_queue_settings()['IN_PROCESS']:
+        return
+    for conversation_id in conversation_ids:
+        with _chunk_jobs_lock:
+            if conversation_id in _chunk_jobs:
+                continue  # the running job picks up the new messages too
+            _chunk_jobs.add(conversation_id)
+        _get_executor().submit(_run_in_thread, run_chunk_job, conversation_id)
+
+
+def enqueue_embeddings(messages):
+    """Encode and store the vectors of new messages in the background."""
+    _get_embedding_executor().submit(_run_in_thread, run_embedding_job, messages)
+
+
+def enqueue_embedding_reload(conversation_ids):
+    """Rebuild the search windows of conversations that lost messages, once per burst of deletes."""
+    with _embedding_lock:
+        queued = set(conversation_ids) - _embedding_reloads
+        _embedding_reloads.update(queued)
+    if queued:
+        _get_embedding_executor().submit(_run_in_thread, run_embedding_reload, queued)
+
+
+def _run_in_thread(job, argument):
+    try:
+        job(argument)
+    finally:
+        close_old_connections()
+
+
+def run_embedding_job(messages):
+    try:
+        embedding_store.add_messages(messages)
+    except Exception as e:
+        # Messages left without a vector are embedded when a search first needs them
+        print(f"Warning: Could not embed messages: {e}")
+
+
+def run_embedding_reload(conversation_ids):
+    with _embedding_lock:
+        # Deletes from now on queue another reload
+        _embedding_reloads.difference_update(conversation_ids)
+    try:
+        embedding_store.reload_conversations(conversation_ids)
+    except Exception as e:
+        print(f"Warning: Could not reload search windows of conversations {sorted(conversation_ids)}: {e}")
+
+
+def run_chunk_job(conversation_id: int):
+    try:
+        update_chunk_summaries(conversation_id)
+    except Exception as e:
+        # Windows left behind are summarised by the next job or when the conversation ends
+        print(f"Error summarising message windows of conversation {conversation_id}: {e}")
+    finally:
+        with _chunk_jobs_lock:
+            _chunk_jobs.discard(conversation_id)
+
+
+def claim_pending(conversation_id: int) -> bool:
+    """Move a PENDING job to RUNNING; False if another worker already took it."""
+    return bool(
+        Conversation.objects.filter(pk=conversation_id, summary_status=SummaryStatus.PENDING.value)
+        .update(summary_status=SummaryStatus.RUNNING.value, updated_at=timezone.now())
+    )
+
+
+def run_summary_job(conversation_id: int):
+    """Generate and store the summary of one conversation, then notify listeners."""
+    from .messages.message_writer import flush_pending
+
+    # Its last messages may still be queued for write-behind in this process
+    flush_pending(conversation_id)
+    if not claim_pending(conversation_id):
+        return
+
+    conversation = Conversation.objects.get(pk=conversation_id)
+    analysis = None
+    try:
+        # One call for the summary and the analytics
+        analysis = analyze_conversation(conversation_id)
+        conversation.summary = analysis['summary']
+        conversation.summary_status = SummaryStatus.COMPLETED.value
+    except Exception as e:
+        print(f"Error generating summary for conversation {conversation_id}: {e}")
+        conversation.summary_status = SummaryStatus.FAILED.value
+    conversation.save(update_fields=['summary', 'summary_status', 'updated_at'])
+
+    if analysis is not None:
+        try:
+            store_conversation_analytics(conversation_id, analysis)
+        except Exception as e:
+            # The conversation keeps its previous analytics; backfill_conversation_analytics retries
+            print(f"Error storing analytics of conversation {conversation_id}: {e}")
+    notify_summary_ready(conversation)
+
+
+def notify_summary_ready(conversation: Conversation):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            conversation_group_name(conversation.id),
+            {
+                'type': 'summary.ready',
+                'conversation_id': conversation.id,
+                'summary': conversation.summary,
+                'summary_status': conversation.summary_status,
+            },
+        )
+    except Exception as e:
+        # A missing channel layer must not fail the job; clients can still poll
+        print(f"Warning: Could not notify summary for conversation {conversation.id}: {e}")
+
+
+def resume_interrupted_jobs() -> int:
+    """
+    Queue the jobs a previous process left unfinished in this process's pool: RUNNING
+    jobs abandoned for STALE_AFTER_SECONDS, and PENDING jobs that were only waiting in
+    its thread pool. Returns the number of jobs queued.
+    """
+    requeue_stale_jobs()
+    pending = list(
+        Conversation.objects.filter(summary_status=SummaryStatus.PENDING.value)
+        .order_by('updated_at')
+        .values_list('id', flat=True)
+    )
+    for conversation_id in pending:
+        _get_executor().submit(_run_in_thread, run_summary_job, conversation_id)
+    return len(pending)
+
+
+def start_in_process_queue():
+    """Called as a server process starts: resume interrupted jobs when they run in-process."""
+    if get_queue_settings()['IN_PROCESS']:
+        threading.Thread(target=_resume_in_background, name='summary-resume', daemon=True).start()
+
+
+def _resume_in_background():
+    try:
+        resumed = resume_interrupted_jobs()
+        if resumed:
+            print(f"Resumed {resumed} interrupted summary jobs")
+    except Exception as e:
+        # The database may not be migrated yet; jobs are resumed by the next start
+        print(f"Warning: Could not resume summary jobs: {e}")
+    finally:
+        close_old_connections()
+
+
+def requeue_stale_jobs() -> int:
+    """Return RUNNING jobs abandoned by a crashed worker to the queue."""
+    stale_before = timezone.now() - timedelta(seconds=get_queue_settings()['STALE_AFTER_SECONDS'])
+    return Conversation.objects.filter(
+        summary_status=SummaryStatus.RUNNING.value, updated_at__lt=stale_before
+    ).update(summary_status=SummaryStatus.PENDING.value, updated_at=timezone.now())
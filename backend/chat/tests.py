@@ -1,3 +1,1245 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+import numpy as np
+
+from asgiref.sync import async_to_sync
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from langchain.schema import AIMessage
+from rest_framework.test import APIClient
+
+from .agents.agent_factory import AgentFactory
+from .agents.agent_pool import AgentPool
+from .agents.callbacks import AsyncStreamingCallbackHandler
+from .ai.ann import ExactIndex, IVFIndex, top_k
+from .ai.context_packer import ContextPacker, estimate_tokens
+from .ai.embeddings import EMBEDDING_DIMENSIONS, EmbeddingStore, normalize
+from .ai.excerpts import ExcerptExtractor
+from .ai.conversation_analyzer import ConversationAnalyzer
+from .ai.llm_cache import LLMResponseCache, LocalLRUCache
+from .ai.text_index import InProcessTextIndex, get_text_index
+from .messages.chat_message_repository import ChatMessageRepository
+from .messages.history_cache import HistoryCache, LocalHistoryCache, RedisHistoryCache, get_history_cache
+from .messages.message_writer import MessageWriter
+from .models import (
+    Conversation, ConversationStatus, ConversationSummaryChunk, ConversationTopic, Message, MessageEmbedding,
+    MessageSender, SummaryStatus,
+)
+from .summaries import analyze_conversation
+from .tasks import resume_interrupted_jobs, run_summary_job
+from .views import ConversationQueryView, load_conversations_data
+
+
+def keep_test_connection(test_case):
+    """
+    database_sync_to_async closes the thread's connection when it is inside a transaction,
+    which under TestCase is the test's own connection; leave it open for the test.
+    """
+    patcher = mock.patch('channels.db.close_old_connections')
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+def fresh_history_cache(test_case, per_conversation=5):
+    """
+    A local history cache for one test. The process-wide cache outlives the test's
+    rolled-back transaction, and the default would reach for Redis.
+    """
+    override = override_settings(HISTORY_CACHE={'BACKEND': 'local'})
+    override.enable()
+    test_case.addCleanup(override.disable)
+    cache = HistoryCache(
+        LocalHistoryCache(per_conversation, max_conversations=10, max_messages=100, idle_seconds=60), per_conversation
+    )
+    patcher = mock.patch('chat.messages.history_cache._cache', cache)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return cache
+
+
+class LoadConversationsDataTests(TestCase):
+    def add_conversations(self, count):
+        for i in range(count):
+            conversation = Conversation.objects.create(title=f"Conversation {i}")
+            for j in range(3):
+                Message.objects.create(conversation=conversation, content=f"m{j}", sender=MessageSender.USER.value)
+        Conversation.objects.create(title="Empty")
+
+    def test_query_count_does_not_grow_with_conversations(self):
+        self.add_conversations(2)
+        with self.assertNumQueries(2):
+            small = load_conversations_data(Conversation.objects.all())
+
+        self.add_conversations(8)
+        with self.assertNumQueries(2):
+            large = load_conversations_data(Conversation.objects.all())
+
+        self.assertEqual(len(small), 2)
+        self.assertEqual(len(large), 10)
+        self.assertTrue(all([m['content'] for m in conv['messages']] == ["m0", "m1", "m2"] for conv in large))
+
+
+class ConversationMessageCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_message_count_tracks_inserts_and_deletes(self):
+        conversation = Conversation.objects.create(title="Counting")
+        first = Message.objects.create(conversation=conversation, content="one", sender=MessageSender.USER.value)
+        Message.objects.create(conversation=conversation, content="two", sender=MessageSender.AI.value)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 2)
+
+        first.delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 1)
+
+    def test_deleting_conversation_does_not_update_its_count_per_message(self):
+        conversation = Conversation.objects.create(title="Doomed")
+        for i in range(5):
+            Message.objects.create(conversation=conversation, content=f"m{i}", sender=MessageSender.USER.value)
+
+        with CaptureQueriesContext(connection) as queries:
+            conversation.delete()
+
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in queries.captured_queries))
+        self.assertFalse(Message.objects.exists())
+
+    def test_list_uses_constant_number_of_queries(self):
+        for i in range(20):
+            conversation = Conversation.objects.create(title=f"Conversation {i}")
+            Message.objects.create(conversation=conversation, content="hello", sender=MessageSender.USER.value)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/conversations/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertTrue(all(conv['message_count'] == 1 for conv in response.data['results']))
+
+
+class ConversationPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.conversation = Conversation.objects.create(title="Long conversation")
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation, content=f"message {i}", sender=MessageSender.USER.value)
+
+    def test_retrieve_returns_latest_page_and_older_messages_cursor(self):
+        response = self.client.get(f'/api/conversations/{self.conversation.id}/?page_size=2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([msg['content'] for msg in response.data['messages']], ["message 3", "message 4"])
+        self.assertEqual(response.data['message_count'], 5)
+        self.assertIsNotNone(response.data['older_messages'])
+
+    def test_older_messages_walk_back_to_the_start(self):
+        url = f'/api/conversations/{self.conversation.id}/messages/?page_size=2'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([msg['content'] for msg in response.data['results']])
+            url = response.data['next']
+
+        self.assertEqual(pages, [["message 3", "message 4"], ["message 1", "message 2"], ["message 0"]])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'/api/conversations/{self.conversation.id}/messages/?cursor=bogus')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class TextIndexTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        # Fresh in-process index per test so rows rolled back by other tests are not indexed
+        patcher = mock.patch('chat.ai.text_index._in_process_index', InProcessTextIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_list_search_matches_title_prefixes(self):
+        Conversation.objects.create(title="Quarterly budget review")
+        Conversation.objects.create(title="Holiday plans")
+
+        response = self.client.get('/api/conversations/?search=budg')
+
+        self.assertEqual([conv['title'] for conv in response.data['results']], ["Quarterly budget review"])
+
+    def test_keyword_scores_come_from_message_index(self):
+        budget = Conversation.objects.create(title="Planning")
+        other = Conversation.objects.create(title="Chit-chat")
+        Message.objects.create(conversation=budget, content="The budget is due Friday", sender=MessageSender.USER.value)
+        Message.objects.create(conversation=other, content="Nice weather today", sender=MessageSender.USER.value)
+
+        scores = get_text_index().score_conversations("budget deadline", [budget.id, other.id])
+
+        self.assertEqual(set(scores), {budget.id})
+
+
+    def test_in_process_index_only_sees_committed_messages(self):
+        index = InProcessTextIndex()
+        index._loaded = True
+        conversation = Conversation.objects.create(title="Planning")
+        with mock.patch('chat.signals.get_text_index', return_value=index):
+            with self.captureOnCommitCallbacks() as callbacks:
+                Message.objects.create(conversation=conversation, content="budget", sender=MessageSender.USER.value)
+            self.assertEqual(index.score_conversations("budget"), {})
+
+            for callback in callbacks:
+                callback()
+        self.assertEqual(set(index.score_conversations("budget")), {conversation.id})
+
+    def test_search_vector_is_not_fetched(self):
+        conversation = Conversation.objects.create(title="Planning")
+        Message.objects.create(conversation=conversation, content="budget", sender=MessageSender.USER.value)
+
+        self.assertIn('search_vector', Message.objects.get().get_deferred_fields())
+        self.assertIn('search_vector', conversation.messages.get().get_deferred_fields())
+
+
+def analysis(summary, topics=(), action_items=()):
+    return {
+        'summary': summary,
+        'sentiment': {'sentiment': 'neutral', 'tone': 'neutral', 'confidence': 0.5},
+        'topics': list(topics),
+        'action_items': list(action_items),
+    }
+
+
+class SummaryJobTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.conversation = Conversation.objects.create(title="To summarise")
+        Message.objects.create(conversation=self.conversation, content="hello", sender=MessageSender.USER.value)
+
+    def test_end_returns_immediately_with_pending_summary(self):
+        with mock.patch('chat.views.enqueue_summary') as enqueue:
+            response = self.client.post(f'/api/conversations/{self.conversation.id}/end/')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['summary_status'], SummaryStatus.PENDING.value)
+        enqueue.assert_called_once_with(self.conversation.id)
+
+    def test_summary_job_stores_summary_once(self):
+        self.conversation.end_conversation()
+
+        with mock.patch('chat.ai.conversation_analyzer.get_conversation_analyzer') as analyzer:
+            analyzer.return_value.analyze_all.return_value = analysis("A short greeting.")
+            run_summary_job(self.conversation.id)
+            run_summary_job(self.conversation.id)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, "A short greeting.")
+        self.assertEqual(self.conversation.summary_status, SummaryStatus.COMPLETED.value)
+        analyzer.return_value.analyze_all.assert_called_once()
+
+
+    def test_interrupted_jobs_are_resumed(self):
+        self.conversation.end_conversation()
+        stale = Conversation.objects.create(title="Stale", summary_status=SummaryStatus.RUNNING.value)
+        running = Conversation.objects.create(title="Running", summary_status=SummaryStatus.RUNNING.value)
+        Conversation.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with mock.patch('chat.tasks._get_executor') as executor:
+            self.assertEqual(resume_interrupted_jobs(), 2)
+
+        submitted = {call.args[2] for call in executor.return_value.submit.call_args_list}
+        self.assertEqual(submitted, {self.conversation.id, stale.id})
+        running.refresh_from_db()
+        self.assertEqual(running.summary_status, SummaryStatus.RUNNING.value)
+
+
+class AnalyzeAllTests(SimpleTestCase):
+    messages = [{'sender': 'USER', 'content': "Let's ship on Friday", 'timestamp': '2024-01-01T10:00:00'}]
+
+    def test_single_call_parses_fenced_json(self):
+        llm = mock.Mock()
+        llm.invoke.return_value = AIMessage(content=(
+            'Here you go:\n```json\n{"summary": "Release planning.", "sentiment": "Positive", "tone": "casual", '
+            '"confidence": 2, "topics": "release, schedule", "action_items": ["Ship on Friday"]}\n```'
+        ))
+
+        result = ConversationAnalyzer(llm=llm, cache=LLMResponseCache(LocalLRUCache())).analyze_all(self.messages)
+
+        llm.invoke.assert_called_once()
+        self.assertEqual(result['summary'], "Release planning.")
+        self.assertEqual(result['sentiment'], {'sentiment': 'positive', 'tone': 'casual', 'confidence': 1.0})
+        self.assertEqual(result['topics'], ['release', 'schedule'])
+        self.assertEqual(result['action_items'], ['Ship on Friday'])
+
+    def test_falls_back_to_individual_calls_on_invalid_json(self):
+        llm = mock.Mock()
+        llm.invoke.return_value = AIMessage(content="not json")
+
+        result = ConversationAnalyzer(llm=llm, cache=LLMResponseCache(LocalLRUCache())).analyze_all(self.messages)
+
+        self.assertEqual(llm.invoke.call_count, 5)
+        self.assertEqual(result['summary'], "not json")
+        self.assertEqual(result['sentiment']['sentiment'], 'neutral')
+
+
+class LLMCacheTests(TestCase):
+    def setUp(self):
+        self.cache = LLMResponseCache(LocalLRUCache(max_entries=2))
+        patcher = mock.patch('chat.ai.llm_cache._cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.conversation = Conversation.objects.create(title="Cached")
+        Message.objects.create(conversation=self.conversation, content="hello", sender=MessageSender.USER.value)
+        self.llm = mock.Mock(model_name="test-model", temperature=0.3)
+        self.llm.invoke.return_value = AIMessage(content="A greeting.")
+        self.analyzer = ConversationAnalyzer(llm=self.llm)
+        self.messages = [{'sender': 'USER', 'content': "hello", 'timestamp': '2024-01-01T10:00:00'}]
+
+    def test_identical_prompt_is_served_from_cache(self):
+        first = self.analyzer.generate_summary(self.messages, self.conversation.id)
+        second = self.analyzer.generate_summary(self.messages, self.conversation.id)
+
+        self.assertEqual(first, second)
+        self.llm.invoke.assert_called_once()
+
+    def test_new_message_invalidates_conversation_entries(self):
+        self.analyzer.generate_summary(self.messages, self.conversation.id)
+        Message.objects.create(conversation=self.conversation, content="again", sender=MessageSender.USER.value)
+        self.analyzer.generate_summary(self.messages, self.conversation.id)
+
+        self.assertEqual(self.llm.invoke.call_count, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for text in ("one", "two", "three"):
+            self.analyzer.extract_topics([{'sender': 'USER', 'content': text}])
+        self.analyzer.extract_topics([{'sender': 'USER', 'content': "one"}])
+
+        self.assertEqual(self.llm.invoke.call_count, 4)
+
+
+@override_settings(CONVERSATION_SUMMARY={'CHUNK_MESSAGES': 2})
+class RollingSummaryTests(TestCase):
+    def setUp(self):
+        self.conversation = Conversation.objects.create(title="Long")
+        self.add_messages(5)
+        patcher = mock.patch('chat.ai.conversation_analyzer.get_conversation_analyzer')
+        self.analyzer = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.analyzer.summarize_chunk.side_effect = lambda messages, previous: f"{len(messages)} messages"
+        self.analyzer.analyze_all.return_value = analysis("Whole conversation.")
+
+    def add_messages(self, count):
+        for i in range(count):
+            Message.objects.create(conversation=self.conversation, content=f"m{i}", sender=MessageSender.USER.value)
+
+    def analysed_input(self):
+        messages, _ = self.analyzer.analyze_all.call_args.args
+        return [(message['sender'], message['content']) for message in messages]
+
+    def test_analysis_is_composed_from_window_summaries(self):
+        result = analyze_conversation(self.conversation.id)
+
+        self.assertEqual(result['summary'], "Whole conversation.")
+        self.assertEqual(ConversationSummaryChunk.objects.filter(conversation=self.conversation).count(), 2)
+        self.assertEqual(self.analysed_input(), [
+            ("SUMMARY OF PART 1", "2 messages"), ("SUMMARY OF PART 2", "2 messages"), (MessageSender.USER.value, "m4"),
+        ])
+
+    def test_only_new_messages_are_summarised_again(self):
+        analyze_conversation(self.conversation.id)
+        self.add_messages(2)
+        analyze_conversation(self.conversation.id)
+
+        self.assertEqual(self.analyzer.summarize_chunk.call_count, 3)
+        self.assertEqual(self.analysed_input()[-1], (MessageSender.USER.value, "m1"))
+
+
+    def test_chunk_job_is_queued_only_when_a_window_fills(self):
+        with mock.patch('chat.signals.enqueue_chunk_summaries') as enqueue:
+            for i in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Message.objects.create(conversation=self.conversation, content=f"n{i}", sender=MessageSender.AI.value)
+
+        # 5 messages already: the 6th completes a window of 2, the 7th does not
+        enqueue.assert_called_once_with([self.conversation.id])
+
+
+class ContextPackerTests(SimpleTestCase):
+    def conversation(self, conv_id, contents, summary=None):
+        return {
+            'id': conv_id,
+            'title': f"Conversation {conv_id}",
+            'start_timestamp': '2024-01-01T10:00:00',
+            'summary': summary,
+            'messages': [{'sender': 'USER', 'content': content, 'timestamp': '2024-01-01T10:00:00'} for content in contents],
+        }
+
+    def test_most_relevant_messages_fit_the_budget(self):
+        filler = ["we talked about the weather and lunch plans for a while"] * 40
+        conversations = [self.conversation(1, filler[:20] + ["the database migration is scheduled for friday"] + filler[20:])]
+
+        text, usage = ContextPacker(token_budget=60).pack("when is the database migration", conversations)
+
+        self.assertIn("database migration is scheduled", text)
+        self.assertLessEqual(usage['tokens_used'], 60)
+        self.assertEqual(usage['messages_included'] + usage['messages_dropped'], 41)
+        self.assertGreater(usage['tokens_dropped'], 0)
+
+    def test_shorter_summary_replaces_unrelated_messages(self):
+        conversations = [self.conversation(1, ["a long discussion about quarterly planning"] * 10, summary="Planning.")]
+
+        text, usage = ContextPacker(token_budget=1000).pack("budget", conversations)
+
+        self.assertIn("Summary: Planning.", text)
+        self.assertEqual(usage['summaries_used'], 1)
+        self.assertEqual(usage['messages_included'], 0)
+
+    def test_token_estimate_counts_words_and_punctuation(self):
+        self.assertEqual(estimate_tokens("Hello, world!"), 4)
+        self.assertEqual(estimate_tokens("internationalization"), 4)
+
+
+class ConversationQueryStreamTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        conversation = Conversation.objects.create(title="Release planning")
+        Message.objects.create(conversation=conversation, content="ship the release friday", sender=MessageSender.USER.value)
+        llm = mock.Mock()
+        llm.stream.return_value = iter([AIMessage(content="On "), AIMessage(content="Friday.")])
+        analyzer = ConversationAnalyzer(llm=llm, cache=LLMResponseCache(LocalLRUCache()))
+        patcher = mock.patch('chat.views.get_conversation_analyzer', return_value=analyzer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_context_is_sent_before_answer_tokens(self):
+        response = self.client.post('/api/conversations/query/stream/', {'query': "when is the release"}, format='json')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        events = [block.split('\n')[0] for block in body.strip().split('\n\n')]
+        self.assertEqual(events, ['event: context', 'event: token', 'event: token', 'event: done'])
+        self.assertIn('"title": "Release planning"', body)
+        self.assertIn('"answer": "On Friday."', body)
+
+
+class AgentPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = mock.Mock()
+        self.factory.build_agent.side_effect = lambda tool_names: mock.Mock(memory=None)
+        self.factory.load_agent_memory = mock.AsyncMock(side_effect=lambda conversation_id: f"memory {conversation_id}")
+        self.pool = AgentPool(["llm-math"], max_idle=1, factory=self.factory)
+
+    def test_released_agent_is_reused_with_new_memory(self):
+        first = async_to_sync(self.pool.acquire)("1")
+        self.pool.release(first)
+        second = async_to_sync(self.pool.acquire)("2")
+
+        self.assertIs(first, second)
+        self.assertEqual(second.memory, "memory 2")
+        self.factory.build_agent.assert_called_once()
+
+    def test_idle_agents_are_capped(self):
+        agents = [async_to_sync(self.pool.acquire)(str(i)) for i in range(3)]
+        for agent in agents:
+            self.pool.release(agent)
+
+        self.assertEqual(len(self.pool._idle), 1)
+        self.assertIsNone(agents[-1].memory)
+
+
+@override_settings(AGENT_MEMORY={'MODE': 'window', 'MAX_MESSAGES': 4, 'MAX_TOKENS': 1000})
+class WindowedMemoryTests(TestCase):
+    def setUp(self):
+        keep_test_connection(self)
+        fresh_history_cache(self)
+        self.conversation = Conversation.objects.create(title="Long", summary="They planned a release.")
+        for i in range(10):
+            sender = MessageSender.USER.value if i % 2 == 0 else MessageSender.AI.value
+            Message.objects.create(conversation=self.conversation, content=f"message {i}", sender=sender)
+
+    def history(self, memory):
+        return [message.content for message in memory.load_memory_variables({})['chat_history']]
+
+    def test_only_latest_messages_are_loaded_after_the_summary(self):
+        memory = async_to_sync(AgentFactory().load_agent_memory)(str(self.conversation.id))
+
+        self.assertEqual(self.history(memory), [
+            "Summary of the earlier conversation: They planned a release.",
+            "message 6", "message 7", "message 8", "message 9",
+        ])
+
+    def test_no_summary_when_the_window_holds_everything(self):
+        short = Conversation.objects.create(title="Short", summary="Nothing older.")
+        for i in range(4):
+            Message.objects.create(conversation=short, content=f"short {i}", sender=MessageSender.USER.value)
+
+        memory = async_to_sync(AgentFactory().load_agent_memory)(str(short.id))
+
+        self.assertEqual(self.history(memory), ["short 0", "short 1", "short 2", "short 3"])
+
+    def test_window_holds_during_the_session(self):
+        memory = async_to_sync(AgentFactory().load_agent_memory)(str(self.conversation.id))
+        memory.max_tokens = 4
+        memory.save_context({'input': "question"}, {'output': "answer"})
+
+        self.assertEqual(len(memory.chat_memory.messages), 4)
+        self.assertEqual(self.history(memory)[1:], ["question", "answer"])
+
+
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        keep_test_connection(self)
+        self.cache = fresh_history_cache(self)
+
+        self.conversation = Conversation.objects.create(title="Cached history")
+        for i in range(3):
+            Message.objects.create(conversation=self.conversation, content=f"m{i}", sender=MessageSender.USER.value)
+        self.repository = ChatMessageRepository()
+
+    def recent(self, limit):
+        return [message.content for message in async_to_sync(self.repository.get_recent_messages)(self.conversation.id, limit)]
+
+    def test_second_read_is_served_from_memory(self):
+        self.assertEqual(self.recent(2), ["m1", "m2"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.recent(10), ["m0", "m1", "m2"])
+
+    def test_saved_messages_are_written_through(self):
+        self.recent(2)
+        with mock.patch('chat.signals.enqueue_chunk_summaries'), self.captureOnCommitCallbacks(execute=True):
+            async_to_sync(self.repository.save_message)("m3", MessageSender.AI.value, self.conversation.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.recent(2), ["m2", "m3"])
+
+    def test_fill_read_before_a_write_is_discarded(self):
+        version = self.cache.version(self.conversation.id)
+        # Another writer appends between the database read and the fill
+        self.cache.append(self.conversation.id, [])
+        self.cache.fill(self.conversation.id, [], complete=True, version=version)
+
+        self.assertIsNone(self.cache.recent(self.conversation.id))
+        self.cache.fill(self.conversation.id, [], complete=True, version=self.cache.version(self.conversation.id))
+        self.assertEqual(self.cache.recent(self.conversation.id), [])
+
+    def test_versions_expire_with_idle_entries(self):
+        backend = LocalHistoryCache(5, max_conversations=10, max_messages=100, idle_seconds=60)
+        backend.invalidate(1)
+        self.assertEqual(backend.version(1), 1)
+
+        with mock.patch('chat.messages.history_cache.time.monotonic', return_value=time.monotonic() + 120):
+            backend.set(2, [], complete=True, version=0)
+
+        self.assertEqual(backend.version(1), 0)
+
+    def test_auto_backend_follows_the_channel_layer(self):
+        with mock.patch('chat.messages.history_cache._cache', None), override_settings(HISTORY_CACHE={'BACKEND': 'auto'}):
+            with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+                self.assertIsNone(get_history_cache())
+            with mock.patch('redis.Redis.from_url'):
+                self.assertIsInstance(get_history_cache().backend, RedisHistoryCache)
+
+    def test_least_recently_used_conversations_are_evicted_by_size(self):
+        backend = LocalHistoryCache(5, max_conversations=2, max_messages=100, idle_seconds=60)
+        for conversation_id in (1, 2, 3):
+            backend.set(conversation_id, [], complete=True, version=0)
+
+        self.assertIsNone(backend.get(1))
+        self.assertIsNotNone(backend.get(3))
+
+
+class RecordingConsumer:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.frames = []
+
+    async def send(self, text_data):
+        await asyncio.sleep(self.delay)
+        self.frames.append(json.loads(text_data)['message'])
+
+
+class TokenStreamingTests(SimpleTestCase):
+    def stream(self, consumer, tokens, **options):
+        async def run():
+            handler = AsyncStreamingCallbackHandler(consumer, **options)
+            run_id = uuid4()
+            for token in tokens:
+                await handler.on_llm_new_token(token, run_id=run_id)
+                await asyncio.sleep(0)
+            await handler.on_llm_end(None, run_id=run_id)
+
+        asyncio.run(run())
+
+    def test_per_token_frames_without_coalescing(self):
+        consumer = RecordingConsumer()
+        self.stream(consumer, ["a", "b", "c"], COALESCE=False)
+        self.assertEqual(consumer.frames, ["a", "b", "c", "\n\n"])
+
+    def test_coalescing_batches_tokens_in_order(self):
+        consumer = RecordingConsumer()
+        tokens = [f"t{i} " for i in range(100)]
+        self.stream(consumer, tokens, COALESCE=True, FLUSH_INTERVAL_MS=1000, MAX_FRAME_CHARS=64)
+        self.assertEqual("".join(consumer.frames[:-1]), "".join(tokens))
+        self.assertLess(len(consumer.frames), 20)
+        self.assertEqual(consumer.frames[-1], "\n\n")
+
+    def test_tokens_left_by_the_interval_are_sent_by_the_timer(self):
+        consumer = RecordingConsumer()
+
+        async def run():
+            handler = AsyncStreamingCallbackHandler(consumer, COALESCE=True, FLUSH_INTERVAL_MS=10, MAX_FRAME_CHARS=64)
+            await handler.on_llm_new_token("early", run_id=uuid4())
+            await asyncio.sleep(0.05)
+            self.assertEqual(consumer.frames, ["early"])
+            await handler.on_llm_new_token("late", run_id=uuid4())
+            await handler.drain()
+
+        asyncio.run(run())
+        self.assertEqual(consumer.frames, ["early", "late"])
+
+
+class MessageWriterTests(TestCase):
+    def setUp(self):
+        keep_test_connection(self)
+        fresh_history_cache(self)
+        # Not started: the tests flush on the test thread, inside the test transaction
+        self.writer = MessageWriter(flush_interval=60, max_batch=3, max_pending=100)
+        patcher = mock.patch('chat.messages.message_writer._writer', self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('chat.signals.enqueue_chunk_summaries')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.first = Conversation.objects.create(title="First")
+        self.second = Conversation.objects.create(title="Second")
+        self.repository = ChatMessageRepository()
+
+    def test_queue_message_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            async_to_sync(self.repository.queue_message)("hi", MessageSender.USER.value, str(self.first.id))
+        self.assertTrue(self.writer.has_pending(self.first.id))
+        self.assertFalse(Message.objects.exists())
+
+    def test_flush_batches_across_conversations_in_order(self):
+        for i in range(4):
+            self.writer.submit(self.first.id, MessageSender.USER.value, f"a{i}")
+            self.writer.submit(self.second.id, MessageSender.AI.value, f"b{i}")
+        self.writer.submit(self.second.id + 100, MessageSender.USER.value, "lost")
+
+        self.writer.flush()
+
+        self.assertEqual([m.content for m in Message.objects.filter(conversation=self.first)], ["a0", "a1", "a2", "a3"])
+        self.assertEqual([m.content for m in Message.objects.filter(conversation=self.second)], ["b0", "b1", "b2", "b3"])
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.message_count, 4)
+        self.assertFalse(self.writer.has_pending(self.first.id))
+
+    def test_a_poisoned_message_does_not_block_the_others(self):
+        for content in ["a0", "a1", "bad\x00", "a3", "a4"]:
+            self.writer.submit(self.first.id, MessageSender.USER.value, content)
+
+        with mock.patch('chat.messages.message_writer.metrics') as metrics:
+            for _ in range(4):
+                self.writer.flush()
+
+        self.assertEqual([m.content for m in Message.objects.filter(conversation=self.first)], ["a0", "a1", "a3", "a4"])
+        self.assertFalse(self.writer.has_pending(self.first.id))
+        metrics.increment.assert_any_call('message_writer.dropped')
+
+    def test_batches_are_retried_whole_while_the_database_is_unreachable(self):
+        self.writer.submit(self.first.id, MessageSender.USER.value, "kept")
+
+        with mock.patch.object(self.writer, '_write', side_effect=OperationalError("connection refused")):
+            for _ in range(3):
+                self.writer.flush()
+        self.writer.flush()
+
+        self.assertEqual([m.content for m in Message.objects.filter(conversation=self.first)], ["kept"])
+
+    def test_reads_include_queued_messages(self):
+        self.writer.submit(self.first.id, MessageSender.USER.value, "queued")
+        messages = async_to_sync(self.repository.get_recent_messages)(self.first.id, 10)
+        self.assertEqual([m.content for m in messages], ["queued"])
+
+    def test_ending_writes_queued_messages_before_the_summary_is_queued(self):
+        self.writer.submit(self.first.id, MessageSender.USER.value, "last words")
+
+        def enqueue(conversation_id):
+            self.assertEqual(Message.objects.get(conversation_id=conversation_id).content, "last words")
+
+        with mock.patch('chat.views.enqueue_summary', side_effect=enqueue) as enqueue_summary:
+            response = APIClient().post(f'/api/conversations/{self.first.id}/end/')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['message_count'], 1)
+        enqueue_summary.assert_called_once_with(self.first.id)
+
+    def test_summary_job_writes_queued_messages_first(self):
+        self.writer.submit(self.first.id, MessageSender.USER.value, "queued")
+        self.first.end_conversation()
+
+        with mock.patch('chat.tasks.analyze_conversation', side_effect=lambda conversation_id: analysis(
+            Message.objects.get(conversation_id=conversation_id).content
+        )), mock.patch('chat.tasks.store_conversation_analytics'), mock.patch('chat.tasks.notify_summary_ready'):
+            run_summary_job(self.first.id)
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.summary, "queued")
+
+    def test_conversation_page_includes_queued_messages(self):
+        self.writer.submit(self.first.id, MessageSender.USER.value, "queued")
+
+        response = APIClient().get(f'/api/conversations/{self.first.id}/')
+
+        self.assertEqual([m['content'] for m in response.data['messages']], ["queued"])
+        self.assertEqual(response.data['message_count'], 1)
+
+    def test_messages_queued_after_the_end_are_dropped(self):
+        self.first.end_conversation()
+        self.writer.submit(self.first.id, MessageSender.USER.value, "too late")
+        self.writer.submit(self.second.id, MessageSender.USER.value, "kept")
+
+        self.writer.flush()
+
+        self.assertEqual([m.content for m in Message.objects.all()], ["kept"])
+        self.assertFalse(self.writer.has_pending(self.first.id))
+
+    def test_failed_batch_is_kept_for_the_next_flush(self):
+        self.writer.submit(self.first.id, MessageSender.USER.value, "retry me")
+        with mock.patch.object(Message.objects, 'bulk_create', side_effect=RuntimeError("database down")):
+            self.writer.flush()
+        self.assertTrue(self.writer.has_pending(self.first.id))
+
+        self.writer.flush()
+        self.assertEqual(Message.objects.get().content, "retry me")
+
+
+class SaveMessageTests(TestCase):
+    def setUp(self):
+        keep_test_connection(self)
+        fresh_history_cache(self)
+        patcher = mock.patch('chat.messages.known_conversations._known', OrderedDict())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('chat.signals.enqueue_chunk_summaries')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.repository = ChatMessageRepository()
+
+    def save(self, conversation_id, content="hello"):
+        return async_to_sync(self.repository.save_message)(content, MessageSender.USER.value, conversation_id)
+
+    def test_known_conversation_is_not_read_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation = Conversation.objects.create(title="Known")
+        # The insert and the message count update
+        with self.assertNumQueries(2):
+            self.save(str(conversation.id))
+        self.assertEqual(conversation.messages.count(), 1)
+
+    def test_unknown_conversation_is_checked_once(self):
+        conversation = Conversation.objects.create(title="Unknown")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.save(conversation.id)
+        with self.assertNumQueries(2):
+            self.save(conversation.id)
+
+    def test_missing_and_deleted_conversations_are_not_saved(self):
+        self.assertIsNone(self.save(12345))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation = Conversation.objects.create(title="Deleted")
+        conversation_id = conversation.id
+        conversation.delete()
+        self.assertIsNone(self.save(conversation_id))
+        self.assertFalse(Message.objects.exists())
+
+
+class ChunkRetrievalTests(SimpleTestCase):
+    def test_windows_cover_each_conversation_in_message_order(self):
+        store = EmbeddingStore()
+        vectors = np.eye(EMBEDDING_DIMENSIONS, dtype=np.float32)
+        # Conversations interleave; each keeps its own windows
+        for conversation_id, dimension in ((1, 0), (1, 1), (2, 5), (1, 2), (1, 3), (1, 4)):
+            store._add_to_windows(conversation_id, vectors[dimension], size=2, stride=2)
+
+        windows = store._windows[:store._window_count]
+        self.assertEqual(store._window_owners[:store._window_count].tolist(), [1, 2, 1, 1])
+        # Messages 1+2, 3+4 and the tail window 4+5
+        self.assertEqual(np.flatnonzero(windows[0]).tolist(), [0, 1])
+        self.assertEqual(np.flatnonzero(windows[2]).tolist(), [2, 3])
+        self.assertEqual(np.flatnonzero(windows[3]).tolist(), [3, 4])
+        self.assertAlmostEqual(float(np.linalg.norm(windows[2])), 1.0, places=5)
+
+    def test_tail_window_moves_until_the_next_window_starts(self):
+        store = EmbeddingStore()
+        vectors = np.eye(EMBEDDING_DIMENSIONS, dtype=np.float32)
+
+        rows = [store._add_to_windows(1, vectors[dimension], size=3, stride=2) for dimension in range(5)]
+
+        # Messages 1, 1+2, 1+2+3 share a row, then 2+3+4 and 2..4 + 3..5 share the next
+        self.assertEqual(rows, [0, 0, 0, 1, 1])
+        self.assertEqual(np.flatnonzero(store._windows[1]).tolist(), [2, 3, 4])
+
+    def test_top_k_mean_prefers_sustained_relevance(self):
+        owners = np.array([1, 1, 1, 2, 2, 2])
+        scores = np.array([0.9, 0.1, 0.1, 0.8, 0.8, 0.7], dtype=np.float32)
+
+        best = EmbeddingStore.aggregate_scores(owners, scores, 'max', top_k=2)
+        mean = EmbeddingStore.aggregate_scores(owners, scores, 'top_k_mean', top_k=2)
+
+        self.assertGreater(best[1], best[2])
+        self.assertGreater(mean[2], mean[1])
+        self.assertAlmostEqual(mean[1], 0.5, places=5)
+
+
+def fake_encode(texts, batch_size=32):
+    # One dimension per word, so texts sharing words are similar
+    vectors = np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in text.lower().split():
+            vectors[row, zlib.crc32(word.encode()) % EMBEDDING_DIMENSIONS] += 1
+    return normalize(vectors)
+
+
+@override_settings(CONVERSATION_SEARCH={'INDEX': 'exact', 'INDEX_PATH': None, 'CHUNK_MESSAGES': 2, 'CHUNK_STRIDE': 1})
+class EmbeddingStoreTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('chat.ai.embeddings.EMBEDDINGS_AVAILABLE', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('chat.ai.embeddings.encode_texts', side_effect=fake_encode)
+        self.encode = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = EmbeddingStore()
+
+        self.budget = Conversation.objects.create(title="Budget")
+        self.weather = Conversation.objects.create(title="Weather")
+        for conversation, contents in (
+            (self.budget, ["the budget review", "", "budget numbers are final"]),
+            (self.weather, ["sunny weather today", "rain tomorrow"]),
+        ):
+            for content in contents:
+                Message.objects.create(conversation=conversation, content=content, sender=MessageSender.USER.value)
+
+    def test_add_messages_skips_empty_content(self):
+        added = self.store.add_messages(Message.objects.filter(conversation=self.budget))
+
+        self.assertEqual(added, 2)
+        self.assertEqual(MessageEmbedding.objects.filter(conversation=self.budget).count(), 2)
+
+    def test_refresh_appends_only_new_embeddings(self):
+        self.store.add_messages(Message.objects.filter(conversation=self.budget))
+        self.store.refresh()
+        self.assertEqual(len(self.store), 2)
+
+        self.store.add_messages(Message.objects.filter(conversation=self.weather))
+        self.store.refresh()
+        self.store.refresh()
+        self.assertEqual(len(self.store), 4)
+        # Two messages fill one window of two
+        self.assertEqual(self.store._window_owners[:self.store._window_count].tolist(), [self.budget.id, self.weather.id])
+
+    def test_search_embeds_missing_messages_and_ranks_conversations(self):
+        ranked = self.store.search_conversations("budget review", [self.budget.id, self.weather.id], 2)
+
+        self.assertEqual([conversation_id for conversation_id, _ in ranked], [self.budget.id, self.weather.id])
+        self.assertGreater(ranked[0][1], ranked[1][1])
+        self.assertEqual(MessageEmbedding.objects.count(), 4)
+
+        # Empty messages have no vector but are not read again
+        with mock.patch.object(self.store, 'add_messages', return_value=0) as add_messages:
+            self.store.ensure_indexed([self.budget.id, self.weather.id])
+        add_messages.assert_called_once_with([])
+
+    def test_deleted_messages_and_conversations_leave_the_store(self):
+        self.store.add_messages(Message.objects.all())
+        self.store.refresh()
+
+        weather_id = self.weather.id
+        Message.objects.filter(conversation=self.budget, content="the budget review").delete()
+        self.weather.delete()
+        self.store.reload_conversations([self.budget.id, weather_id])
+
+        self.assertEqual(len(self.store), 1)
+        ranked = self.store.search_conversations("rain budget", [self.budget.id, weather_id], 2)
+        self.assertEqual([conversation_id for conversation_id, _ in ranked], [self.budget.id])
+        # The rows left behind are reclaimed once they are the majority
+        self.store.refresh()
+        self.assertEqual(self.store._window_count, 1)
+
+    def test_embedding_and_reloads_run_off_the_request_path(self):
+        with mock.patch('chat.signals.enqueue_embeddings') as enqueue_embeddings, \
+                mock.patch('chat.signals.enqueue_embedding_reload') as enqueue_reload, \
+                mock.patch('chat.signals.enqueue_chunk_summaries'), \
+                self.captureOnCommitCallbacks(execute=True):
+            message = Message.objects.create(conversation=self.budget, content="more", sender=MessageSender.USER.value)
+            message.delete()
+            weather_id = self.weather.id
+            self.weather.delete()
+
+        self.encode.assert_not_called()
+        enqueue_embeddings.assert_called_once_with([message])
+        self.assertEqual(enqueue_reload.call_args_list, [mock.call([self.budget.id]), mock.call([weather_id])])
+
+    def test_only_probed_windows_are_scored(self):
+        self.store.add_messages(Message.objects.all())
+        self.store.refresh()
+        budget_rows = np.flatnonzero(self.store._window_owners[:self.store._window_count] == self.budget.id)
+        index = mock.Mock(trained=True)
+        index.candidate_rows.return_value = budget_rows[-1:]
+        self.store._index = index
+
+        settings = {'INDEX': 'exact', 'INDEX_PATH': None, 'CHUNK_MESSAGES': 2, 'EXACT_SEARCH_THRESHOLD': 0}
+        with override_settings(CONVERSATION_SEARCH=settings), \
+                mock.patch('chat.ai.embeddings.metrics') as metrics:
+            ranked = self.store.search_conversations("budget review", [self.budget.id, self.weather.id], 2)
+
+        self.assertEqual([conversation_id for conversation_id, _ in ranked], [self.budget.id])
+        metrics.observe.assert_called_once_with('embeddings.search_chunks', 1)
+
+
+@override_settings(CONVERSATION_SEARCH={
+    'INDEX': 'ivf', 'INDEX_PATH': None, 'IVF_NLIST': 64, 'IVF_NPROBE': 4,
+    'EXACT_SEARCH_THRESHOLD': 1000, 'CHUNK_MESSAGES': 4, 'CHUNK_STRIDE': 2,
+})
+class LargeEmbeddingStoreTests(TestCase):
+    def test_query_scores_only_the_probed_windows(self):
+        rng = np.random.default_rng(0)
+        topics = normalize(rng.standard_normal((64, EMBEDDING_DIMENSIONS)).astype(np.float32))
+        store = EmbeddingStore()
+        store.refresh()
+        # 2000 conversations of 40 messages, each about one topic
+        conversation_topics = rng.integers(0, len(topics), 2000)
+        for conversation_id, topic in enumerate(conversation_topics, start=1):
+            noise = rng.standard_normal((40, EMBEDDING_DIMENSIONS)).astype(np.float32)
+            for vector in normalize(topics[topic] + 0.3 * noise):
+                store._add_to_windows(conversation_id, vector, size=4, stride=2)
+        store._train_index_if_needed()
+        self.assertTrue(store._index.trained)
+
+        query = normalize(topics[conversation_topics[0]][None, :])
+        with mock.patch('chat.ai.embeddings.EMBEDDINGS_AVAILABLE', True), \
+                mock.patch('chat.ai.embeddings.encode_texts', return_value=query), \
+                mock.patch.object(store, 'ensure_indexed'), \
+                mock.patch('chat.ai.embeddings.metrics') as metrics:
+            ranked = store.search_conversations("topic", list(range(1, 2001)), 10)
+
+        scored = metrics.observe.call_args.args[1]
+        self.assertLess(scored, store._window_count // 4)
+        self.assertEqual(len(ranked), 10)
+        self.assertTrue(all(conversation_topics[conversation_id - 1] == conversation_topics[0]
+                            for conversation_id, _ in ranked))
+
+
+class IVFIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        topics = normalize(rng.standard_normal((16, 32)).astype(np.float32))
+        self.vectors = normalize(topics[rng.integers(0, 16, 2000)] + 0.1 * rng.standard_normal((2000, 32)).astype(np.float32))
+        self.queries = normalize(topics[rng.integers(0, 16, 20)] + 0.1 * rng.standard_normal((20, 32)).astype(np.float32))
+
+    def test_probed_rows_recall_the_exact_top_k(self):
+        index = IVFIndex(nlist=16, nprobe=4)
+        index.train(self.vectors)
+        index.add(self.vectors[:1500], 0)
+        index.add(self.vectors[1500:], 1500)
+        exact = ExactIndex()
+
+        hits = 0
+        for query in self.queries:
+            expected = set(top_k(self.vectors[exact.candidate_rows(query, len(self.vectors))] @ query, 10).tolist())
+            rows = index.candidate_rows(query, len(self.vectors))
+            self.assertEqual(len(set(rows.tolist())), len(rows))
+            hits += len(expected.intersection(rows[top_k(self.vectors[rows] @ query, 10)].tolist()))
+            # Only a few clusters are scanned
+            self.assertLess(len(rows), len(self.vectors) // 2)
+
+        self.assertGreaterEqual(hits / (10 * len(self.queries)), 0.95)
+
+    def test_every_row_is_in_exactly_one_list(self):
+        index = IVFIndex(nlist=8, nprobe=8)
+        index.train(self.vectors)
+        index.add(self.vectors, 0)
+
+        rows = index.candidate_rows(self.queries[0], len(self.vectors))
+
+        self.assertEqual(sorted(rows.tolist()), list(range(len(self.vectors))))
+
+
+class RebuildEmbeddingIndexTests(TestCase):
+    def test_centroids_are_trained_on_a_sample(self):
+        conversation = Conversation.objects.create(title="Indexed")
+        messages = [
+            Message.objects.create(conversation=conversation, content=f"message {i}", sender=MessageSender.USER.value)
+            for i in range(30)
+        ]
+        MessageEmbedding.objects.bulk_create([
+            MessageEmbedding(message=message, conversation=conversation, vector=vector.tobytes())
+            for message, vector in zip(messages, fake_encode([f"topic{i % 3} word{i}" for i in range(30)]))
+        ])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'index.npz')
+
+        output = io.StringIO()
+        with override_settings(CONVERSATION_SEARCH={'INDEX_PATH': path, 'IVF_NLIST': 3}):
+            call_command('rebuild_embedding_index', sample_size=12, stdout=output)
+
+        self.assertIn("on 12 of 30 vectors", output.getvalue())
+        with np.load(path) as data:
+            self.assertEqual(data['centroids'].shape, (3, EMBEDDING_DIMENSIONS))
+
+
+class BackfillEmbeddingsTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('chat.signals.enqueue_embeddings')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('chat.ai.embeddings.EMBEDDINGS_AVAILABLE', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            'chat.management.commands.backfill_embeddings.encode_texts',
+            side_effect=lambda texts, batch_size: np.ones((len(texts), 4), dtype=np.float32),
+        )
+        self.encode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'backfill.json')
+        self.conversation = Conversation.objects.create(title="Backfill")
+
+    def backfill(self):
+        call_command(
+            'backfill_embeddings', workers=0, batch_size=2, checkpoint=self.checkpoint, stdout=open(os.devnull, 'w')
+        )
+
+    def test_backfill_resumes_from_checkpoint(self):
+        messages = [
+            Message.objects.create(conversation=self.conversation, content=content, sender=MessageSender.USER.value)
+            for content in ("one", "", "two", "three")
+        ]
+        self.backfill()
+
+        self.assertEqual(MessageEmbedding.objects.count(), 3)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['last_message_id'], messages[-1].id)
+
+        Message.objects.create(conversation=self.conversation, content="four", sender=MessageSender.AI.value)
+        self.encode.reset_mock()
+        self.backfill()
+        self.assertEqual(MessageEmbedding.objects.count(), 4)
+        self.encode.assert_called_once_with(["four"], 64)
+
+
+class ConversationQueryFilterTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('chat.ai.text_index._in_process_index', InProcessTextIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.release = Conversation.objects.create(title="Release")
+        self.budget = Conversation.objects.create(title="Budget")
+        self.both = Conversation.objects.create(title="Planning")
+        for conversation, content in (
+            (self.release, "ship the release on friday"),
+            (self.budget, "the budget review is friday"),
+            (self.both, "release budget and hiring"),
+        ):
+            Message.objects.create(conversation=conversation, content=content, sender=MessageSender.USER.value)
+
+    def filtered(self, **data):
+        queryset = ConversationQueryView().get_conversations_queryset(SimpleNamespace(data=data))
+        return set(queryset.values_list('id', flat=True))
+
+    def test_summary_job_stores_normalised_topics(self):
+        self.release.end_conversation()
+        with mock.patch('chat.ai.conversation_analyzer.get_conversation_analyzer') as analyzer:
+            analyzer.return_value.analyze_all.return_value = analysis(
+                "Shipping the release.", topics=["Release  Planning", "release planning", " Deployment"]
+            )
+            run_summary_job(self.release.id)
+
+        self.assertEqual(
+            list(self.release.topics.values_list('name', flat=True)), ["deployment", "release planning"]
+        )
+
+    def test_topics_match_any_tag(self):
+        Conversation.objects.update(analyzed_at=timezone.now())
+        ConversationTopic.objects.create(conversation=self.release, name="release planning")
+        ConversationTopic.objects.create(conversation=self.budget, name="budget")
+
+        self.assertEqual(self.filtered(topics=["Release Planning", "budget"]), {self.release.id, self.budget.id})
+        self.assertEqual(self.filtered(topics="budget"), {self.budget.id})
+
+    def test_conversations_not_analysed_yet_are_kept_by_topic_filters(self):
+        Conversation.objects.filter(pk__in=[self.release.id, self.budget.id]).update(analyzed_at=timezone.now())
+        ConversationTopic.objects.create(conversation=self.budget, name="budget")
+
+        self.assertEqual(self.filtered(topics="budget"), {self.budget.id, self.both.id})
+
+    def test_analysed_conversations_without_a_matching_topic_are_excluded(self):
+        Conversation.objects.filter(pk=self.release.id).update(analyzed_at=timezone.now())
+        ConversationTopic.objects.create(conversation=self.release, name="release planning")
+
+        filtered = self.filtered(topics="budget")
+
+        self.assertNotIn(self.release.id, filtered)
+        self.assertIn(self.budget.id, filtered)
+
+    def test_backfill_analyses_ended_conversations_with_summaries(self):
+        Conversation.objects.filter(pk=self.release.id).update(
+            status=ConversationStatus.ENDED.value, summary="Shipping the release."
+        )
+        Conversation.objects.filter(pk=self.budget.id).update(status=ConversationStatus.ENDED.value)
+        output = io.StringIO()
+        command = 'chat.management.commands.backfill_conversation_analytics'
+        with mock.patch(f'{command}.analyze_conversation', side_effect=lambda conversation_id: analysis("Again.")), \
+                mock.patch(f'{command}.store_conversation_analytics') as store:
+            call_command('backfill_conversation_analytics', stdout=output)
+            store.assert_called_once_with(self.release.id, analysis("Again."))
+
+            store.reset_mock()
+            Conversation.objects.filter(pk=self.release.id).update(analyzed_at=timezone.now())
+            call_command('backfill_conversation_analytics', stdout=output)
+            store.assert_not_called()
+        self.assertIn("Analysed 1 conversations", output.getvalue())
+
+    @override_settings(CONVERSATION_SUMMARY={'CHUNK_MESSAGES': 1})
+    def test_backfill_reports_llm_calls_and_skips_long_conversations(self):
+        Conversation.objects.filter(pk__in=[self.release.id, self.budget.id]).update(
+            status=ConversationStatus.ENDED.value, summary="Summarised."
+        )
+        Message.objects.create(conversation=self.budget, content="second", sender=MessageSender.AI.value)
+        output = io.StringIO()
+        command = 'chat.management.commands.backfill_conversation_analytics'
+        with mock.patch(f'{command}.analyze_conversation', side_effect=lambda conversation_id: analysis("Again.")), \
+                mock.patch(f'{command}.store_conversation_analytics') as store:
+            call_command('backfill_conversation_analytics', max_chunks=1, stdout=output)
+
+        store.assert_called_once_with(self.release.id, analysis("Again."))
+        self.assertIn(f"Skipped conversation {self.budget.id}: 2 windows", output.getvalue())
+        self.assertIn("(0 failed, 1 skipped) with about 2 LLM calls: 1 window summaries", output.getvalue())
+
+    def test_keywords_must_all_match(self):
+        self.assertEqual(self.filtered(keywords=["release"]), {self.release.id, self.both.id})
+        self.assertEqual(self.filtered(keywords=["release", "budget"]), {self.both.id})
+        self.assertEqual(self.filtered(), {self.release.id, self.budget.id, self.both.id})
+
+
+class ConversationAnalyticsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.conversation = Conversation.objects.create(title="Launch")
+        Message.objects.create(conversation=self.conversation, content="we ship friday", sender=MessageSender.USER.value)
+        self.conversation.end_conversation()
+
+    def test_summary_job_stores_summary_and_analytics_from_one_call(self):
+        llm = mock.Mock()
+        llm.invoke.return_value = AIMessage(content=(
+            '{"summary": "Shipping on Friday.", "sentiment": "Positive", "tone": "casual", "confidence": 0.9, '
+            '"topics": ["Release"], "action_items": ["Ship on Friday"]}'
+        ))
+        analyzer = ConversationAnalyzer(llm=llm, cache=LLMResponseCache(LocalLRUCache()))
+        with mock.patch('chat.ai.conversation_analyzer.get_conversation_analyzer', return_value=analyzer):
+            run_summary_job(self.conversation.id)
+
+        llm.invoke.assert_called_once()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, "Shipping on Friday.")
+        self.assertEqual((self.conversation.sentiment, self.conversation.tone), ('positive', 'casual'))
+        self.assertEqual(self.conversation.sentiment_confidence, 0.9)
+        self.assertEqual(self.conversation.action_items, ["Ship on Friday"])
+        self.assertIsNotNone(self.conversation.analyzed_at)
+        self.assertEqual(list(self.conversation.topics.values_list('name', flat=True)), ["release"])
+
+    def test_endpoints_read_stored_analytics_without_the_llm(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            sentiment='positive', tone='casual', sentiment_confidence=0.9,
+            action_items=["Ship on Friday"], analyzed_at=self.conversation.end_timestamp,
+        )
+        ConversationTopic.objects.create(conversation=self.conversation, name="release")
+        pending = Conversation.objects.create(title="Still open")
+
+        with mock.patch('chat.ai.conversation_analyzer.get_conversation_analyzer', side_effect=AssertionError):
+            response = self.client.get(f'/api/conversations/{self.conversation.id}/analytics/')
+            pending_response = self.client.get(f'/api/conversations/{pending.id}/analytics/')
+            overview = self.client.get('/api/analytics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sentiment'], {'sentiment': 'positive', 'tone': 'casual', 'confidence': 0.9})
+        self.assertEqual(response.data['topics'], ["release"])
+        self.assertEqual(response.data['action_items'], ["Ship on Friday"])
+        self.assertIsNone(pending_response.data['sentiment'])
+        self.assertEqual(overview.data['analyzed_conversations'], 1)
+        self.assertEqual(overview.data['sentiments'], {'positive': 1})
+        self.assertEqual(overview.data['top_topics'], [{'name': 'release', 'count': 1}])
+
+
+class ExcerptTests(SimpleTestCase):
+    def test_window_is_cut_around_the_matches(self):
+        content = "filler " * 100 + "the Budget review moves to friday " + "filler " * 100
+        found = ExcerptExtractor("when is the budget review", width=60).excerpt(content)
+
+        self.assertEqual(len(found["content"]), 60)
+        self.assertEqual(
+            [found["content"][start:end] for start, end in found["matches"]], ["Budget", "review"]
+        )
+
+    def test_best_messages_are_kept_across_conversations(self):
+        conversations = [
+            {'id': 1, 'title': "First", 'messages': [{'content': "the budget", 'sender': "USER"}]},
+            {'id': 2, 'title': "Second", 'messages': [
+                {'content': "nothing relevant", 'sender': "USER"},
+                {'content': "budget review on friday", 'sender': "AI"},
+            ]},
+        ]
+
+        excerpts = ExcerptExtractor("budget review").extract(conversations, limit=1)
+
+        self.assertEqual([(e['conversation_id'], e['content']) for e in excerpts], [(2, "budget review on friday")])
+        self.assertEqual(ExcerptExtractor("?!").extract(conversations), [])
+
+    def test_stops_once_the_kept_excerpts_have_every_term(self):
+        conversations = [
+            {'id': 1, 'title': "First", 'messages': [{'content': "budget review today", 'sender': "USER"}]},
+            {'id': 2, 'title': "Second", 'messages': [{'content': "the budget review", 'sender': "USER"}]},
+        ]
+        extractor = ExcerptExtractor("budget review")
+
+        with mock.patch.object(extractor, 'matching_messages', wraps=extractor.matching_messages) as matching:
+            excerpts = extractor.extract(conversations, limit=1)
+
+        self.assertEqual([e['conversation_id'] for e in excerpts], [1])
+        self.assertEqual(matching.call_count, 1)
+
+    def test_only_whole_word_prefixes_match(self):
+        messages = [
+            {'content': "about the pentest", 'sender': "USER"},
+            {'content': "nothing here", 'sender': "USER"},
+            {'content': "we went OUTSIDE", 'sender': "AI"},
+            {'content': "İ changes length when lowercased, out", 'sender': "AI"},
+        ]
+
+        found = [(msg['content'], matches) for msg, matches in ExcerptExtractor("out").matching_messages(messages)]
+
+        self.assertEqual(found, [
+            ("we went OUTSIDE", [(8, 11, "out")]),
+            ("İ changes length when lowercased, out", [(34, 37, "out")]),
+        ])
@@ -1,17 +1,63 @@
-from django.http import JsonResponse
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Q
+from django.db.models import Count, Exists, OuterRef, Q
 from datetime import datetime
 
-from .models import Agent, Chat, ChatMessage, Conversation, Message, MessageSender
+from .messages.message_writer import flush_pending
+from .metrics import metrics
+from .models import Agent, Chat, ChatMessage, Conversation, ConversationTopic, Message, MessageSender
+from .pagination import ConversationCursorPagination, MessageCursorPagination
+from .summaries import normalize_topic
+from .tasks import enqueue_summary
 from .serializers import (
-    AgentSerializer, ChatSerializer, ChatMessageSerializer,
-    ConversationSerializer, ConversationDetailSerializer, MessageSerializer
+    AgentSerializer, ChatSerializer, ChatMessageSerializer, ConversationAnalyticsSerializer,
+    ConversationSerializer, MessageSerializer
 )
-from .ai.conversation_analyzer import ConversationAnalyzer
+from .ai.conversation_analyzer import get_conversation_analyzer
+from .ai.text_index import get_text_index
+
+
+def load_conversations_data(conversations_qs):
+    """
+    Build the analyzer input (conversation dicts with their messages) in two queries:
+    one for the conversations and one streaming all of their messages in order.
+    """
+    conversations = {
+        conv['id']: {
+            'id': conv['id'],
+            'title': conv['title'] or f"Conversation {conv['id']}",
+            'start_timestamp': conv['start_timestamp'].isoformat(),
+            'summary': conv['summary'],
+            'messages': []
+        }
+        for conv in conversations_qs.values('id', 'title', 'start_timestamp', 'summary')
+    }
+    if not conversations:
+        return []
+
+    messages = (
+        Message.objects.filter(conversation_id__in=conversations_qs.values('id'))
+        .order_by('conversation_id', 'timestamp', 'id')
+        .values_list('conversation_id', 'content', 'sender', 'timestamp')
+    )
+    for conversation_id, content, sender, timestamp in messages.iterator(chunk_size=2000):
+        conversation = conversations.get(conversation_id)
+        if conversation is not None:
+            conversation['messages'].append({
+                'content': content,
+                'sender': sender,
+                'timestamp': timestamp.isoformat()
+            })
+
+    return [conv for conv in conversations.values() if conv['messages']]
 
 
 class ChatViewSet(viewsets.ModelViewSet):
@@ -37,27 +83,33 @@ class ChatViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
         chat = self.get_object()
-        messages = ChatMessage.objects.filter(chat=chat).order_by('timestamp')
-        serializer = ChatMessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(ChatMessage.objects.filter(chat=chat), request, view=self)
+        serializer = ChatMessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing conversations.
-    GET /api/conversations/ - List all conversations
-    GET /api/conversations/{id}/ - Get specific conversation with messages
+    GET /api/conversations/ - List conversations, newest first (cursor paginated)
+    GET /api/conversations/{id}/ - Get specific conversation with its latest messages
+    GET /api/conversations/{id}/messages/ - Page through older messages (cursor paginated)
+    GET /api/conversations/{id}/analytics/ - Stored sentiment, topics and action items
     POST /api/conversations/ - Create new conversation
-    POST /api/conversations/{id}/end/ - End conversation and generate summary
+    POST /api/conversations/{id}/end/ - End conversation and queue summary generation
     POST /api/conversations/{id}/send_message/ - Send message in conversation
     """
     queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
+    pagination_class = ConversationCursorPagination
 
-    def get_serializer_class(self):
-        if self.action == 'retrieve':
-            return ConversationDetailSerializer
-        return ConversationSerializer
+    def get_flushed_object(self):
+        # Messages still queued for write-behind are written first, so they are included
+        conversation = self.get_object()
+        if flush_pending(conversation.id):
+            conversation.refresh_from_db()
+        return conversation
 
     def list(self, request, *args, **kwargs):
         """GET: Retrieve all conversations with basic info"""
@@ -68,19 +120,40 @@ class ConversationViewSet(viewsets.ModelViewSet):
         if status_filter:
             queryset = queryset.filter(status=status_filter)
         
-        # Search by title if provided
+        # Search title and summary through the full-text index if provided
         search = request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(Q(title__icontains=search))
+            queryset = get_text_index().search_conversations(queryset, search)
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, *args, **kwargs):
-        """GET: Get a specific conversation with full message history"""
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        """GET: Get a specific conversation with its most recent page of messages"""
+        instance = self.get_flushed_object()
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(instance.messages.all(), request, view=self)
+
+        data = self.get_serializer(instance).data
+        data['messages'] = MessageSerializer(page, many=True).data
+        data['older_messages'] = paginator.get_next_link()
+        return Response(data)
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """GET: Load older messages, following the `older_messages`/`next` cursor"""
+        conversation = self.get_flushed_object()
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(conversation.messages.all(), request, view=self)
+        serializer = MessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """GET: Analytics stored when the conversation ended; never calls the LLM"""
+        conversation = self.get_object()
+        return Response(ConversationAnalyticsSerializer(conversation).data)
 
     def create(self, request, *args, **kwargs):
         """POST: Create new conversation"""
@@ -91,8 +164,8 @@ class ConversationViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def end(self, request, pk=None):
-        """POST: End conversation and trigger AI summary generation"""
-        conversation = self.get_object()
+        """POST: End conversation and queue AI summary generation"""
+        conversation = self.get_flushed_object()
         
         if conversation.status == 'ENDED':
             return Response(
@@ -100,28 +173,13 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get all messages
-        messages = conversation.messages.all()
-        messages_data = [
-            {
-                'content': msg.content,
-                'sender': msg.sender,
-                'timestamp': msg.timestamp.isoformat()
-            }
-            for msg in messages
-        ]
-        
-        # Generate summary using AI
-        analyzer = ConversationAnalyzer()
-        summary = analyzer.generate_summary(messages_data)
-        
-        # End conversation and save summary
+        # End conversation and queue the AI summary; it is generated in the
+        # background and pushed to connected clients when ready
         conversation.end_conversation()
-        conversation.summary = summary
-        conversation.save()
+        enqueue_summary(conversation.id)
         
         serializer = self.get_serializer(conversation)
-        return Response(serializer.data)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -166,10 +224,6 @@ class ConversationQueryView(APIView):
     """
     def post(self, request):
         query = request.data.get('query', '')
-        date_from = request.data.get('date_from', None)
-        date_to = request.data.get('date_to', None)
-        topics = request.data.get('topics', [])
-        keywords = request.data.get('keywords', [])
         max_results = int(request.data.get('max_results', 5))
         
         if not query:
@@ -178,9 +232,27 @@ class ConversationQueryView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Convert to list of dicts with messages - only use Conversation/Message model
+        conversations_data = load_conversations_data(self.get_conversations_queryset(request))
+
+        # Log for debugging
+        print(f"Found {len(conversations_data)} conversations with messages")
+
+        # Query AI about past conversations
+        analyzer = get_conversation_analyzer()
+        result = analyzer.query_past_conversations(query, conversations_data, max_results)
+        
+        return Response(result)
+
+    def get_conversations_queryset(self, request):
+        date_from = request.data.get('date_from', None)
+        date_to = request.data.get('date_to', None)
+
         # Get conversations based on filters - include both ACTIVE and ENDED conversations
         # Only include conversations that have at least one message
-        conversations_qs = Conversation.objects.filter(messages__isnull=False).distinct()
+        conversations_qs = Conversation.objects.filter(
+            Exists(Message.objects.filter(conversation=OuterRef('pk')))
+        )
         
         # Optionally filter by status if provided
         status_filter = request.data.get('status', None)
@@ -200,42 +272,131 @@ class ConversationQueryView(APIView):
                 conversations_qs = conversations_qs.filter(start_timestamp__lte=date_to_obj)
             except:
                 pass
-        
-        # Convert to list of dicts with messages - only use Conversation/Message model
-        conversations_data = []
-        for conv in conversations_qs:
-            messages = conv.messages.all()
-            # Only include conversations that have messages
-            if not messages.exists():
-                continue
-                
-            messages_data = [
-                {
-                    'content': msg.content,
-                    'sender': msg.sender,
-                    'timestamp': msg.timestamp.isoformat()
-                }
-                for msg in messages
-            ]
-            
-            conversations_data.append({
-                'id': conv.id,
-                'title': conv.title or f"Conversation {conv.id}",
-                'start_timestamp': conv.start_timestamp.isoformat(),
-                'summary': conv.summary,
-                'messages': messages_data
-            })
-        
-        # Log for debugging
-        print(f"Found {len(conversations_data)} conversations with messages")
-        for conv in conversations_data:
-            print(f"  Conversation {conv['id']}: {len(conv['messages'])} messages")
-        
-        # Query AI about past conversations
-        analyzer = ConversationAnalyzer()
-        result = analyzer.query_past_conversations(query, conversations_data, max_results)
-        
-        return Response(result)
+
+        # Narrow the candidates in the database before any messages are loaded or scored:
+        # conversations tagged with any of the topics, containing all of the keywords.
+        # Topics are only tagged once a conversation has been analysed after it ended, so
+        # conversations not analysed yet (active ones included) stay in and are left to
+        # the query's scoring; see the backfill_conversation_analytics command.
+        topics = self._as_list(request.data.get('topics'))
+        if topics:
+            conversations_qs = conversations_qs.filter(
+                Q(analyzed_at__isnull=True) | Exists(ConversationTopic.objects.filter(
+                    conversation=OuterRef('pk'), name__in=[normalize_topic(topic) for topic in topics]
+                ))
+            )
+
+        keywords = self._as_list(request.data.get('keywords'))
+        if keywords:
+            conversations_qs = get_text_index().filter_by_keywords(conversations_qs, keywords)
+
+        return conversations_qs
+
+    @staticmethod
+    def _as_list(value):
+        # Lists, or comma-separated strings
+        if isinstance(value, str):
+            value = value.split(',')
+        return [str(item).strip() for item in value or [] if str(item).strip()]
+
+
+class ConversationQueryStreamView(ConversationQueryView):
+    """
+    POST: Query AI about past conversations, streamed as Server-Sent Events.
+
+    Sends a `context` event with the related conversations and excerpts once retrieval
+    is done, `token` events with pieces of the answer as they are generated, and a final
+    `done` event with the complete answer (or `error` if generation fails).
+    """
+    def post(self, request):
+        query = request.data.get('query', '')
+        max_results = int(request.data.get('max_results', 5))
+
+        if not query:
+            return Response(
+                {"error": "Query is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        conversations_data = load_conversations_data(self.get_conversations_queryset(request))
+        events = get_conversation_analyzer().stream_query_past_conversations(query, conversations_data, max_results)
+        return sse_response(request, events)
+
+
+def _sse_messages(events):
+    started = time.perf_counter()
+    try:
+        for index, (event, data) in enumerate(events):
+            if index == 0:
+                metrics.observe('query_stream.first_event', time.perf_counter() - started)
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    except Exception as e:
+        print(f"Error streaming conversation query: {e}")
+        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    metrics.observe('query_stream.total', time.perf_counter() - started)
+
+
+async def _iterate_in_thread(iterator):
+    """Drive a blocking iterator from async code, one item per sync_to_async call."""
+    done = object()
+    while True:
+        item = await sync_to_async(next)(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def sse_response(request, events):
+    """
+    StreamingHttpResponse of (event, data) pairs as Server-Sent Events.
+
+    Under ASGI Django buffers synchronous iterators completely, so there the events are
+    produced in a worker thread and handed over through an async iterator.
+    """
+    messages = _sse_messages(events)
+    if isinstance(request._request, ASGIRequest):
+        messages = _iterate_in_thread(messages)
+    response = StreamingHttpResponse(messages, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class AnalyticsOverviewView(APIView):
+    """
+    GET: Sentiment counts and the most common topics over analyzed conversations,
+    aggregated in the database from the stored analytics
+    """
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('topics', 20)), 1), 100)
+        except ValueError:
+            return Response(
+                {"error": "topics must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        analyzed = Conversation.objects.filter(analyzed_at__isnull=False)
+        sentiments = analyzed.values('sentiment').annotate(count=Count('id')).order_by('-count', 'sentiment')
+        topics = (
+            ConversationTopic.objects.values('name')
+            .annotate(count=Count('conversation_id'))
+            .order_by('-count', 'name')[:limit]
+        )
+        return Response({
+            "analyzed_conversations": analyzed.count(),
+            "sentiments": {row['sentiment']: row['count'] for row in sentiments},
+            "top_topics": list(topics),
+        })
+
+
+class MetricsView(APIView):
+    """
+    GET: Metrics of the worker process that serves the request
+    """
+    def get(self, request):
+        return Response(metrics.snapshot())
 
 
 class AgentViewSet(viewsets.ModelViewSet):
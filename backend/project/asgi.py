@@ -3,6 +3,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import chat.websocket_urls
+from chat.tasks import start_in_process_queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
@@ -14,3 +15,6 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+# Summary jobs interrupted by the previous shutdown are picked up again (see chat.tasks)
+start_in_process_queue()
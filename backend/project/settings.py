@@ -156,5 +156,119 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Semantic search over past conversations (see chat/ai/embeddings.py)
+CONVERSATION_SEARCH = {
+    # 'ivf' for the approximate inverted-file index, 'exact' for brute force only
+    'INDEX': 'ivf',
+    # Number of k-means clusters; 0 uses sqrt(number of vectors)
+    'IVF_NLIST': 0,
+    # Clusters scanned per query: higher improves recall at the cost of latency
+    'IVF_NPROBE': 8,
+    # Candidate sets up to this many vectors are always searched exactly
+    'EXACT_SEARCH_THRESHOLD': 20000,
+    # Centroids written by `manage.py rebuild_embedding_index`
+    'INDEX_PATH': BASE_DIR / 'var' / 'embedding_index.npz',
+    # Conversations are ranked by windows of this many consecutive messages, starting
+    # every CHUNK_STRIDE messages
+    'CHUNK_MESSAGES': 4,
+    'CHUNK_STRIDE': 2,
+    # 'max' scores a conversation by its best window, 'top_k_mean' by its CHUNK_TOP_K best
+    'CHUNK_AGGREGATE': 'top_k_mean',
+    'CHUNK_TOP_K': 3,
+}
+
+# Build the shared ConversationAnalyzer and load the embedding model when the app starts
+# instead of on the first request. Off by default so management commands stay fast.
+CONVERSATION_ANALYZER_WARMUP = os.environ.get('CONVERSATION_ANALYZER_WARMUP', '') == '1'
+
+# Pre-built chat agents reused across WebSocket connections (see chat/agents/agent_pool.py)
+AGENT_POOL = {
+    # Idle agents kept per tool set; connections beyond this build and discard their own
+    'MAX_IDLE': 8,
+    # Agents built in the background when the process starts
+    'WARM_UP': int(os.environ.get('AGENT_POOL_WARM_UP', '0')),
+}
+
+# Agent tokens streamed to the WebSocket as 'debug' frames (see chat/agents/callbacks.py)
+TOKEN_STREAMING = {
+    # Batch tokens into one frame per interval instead of one frame per token
+    'COALESCE': True,
+    'FLUSH_INTERVAL_MS': 50,
+    # Send early once this many characters are waiting
+    'MAX_FRAME_CHARS': 512,
+}
+
+# Chat history sent to the agent with each turn (see chat/agents/memory.py)
+AGENT_MEMORY = {
+    # 'window' loads only the latest messages; 'full' loads the whole conversation
+    'MODE': 'window',
+    'MAX_MESSAGES': 40,
+    # Estimated tokens; older messages in the window are dropped beyond this
+    'MAX_TOKENS': 3000,
+    # Send the conversation summary ahead of the window when older messages exist
+    'INCLUDE_SUMMARY': True,
+}
+
+# Recent messages per conversation kept in memory for agent memory and reconnects
+# (see chat/messages/history_cache.py)
+HISTORY_CACHE = {
+    'ENABLED': True,
+    # 'auto' uses 'redis' when the channel layer runs on Redis and no cache otherwise;
+    # 'local' is per process and only safe with a single worker process
+    'BACKEND': os.environ.get('HISTORY_CACHE_BACKEND', 'auto'),
+    'REDIS_URL': os.environ.get('HISTORY_CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    'MAX_MESSAGES_PER_CONVERSATION': 100,
+    # Local tier bounds; the Redis tier relies on IDLE_SECONDS expiry and maxmemory
+    'MAX_CONVERSATIONS': 1000,
+    'MAX_MESSAGES': 50000,
+    'IDLE_SECONDS': 1800,
+}
+
+# Chat messages from the WebSocket are queued and inserted in batches by a background
+# thread (see chat/messages/message_writer.py)
+MESSAGE_WRITE_BEHIND = {
+    # False inserts each message before the turn continues
+    'ENABLED': True,
+    'FLUSH_INTERVAL_MS': 100,
+    # Flush early once this many messages are queued; also the largest insert
+    'MAX_BATCH': 200,
+    # Oldest queued messages are dropped beyond this while the database is unavailable
+    'MAX_PENDING': 10000,
+}
+
+# Background summary jobs (see chat/tasks.py)
+SUMMARY_QUEUE = {
+    # Run jobs in a thread pool inside the web process. Set to False when a separate
+    # `manage.py run_summary_worker` process drains the queue instead.
+    'IN_PROCESS': True,
+    'WORKERS': 2,
+    # RUNNING jobs not finished after this long are re-queued by the worker command, or
+    # when a server process starts with IN_PROCESS
+    'STALE_AFTER_SECONDS': 600,
+}
+
+# Rolling summaries (see chat/summaries.py): messages are summarised in windows of this
+# many messages as they arrive, and the conversation summary is built from the windows
+CONVERSATION_SUMMARY = {
+    'CHUNK_MESSAGES': 50,
+}
+
+# Questions about past conversations (see chat/ai/context_packer.py)
+CONVERSATION_QUERY = {
+    # Estimated tokens of conversation context sent with each question
+    'TOKEN_BUDGET': 6000,
+}
+
+# Cache of LLM responses in front of ConversationAnalyzer (see chat/ai/llm_cache.py)
+LLM_CACHE = {
+    'ENABLED': True,
+    # 'local' keeps an LRU per process; 'redis' shares entries between workers
+    'BACKEND': os.environ.get('LLM_CACHE_BACKEND', 'local'),
+    'REDIS_URL': os.environ.get('LLM_CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    'TTL_SECONDS': 24 * 3600,
+    # Local tier only; size the Redis tier through its maxmemory policy
+    'MAX_ENTRIES': 1000,
+}
+
 # Access the OPENAI_API_KEY environment variable
 openai_api_key = os.environ.get('OPENAI_API_KEY')
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+# Summary jobs interrupted by the previous shutdown are picked up again (see chat.tasks)
+from chat.tasks import start_in_process_queue  # noqa: E402
+
+start_in_process_queue()
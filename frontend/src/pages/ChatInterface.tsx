@@ -7,12 +7,21 @@ import { ChatInput } from "../components/chat/ChatInput";
 export const ChatInterface: React.FC = () => {
   const [currentConversationId, setCurrentConversationId] = useState<number | null>(null);
   const [messages, setMessages] = useState<Message[]>([]);
+  // Only the latest page of a resumed conversation is loaded; this cursor pages back from it
+  const [olderMessages, setOlderMessages] = useState<string | null>(null);
   const webSocket = useRef<ReconnectingWebSocket | null>(null);
   const [loading, setLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
+  // Set while older messages are prepended, so the view stays where the user scrolled to
+  const prependingRef = useRef(false);
+
   // Scroll to bottom when messages change
   useEffect(() => {
+    if (prependingRef.current) {
+      prependingRef.current = false;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
@@ -32,6 +41,8 @@ export const ChatInterface: React.FC = () => {
           
           if (data.type === "debug") {
             // Debug message - ignore for now
+          } else if (data.type === "summary") {
+            // Summary of an ended conversation, shown on its conversation page rather than as a reply
           } else {
             // Entire message received
             setLoading(false);
@@ -68,12 +79,31 @@ export const ChatInterface: React.FC = () => {
           content: msg.content
         }));
         setMessages(formattedMessages);
+        setOlderMessages(data.older_messages || null);
       })
       .catch(error => {
         console.error('Error fetching messages:', error);
       });
   };
 
+  const loadOlderMessages = () => {
+    if (!olderMessages) return;
+    fetch(olderMessages)
+      .then(response => response.json())
+      .then(data => {
+        const formattedMessages: Message[] = data.results.map((msg: any) => ({
+          sender: msg.sender,
+          content: msg.content
+        }));
+        prependingRef.current = true;
+        setMessages(prevMessages => [...formattedMessages, ...prevMessages]);
+        setOlderMessages(data.next);
+      })
+      .catch(error => {
+        console.error('Error fetching older messages:', error);
+      });
+  };
+
   const onNewUserMessage = (conversationId: number | null, message: Message) => {
     if (!conversationId) {
       // Create new conversation
@@ -116,10 +146,11 @@ export const ChatInterface: React.FC = () => {
         headers: {'Content-Type': 'application/json'}
       })
         .then(response => response.json())
-        .then(data => {
-          alert('Conversation ended. Summary: ' + (data.summary || 'No summary generated'));
+        .then(() => {
+          alert('Conversation ended. The summary is being generated and will appear on the conversation page.');
           setCurrentConversationId(null);
           setMessages([]);
+          setOlderMessages(null);
         })
         .catch(error => {
           console.error('Error ending conversation:', error);
@@ -130,6 +161,7 @@ export const ChatInterface: React.FC = () => {
   const handleNewConversation = () => {
     setCurrentConversationId(null);
     setMessages([]);
+    setOlderMessages(null);
   };
 
   return (
@@ -163,6 +195,16 @@ export const ChatInterface: React.FC = () => {
       {/* Chat Area */}
       <div className="flex-1 overflow-hidden bg-gradient-to-b from-neutral-50/50 to-white">
         <div className="h-full overflow-y-auto">
+          {olderMessages && (
+            <div className="flex justify-center pt-6">
+              <button
+                onClick={loadOlderMessages}
+                className="px-4 py-2 text-sm text-primary-600 hover:text-primary-700 font-medium border border-primary-200 rounded-xl transition-colors"
+              >
+                Load older messages
+              </button>
+            </div>
+          )}
           <ChatBox messages={messages} isLoading={loading} />
           <div ref={messagesEndRef} />
         </div>
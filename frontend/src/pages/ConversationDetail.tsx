@@ -1,4 +1,8 @@
 import React, { useEffect, useState } from 'react';
+
+// Summary jobs still in progress; the page polls until the summary is stored
+const SUMMARY_IN_PROGRESS = ['PENDING', 'RUNNING'];
+const SUMMARY_POLL_INTERVAL_MS = 3000;
 import { useParams, useNavigate } from 'react-router-dom';
 
 interface Message {
@@ -15,7 +19,10 @@ interface Conversation {
   start_timestamp: string;
   end_timestamp: string | null;
   summary: string | null;
+  summary_status: string;
   messages: Message[];
+  older_messages: string | null;
+  message_count: number;
   duration: number;
 }
 
@@ -31,6 +38,27 @@ export const ConversationDetail: React.FC = () => {
     }
   }, [id]);
 
+  // Poll while the background summary job runs, then show the stored summary
+  const summaryInProgress = !!conversation && SUMMARY_IN_PROGRESS.includes(conversation.summary_status);
+  useEffect(() => {
+    if (!id || !summaryInProgress) return;
+    const timer = setInterval(() => {
+      fetch(`http://localhost:8000/api/conversations/${id}/?page_size=1`)
+        .then(response => response.json())
+        .then(data => {
+          setConversation(prev => prev && {
+            ...prev,
+            summary: data.summary,
+            summary_status: data.summary_status,
+          });
+        })
+        .catch(error => {
+          console.error('Error polling summary status:', error);
+        });
+    }, SUMMARY_POLL_INTERVAL_MS);
+    return () => clearInterval(timer);
+  }, [id, summaryInProgress]);
+
   const fetchConversation = (conversationId: number) => {
     setLoading(true);
     fetch(`http://localhost:8000/api/conversations/${conversationId}/`)
@@ -45,6 +73,22 @@ export const ConversationDetail: React.FC = () => {
       });
   };
 
+  const loadOlderMessages = () => {
+    if (!conversation?.older_messages) return;
+    fetch(conversation.older_messages)
+      .then(response => response.json())
+      .then(data => {
+        setConversation(prev => prev && {
+          ...prev,
+          messages: [...data.results, ...prev.messages],
+          older_messages: data.next,
+        });
+      })
+      .catch(error => {
+        console.error('Error fetching older messages:', error);
+      });
+  };
+
   const formatDate = (dateString: string) => {
     const date = new Date(dateString);
     return date.toLocaleDateString() + ' ' + date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
@@ -137,7 +181,7 @@ export const ConversationDetail: React.FC = () => {
                     <svg className="w-4 h-4" fill="none" stroke="currentColor" viewBox="0 0 24 24">
                       <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M8 12h.01M12 12h.01M16 12h.01M21 12c0 4.418-4.03 8-9 8a9.863 9.863 0 01-4.255-.949L3 20l1.395-3.72C3.512 15.042 3 13.574 3 12c0-4.418 4.03-8 9-8s9 3.582 9 8z" />
                     </svg>
-                    <span>{conversation.messages.length} messages</span>
+                    <span>{conversation.message_count} messages</span>
                   </div>
                 </div>
               </div>
@@ -170,6 +214,18 @@ export const ConversationDetail: React.FC = () => {
         </div>
       )}
 
+      {summaryInProgress && (
+        <div className="glass rounded-2xl shadow-medium border border-primary-200/50 p-6 mb-8 flex items-center gap-3 text-neutral-600">
+          <div className="inline-block animate-spin rounded-full h-5 w-5 border-2 border-primary-200 border-t-primary-600"></div>
+          <span>The summary is being generated...</span>
+        </div>
+      )}
+      {conversation.summary_status === 'FAILED' && !conversation.summary && (
+        <div className="glass rounded-2xl shadow-medium border border-red-200/50 p-6 mb-8 text-neutral-600">
+          The summary could not be generated.
+        </div>
+      )}
+
       {/* Messages */}
       <div className="glass rounded-2xl shadow-medium border border-neutral-200/50 p-8">
         <div className="flex items-center gap-3 mb-6">
@@ -180,6 +236,16 @@ export const ConversationDetail: React.FC = () => {
           </div>
           <h2 className="text-2xl font-bold text-neutral-800">Messages</h2>
         </div>
+        {conversation.older_messages && (
+          <div className="flex justify-center mb-6">
+            <button
+              onClick={loadOlderMessages}
+              className="px-4 py-2 text-sm text-primary-600 hover:text-primary-700 font-medium border border-primary-200 rounded-xl transition-colors"
+            >
+              Load older messages
+            </button>
+          </div>
+        )}
         <div className="space-y-4">
           {conversation.messages.map((message, index) => (
             <div
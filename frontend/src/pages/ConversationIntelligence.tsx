@@ -6,6 +6,8 @@ interface QueryResult {
     conversation_id: number;
     conversation_title: string;
     content: string;
+    // [start, end) offsets of the query terms within content
+    matches?: Array<[number, number]>;
     sender: string;
     timestamp: string;
   }>;
@@ -31,7 +33,7 @@ export const ConversationIntelligence: React.FC = () => {
     setResult(null);
 
     try {
-      const response = await fetch('http://localhost:8000/api/conversations/query/', {
+      const response = await fetch('http://localhost:8000/api/conversations/query/stream/', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -42,12 +44,39 @@ export const ConversationIntelligence: React.FC = () => {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to query conversations');
       }
 
-      const data = await response.json();
-      setResult(data);
+      // Server-Sent Events: related conversations first, then the answer as it is generated
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop() || '';
+        for (const block of blocks) {
+          const eventLine = block.split('\n').find((line) => line.startsWith('event: '));
+          const dataLine = block.split('\n').find((line) => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          const event = eventLine.slice('event: '.length);
+          const data = JSON.parse(dataLine.slice('data: '.length));
+
+          if (event === 'context') {
+            setResult({ answer: '', ...data });
+            setLoading(false);
+          } else if (event === 'token') {
+            setResult((prev) => (prev ? { ...prev, answer: prev.answer + data.text } : prev));
+          } else if (event === 'done') {
+            setResult((prev) => (prev ? { ...prev, answer: data.answer } : prev));
+          } else if (event === 'error') {
+            throw new Error(data.error);
+          }
+        }
+      }
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An error occurred');
     } finally {
@@ -60,6 +89,18 @@ export const ConversationIntelligence: React.FC = () => {
     return date.toLocaleDateString() + ' ' + date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
   };
 
+  const highlightMatches = (content: string, matches: Array<[number, number]> = []) => {
+    const parts: React.ReactNode[] = [];
+    let position = 0;
+    matches.forEach(([start, end], index) => {
+      parts.push(content.slice(position, start));
+      parts.push(<mark key={index} className="bg-accent-100 rounded px-0.5">{content.slice(start, end)}</mark>);
+      position = end;
+    });
+    parts.push(content.slice(position));
+    return parts;
+  };
+
   return (
     <div className="min-h-screen max-w-7xl mx-auto px-6 py-8">
       {/* Header */}
@@ -178,7 +219,7 @@ export const ConversationIntelligence: React.FC = () => {
                         {formatDate(excerpt.timestamp)}
                       </span>
                     </div>
-                    <p className="text-neutral-700 mb-2 leading-relaxed">{excerpt.content}</p>
+                    <p className="text-neutral-700 mb-2 leading-relaxed">{highlightMatches(excerpt.content, excerpt.matches)}</p>
                     <span className="text-xs text-neutral-500 font-medium inline-flex items-center gap-1">
                       <svg className="w-3 h-3" fill="none" stroke="currentColor" viewBox="0 0 24 24">
                         <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z" />
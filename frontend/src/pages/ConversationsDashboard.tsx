@@ -14,6 +14,9 @@ interface Conversation {
 
 export const ConversationsDashboard: React.FC = () => {
   const [conversations, setConversations] = useState<Conversation[]>([]);
+  // Cursor URL of the next page of older conversations, null on the last page
+  const [nextPage, setNextPage] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchQuery, setSearchQuery] = useState('');
   const [statusFilter, setStatusFilter] = useState<string>('all');
   const [loading, setLoading] = useState(true);
@@ -38,7 +41,8 @@ export const ConversationsDashboard: React.FC = () => {
     fetch(url)
       .then(response => response.json())
       .then(data => {
-        setConversations(data);
+        setConversations(data.results);
+        setNextPage(data.next);
         setLoading(false);
       })
       .catch(error => {
@@ -51,6 +55,22 @@ export const ConversationsDashboard: React.FC = () => {
     fetchConversations();
   }, [fetchConversations]);
 
+  const loadMoreConversations = () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    fetch(nextPage)
+      .then(response => response.json())
+      .then(data => {
+        setConversations(prev => [...prev, ...data.results]);
+        setNextPage(data.next);
+        setLoadingMore(false);
+      })
+      .catch(error => {
+        console.error('Error fetching more conversations:', error);
+        setLoadingMore(false);
+      });
+  };
+
   const formatDate = (dateString: string) => {
     const date = new Date(dateString);
     return date.toLocaleDateString() + ' ' + date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
@@ -189,6 +209,17 @@ export const ConversationsDashboard: React.FC = () => {
                 </div>
               </div>
             ))}
+            {nextPage && (
+              <div className="flex justify-center mt-2">
+                <button
+                  onClick={loadMoreConversations}
+                  disabled={loadingMore}
+                  className="px-4 py-2 text-sm text-primary-600 hover:text-primary-700 font-medium border border-primary-200 rounded-xl transition-colors disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more conversations'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>